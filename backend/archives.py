@@ -0,0 +1,115 @@
+"""
+Zip / tar handling for /predict/batch.
+
+Clinics can upload a whole study folder as one archive; each image member
+becomes one batch item. Member count, per-member size and the total
+decompressed size are capped so a crafted archive cannot exhaust memory;
+sizes are checked against the headers before reading and against the
+bytes actually read, since headers can lie.
+"""
+import io
+import os
+import tarfile
+import zipfile
+import zlib
+
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-compressed-tar",
+}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+IMAGE_CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+}
+
+
+class ArchiveTooLarge(ValueError):
+    """The archive expands to more than max_total_bytes."""
+
+
+def is_archive(filename, content_type) -> bool:
+    name = (filename or "").lower()
+    return content_type in ARCHIVE_CONTENT_TYPES or name.endswith(ARCHIVE_EXTENSIONS)
+
+
+def guess_image_type(filename):
+    """Content type for an archive member, or None if it is not a supported image."""
+    return IMAGE_CONTENT_TYPES.get(os.path.splitext(filename.lower())[1])
+
+
+def expand_archive(filename, contents: bytes, max_members=100, max_member_bytes=20 * 1024 * 1024,
+                   max_total_bytes=None):
+    """
+    Extract image members from a zip or tar archive.
+
+    contents may be bytes or an mmap of the upload. Returns a list of
+    (member_name, content_type, bytes) tuples. Non-image members and
+    directories are skipped; oversized members and corrupt or truncated
+    archives raise ValueError, and more than max_total_bytes of images
+    in total raises ArchiveTooLarge.
+    """
+    try:
+        return _expand(filename, contents, max_members, max_member_bytes, max_total_bytes)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error) as e:
+        raise ValueError(f"Unreadable archive: {e}")
+
+
+def _expand(filename, contents, max_members, max_member_bytes, max_total_bytes):
+    items = []
+    total = 0
+
+    def add(name, content_type, size, open_member):
+        nonlocal total
+        _check_limits(name, size, len(items), max_members, max_member_bytes)
+        _check_total(total + size, max_total_bytes)
+        with open_member() as member_file:
+            # Never trust the header: read at most one byte past the limit
+            data = member_file.read(max_member_bytes + 1)
+        _check_limits(name, len(data), len(items), max_members, max_member_bytes)
+        total += len(data)
+        _check_total(total, max_total_bytes)
+        items.append((name, content_type, data))
+
+    if (filename or "").lower().endswith(".zip") or zipfile.is_zipfile(_as_file(contents)):
+        with zipfile.ZipFile(_as_file(contents)) as archive:
+            for info in archive.infolist():
+                content_type = guess_image_type(info.filename)
+                if info.is_dir() or content_type is None:
+                    continue
+                add(info.filename, content_type, info.file_size, lambda: archive.open(info))
+        return items
+
+    with tarfile.open(fileobj=_as_file(contents), mode="r:*") as archive:
+        for member in archive:
+            content_type = guess_image_type(member.name)
+            if not member.isfile() or content_type is None:
+                continue
+            add(member.name, content_type, member.size, lambda: archive.extractfile(member))
+    return items
+
+
+def _as_file(contents):
+    """File object over raw bytes or an mmap'd upload (rewound, not copied)."""
+    if isinstance(contents, (bytes, bytearray, memoryview)):
+        return io.BytesIO(contents)
+    contents.seek(0)
+    return contents
+
+
+def _check_limits(name, size, count, max_members, max_member_bytes):
+    if count >= max_members:
+        raise ValueError(f"Archive has more than {max_members} images")
+    if size > max_member_bytes:
+        raise ValueError(f"Archive member {name} is larger than {max_member_bytes // (1024 * 1024)}MB")
+
+
+def _check_total(total, max_total_bytes):
+    if max_total_bytes is not None and total > max_total_bytes:
+        raise ArchiveTooLarge(f"Archive images are larger than {max_total_bytes // (1024 * 1024)}MB in total")
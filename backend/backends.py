@@ -0,0 +1,338 @@
+"""
+Pluggable inference backends for DermaVision.
+
+Every engine that can run the classifier implements the same small
+interface, so the rest of the server never asks which one it has:
+
+- load(): read the model file (imports the engine lazily)
+- warm_up(batch): first forward pass(es), before real traffic
+- predict_batch(batch): (N, H, W, 3) float32 -> raw model output
+- predict_with_embeddings(batch): (outputs, embeddings) from one pass
+- memory_bytes(): what the loaded model holds
+- supports_gradients: whether Grad-CAM can run on it
+
+Implementations: Keras (.h5), TFLite (.tflite, interpreter pool) and ONNX
+Runtime (.onnx, exported with convert_model.py --onnx).
+
+select_backend() runs a short self-benchmark on the current host: each
+loaded candidate is timed on the same batch, and the fastest one whose
+malignant probabilities stay within a tolerance of the reference (the
+Keras model, which the other files are converted from) is picked.
+"""
+import os
+import statistics
+import time
+
+import numpy as np
+
+import runtime
+from interpreter_pool import InterpreterPool
+
+
+def keras_weight_bytes(keras_model):
+    """Bytes held by a Keras model's weights."""
+    return int(sum(np.prod(w.shape) * w.dtype.size for w in keras_model.weights))
+
+
+class InferenceBackend:
+    """Base class; subclasses set name, label and extension and implement load / predict_batch."""
+
+    name = None
+    label = None  # shown in responses, e.g. "production (TFLite)"
+    extension = None
+    supports_gradients = False
+
+    def __init__(self, path):
+        self.path = path
+        self.load_ms = None
+        self.runtime = None  # package that runs it, e.g. "tflite_runtime"
+
+    def load(self):
+        start = time.perf_counter()
+        self._load()
+        self.load_ms = (time.perf_counter() - start) * 1000
+        return self
+
+    def _load(self):
+        raise NotImplementedError
+
+    def warm_up(self, batch: np.ndarray):
+        self.predict_batch(batch)
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    @property
+    def has_embeddings(self) -> bool:
+        return False
+
+    def predict_with_embeddings(self, batch: np.ndarray):
+        raise RuntimeError(f"The {self.label} model has no embedding output")
+
+    def memory_bytes(self):
+        return os.path.getsize(self.path)
+
+    def close(self):
+        """Drop the engine's references so a backend that lost the self-benchmark is freed."""
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "runtime": self.runtime,
+            "path": os.path.basename(self.path),
+            "load_ms": round(self.load_ms, 1) if self.load_ms is not None else None,
+            "memory_bytes": self.memory_bytes(),
+            "embeddings": self.has_embeddings,
+            "gradients": self.supports_gradients,
+        }
+
+
+class KerasBackend(InferenceBackend):
+    """
+    Keras H5 model, the reference the other formats are converted from.
+
+    Also builds a second model over the same weights returning
+    [prediction, embedding] for similar-case search.
+    """
+
+    name = "keras"
+    label = "Keras"
+    extension = ".h5"
+    supports_gradients = True
+
+    def __init__(self, path, embedding_layer=None):
+        super().__init__(path)
+        self.embedding_layer = embedding_layer
+        self.keras_model = None
+        self.embedding_model = None
+
+    def _load(self):
+        # TensorFlow/Keras is only imported when a Keras backend is wanted
+        keras = runtime.import_keras()
+        if keras is None:
+            raise RuntimeError("Keras not available")
+        self.runtime = runtime.active_runtime
+        try:
+            self.keras_model = keras.models.load_model(self.path, compile=False)
+            print(f"[OK] H5 Model loaded successfully")
+        except Exception:
+            import keras_compat  # already imported by runtime.import_keras()
+            custom_objs = keras_compat.register_custom_objects()
+            self.keras_model = keras.models.load_model(self.path, compile=False, custom_objects=custom_objs)
+            print(f"[OK] H5 Model loaded with custom objects")
+
+        try:
+            from embeddings import keras_embedding_model
+            self.embedding_model = keras_embedding_model(keras, self.keras_model, self.embedding_layer)
+        except Exception as e:
+            print(f"[WARN] No embedding output for similar-case search: {e}")
+
+    def predict_batch(self, batch):
+        return self.keras_model.predict(batch, verbose=0)
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self.embedding_model is not None
+
+    def predict_with_embeddings(self, batch):
+        if self.embedding_model is None:
+            return super().predict_with_embeddings(batch)
+        outputs, embeddings = self.embedding_model.predict(batch, verbose=0)
+        return outputs, embeddings
+
+    def memory_bytes(self):
+        return keras_weight_bytes(self.keras_model) if self.keras_model is not None else None
+
+    def close(self):
+        self.keras_model = None
+        self.embedding_model = None
+
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite flatbuffer behind an InterpreterPool (one interpreter per concurrent pass)."""
+
+    name = "tflite"
+    label = "TFLite"
+    extension = ".tflite"
+
+    def __init__(self, path, pool_size=1, num_threads=None, max_batch_size=None):
+        super().__init__(path)
+        self.pool_size = pool_size
+        self.num_threads = num_threads
+        self.max_batch_size = max_batch_size
+        self.pool = None
+
+    def _load(self):
+        interpreter_cls = runtime.import_tflite_interpreter()
+        self.runtime = runtime.active_runtime
+        # All interpreters share the mmap'd flatbuffer
+        self.pool = InterpreterPool(
+            interpreter_cls,
+            self.path,
+            size=self.pool_size,
+            num_threads=self.num_threads,
+            max_batch_size=self.max_batch_size,
+        )
+        print(f"[OK] TFLite Model loaded successfully! ({self.pool.size} interpreters)")
+
+    def warm_up(self, batch):
+        # Every interpreter in the pool, not just the first free one
+        self.pool.warm_up(batch)
+
+    def predict_batch(self, batch):
+        return self.pool.predict(batch)
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self.pool is not None and self.pool.has_embeddings
+
+    def predict_with_embeddings(self, batch):
+        if not self.has_embeddings:
+            return super().predict_with_embeddings(batch)
+        return self.pool.predict_with_embeddings(batch)
+
+    def close(self):
+        self.pool = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["pool"] = self.pool.stats() if self.pool is not None else None
+        return stats
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    ONNX Runtime session over a model exported with convert_model.py --onnx.
+
+    InferenceSession.run is thread-safe, so one session serves every
+    inference worker. Like TFLite, a second (wider) output is the embedding.
+    """
+
+    name = "onnx"
+    label = "ONNX Runtime"
+    extension = ".onnx"
+
+    def __init__(self, path, num_threads=None):
+        super().__init__(path)
+        self.num_threads = num_threads
+        self.session = None
+        self.providers = None
+
+    def _load(self):
+        ort = runtime.import_onnxruntime()
+        self.runtime = runtime.active_runtime
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(self.path, options, providers=ort.get_available_providers())
+        self.providers = self.session.get_providers()
+
+        self.input_name = self.session.get_inputs()[0].name
+        outputs = sorted(self.session.get_outputs(), key=lambda output: _last_dim(output.shape))
+        self.output_name = outputs[0].name
+        self.embedding_name = outputs[-1].name if len(outputs) > 1 else None
+        print(f"[OK] ONNX model loaded successfully ({', '.join(self.providers)})")
+
+    def predict_batch(self, batch):
+        return self.session.run([self.output_name], {self.input_name: batch.astype(np.float32, copy=False)})[0]
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self.session is not None and self.embedding_name is not None
+
+    def predict_with_embeddings(self, batch):
+        if not self.has_embeddings:
+            return super().predict_with_embeddings(batch)
+        outputs, embeddings = self.session.run(
+            [self.output_name, self.embedding_name], {self.input_name: batch.astype(np.float32, copy=False)}
+        )
+        return outputs, embeddings
+
+    def close(self):
+        self.session = None
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats["providers"] = self.providers
+        stats["num_threads"] = self.num_threads
+        return stats
+
+
+def _last_dim(shape):
+    """Width of an ONNX output (dynamic dimensions are names or None)."""
+    return shape[-1] if shape and isinstance(shape[-1], int) else 0
+
+
+# ==================== SELF-BENCHMARK ====================
+def benchmark(backend, batch, runs=5):
+    """Outputs on the batch and the median latency (ms) of `runs` timed passes after one warm-up."""
+    outputs = backend.predict_batch(batch)
+    latencies = []
+    for _ in range(max(1, runs)):
+        start = time.perf_counter()
+        backend.predict_batch(batch)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return outputs, statistics.median(latencies)
+
+
+def select_backend(backends, batch, score_fn, runs=5, tolerance=0.02, reference=None):
+    """
+    Pick the fastest loaded backend that agrees with the reference.
+
+    - backends: loaded InferenceBackends
+    - batch: calibration input, the same for every backend
+    - score_fn: raw outputs -> P(malignant) per row
+    - tolerance: largest allowed |P(malignant) - reference| on any row
+    - reference: name of the backend to compare against (default Keras,
+      else none - every candidate is then accepted)
+
+    Returns (selected backend, report dict). Backends that fail during the
+    benchmark are reported and skipped; raises RuntimeError if none is left.
+    """
+    if reference is None and any(backend.name == "keras" for backend in backends):
+        reference = "keras"
+
+    results = {}
+    rows = []
+    for backend in backends:
+        row = {"name": backend.name, "path": os.path.basename(backend.path),
+               "load_ms": round(backend.load_ms, 1) if backend.load_ms is not None else None,
+               "memory_bytes": backend.memory_bytes()}
+        try:
+            outputs, p50_ms = benchmark(backend, batch, runs)
+            results[backend.name] = (backend, score_fn(outputs), p50_ms)
+            row["p50_ms"] = round(p50_ms, 2)
+        except Exception as e:
+            row["error"] = str(e)
+            print(f"[WARN] {backend.label} backend failed the self-benchmark: {e}")
+        rows.append(row)
+
+    if not results:
+        raise RuntimeError("No inference backend completed the self-benchmark")
+    if reference not in results:
+        reference = None
+
+    reference_probs = results[reference][1] if reference else None
+    for row in rows:
+        if row["name"] not in results:
+            continue
+        probs = results[row["name"]][1]
+        if reference_probs is None:
+            row["within_tolerance"] = True
+            continue
+        row["max_prob_delta"] = round(float(np.max(np.abs(probs - reference_probs))), 4)
+        row["decision_agreement"] = round(float(np.mean((probs >= 0.5) == (reference_probs >= 0.5))), 4)
+        row["within_tolerance"] = row["max_prob_delta"] <= tolerance
+
+    eligible = [row for row in rows if row.get("within_tolerance")]
+    best = min(eligible, key=lambda row: row["p50_ms"])
+    selected = results[best["name"]][0]
+    report = {
+        "selected": selected.name,
+        "reference": reference,
+        "tolerance": tolerance,
+        "batch_size": len(batch),
+        "runs": runs,
+        "candidates": rows,
+    }
+    return selected, report
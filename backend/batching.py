@@ -0,0 +1,175 @@
+"""
+Dynamic micro-batching for DermaVision inference.
+
+Requests that arrive within a short window are stacked into a single
+(N, 224, 224, 3) tensor and run through the model in one forward pass.
+Each caller awaits its own future and gets back only its row of the output.
+"""
+import asyncio
+import time
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Collect single-image requests into batches for one model call.
+
+    - max_batch_size: upper bound on images per forward pass
+    - max_wait_ms: how long the first request in a batch waits for company
+    - infer_fn: callable taking an (N, H, W, C) array and the model passed to
+      submit(), returning (N, ...) outputs; called with a third argument True
+      when any image in the batch asked for embeddings, it returns
+      (outputs, embeddings)
+    - executor: where infer_fn runs (defaults to the loop's default executor)
+    - max_concurrent_batches: batches allowed in flight at once (one per model instance)
+    """
+
+    def __init__(self, infer_fn, max_batch_size=8, max_wait_ms=5.0, executor=None, max_concurrent_batches=1):
+        self.infer_fn = infer_fn
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_concurrent_batches = max(1, int(max_concurrent_batches))
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._dispatched = set()
+
+        # Metrics
+        self.batches_run = 0
+        self.items_processed = 0
+        self.max_queue_depth = 0
+        self.batch_size_counts = {}
+        self.total_wait_ms = 0.0
+
+    def _ensure_worker(self):
+        """Start the collector task on the running event loop if needed."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, img_array: np.ndarray, timings=None, model=None, embeddings=False):
+        """
+        Queue one preprocessed image and wait for its model output.
+
+        Accepts either (1, H, W, C) or (H, W, C) and returns the output row
+        for this image (e.g. shape (1,) for sigmoid or (2,) for softmax).
+        An optional StageTimings gets "queue" and "invoke" stages. Images
+        submitted with different models never share a forward pass. With
+        embeddings=True returns (output row, embedding row) from the same pass.
+        """
+        if img_array.ndim == 4:
+            img_array = img_array[0]
+
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((img_array, future, time.perf_counter(), timings, model, embeddings))
+
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+        return await future
+
+    async def _collect(self):
+        """Wait for the first item, then gather more until full or timed out."""
+        items = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Window closed - still take anything already waiting
+                while len(items) < self.max_batch_size and not self._queue.empty():
+                    items.append(self._queue.get_nowait())
+                break
+            try:
+                items.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return items
+
+    async def _run(self):
+        """Collector loop: forms a batch whenever a model slot is free."""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self._slots.acquire()
+            items = await self._collect()
+
+            # Drop requests whose callers have gone away
+            items = [item for item in items if not item[1].cancelled()]
+            if not items:
+                self._slots.release()
+                continue
+
+            task = loop.create_task(self._dispatch(items))
+            self._dispatched.add(task)
+            task.add_done_callback(self._dispatched.discard)
+
+    async def _dispatch(self, items):
+        """Run one batch (one forward pass per model) and hand each caller its row."""
+        try:
+            # Normally a single group; two only while a new model version is swapped in
+            groups = {}
+            for item in items:
+                groups.setdefault(id(item[4]), []).append(item)
+            for group in groups.values():
+                await self._run_group(group)
+        finally:
+            self._slots.release()
+
+    async def _run_group(self, items):
+        loop = asyncio.get_running_loop()
+        batch = np.stack([item[0] for item in items]).astype(np.float32, copy=False)
+        started = time.perf_counter()
+
+        # Embeddings come from the same pass, so one request asking for them is enough
+        with_embeddings = any(item[5] for item in items)
+        try:
+            if with_embeddings:
+                outputs, embeddings = await loop.run_in_executor(self.executor, self.infer_fn, batch, items[0][4], True)
+            else:
+                outputs = await loop.run_in_executor(self.executor, self.infer_fn, batch, items[0][4])
+        except Exception as e:
+            for item in items:
+                if not item[1].done():
+                    item[1].set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        self._record(items, started)
+
+        for i, (_, future, queued, timings, _, wants_embedding) in enumerate(items):
+            if timings is not None:
+                timings.add("queue", (started - queued) * 1000)
+                timings.add("invoke", (finished - started) * 1000)
+            if not future.done():
+                future.set_result((outputs[i], embeddings[i]) if wants_embedding else outputs[i])
+
+    def _record(self, items, started):
+        size = len(items)
+        self.batches_run += 1
+        self.items_processed += size
+        self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+        self.total_wait_ms += sum((started - item[2]) * 1000 for item in items)
+
+    def stats(self) -> dict:
+        """Queue-depth and batch-size metrics for tuning the window."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "batches_in_flight": len(self._dispatched),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+            "batches_run": self.batches_run,
+            "items_processed": self.items_processed,
+            "avg_batch_size": round(self.items_processed / self.batches_run, 2) if self.batches_run else 0.0,
+            "avg_queue_wait_ms": round(self.total_wait_ms / self.items_processed, 2) if self.items_processed else 0.0,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+        }
@@ -0,0 +1,147 @@
+"""
+HTTP load generator for the DermaVision API.
+
+Starts "uvicorn main:app" locally (or targets --url), then posts images to
+/predict at each concurrency level and reports p50/p95/p99 latency and
+requests/sec. The prediction cache is disabled on the local server unless
+--with-cache is given, so repeated images still exercise the model.
+
+Usage:
+    python benchmarks/bench_http.py --concurrency 1,4,16 --duration 15
+    python benchmarks/bench_http.py --url http://localhost:8000 --output http.json
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+import common
+from common import percentiles, synthetic_image, write_report
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, env_overrides, ready_path, timeout):
+    env = dict(os.environ, **env_overrides)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=common.BACKEND_DIR,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("[ERROR] Server exited during startup")
+        try:
+            if requests.get(url + ready_path, timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"[ERROR] Server not ready after {timeout}s")
+
+
+def run_level(url, images, concurrency, duration, endpoint):
+    """Closed-loop load: each worker sends its next request as soon as the last returns."""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(worker_id):
+        session = requests.Session()
+        i = worker_id
+        while time.perf_counter() < stop_at:
+            contents = images[i % len(images)]
+            i += concurrency
+            start = time.perf_counter()
+            try:
+                status = session.post(url + endpoint, files={"file": ("bench.jpg", contents, "image/jpeg")}, timeout=60).status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests_per_sec": round(len(latencies) / elapsed, 2),
+        "status_counts": {str(k): v for k, v in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+        **percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the DermaVision API.")
+    parser.add_argument("--url", help="Target an already running server instead of starting one")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level")
+    parser.add_argument("--images", type=int, default=32, help="Distinct synthetic images to cycle through")
+    parser.add_argument("--image-size", default="1920x1080")
+    parser.add_argument("--endpoint", default="/predict")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the prediction cache enabled")
+    parser.add_argument("--allow-demo", action="store_true", help="Benchmark without a model (demo predictions)")
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.image_size.split("x"))
+    images = [synthetic_image(width, height, "JPEG", seed=i) for i in range(args.images)]
+
+    process = None
+    url = args.url
+    if url is None:
+        # Synthetic noise images are not skin photos; the quality gate would reject them all
+        env = {"QUALITY_GATE": "false"}
+        if not args.with_cache:
+            env["PREDICTION_CACHE_MB"] = "0"
+        if args.allow_demo:
+            env.update({"ALLOW_DEMO_MODE": "true", "MODEL_LOAD_RETRIES": "1"})
+        process, url = start_server(free_port(), env, "/" if args.allow_demo else "/ready", args.startup_timeout)
+
+    try:
+        results = [
+            run_level(url, images, int(level), args.duration, args.endpoint)
+            for level in args.concurrency.split(",")
+        ]
+        server_info = requests.get(url + "/info", timeout=10).json()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    write_report("http", results, args.output, {
+        "endpoint": args.endpoint,
+        "duration_s": args.duration,
+        "image_size": args.image_size,
+        "distinct_images": args.images,
+        "cache": args.with_cache,
+        "backend": (server_info.get("backend") or {}).get("selected"),
+        "backend_mode": (server_info.get("backend") or {}).get("mode"),
+        "model_version": server_info.get("model_version"),
+    })
+
+
+if __name__ == "__main__":
+    main()
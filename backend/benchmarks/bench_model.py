@@ -0,0 +1,67 @@
+"""
+Model-only throughput and latency for the Keras, TFLite and ONNX Runtime backends.
+
+Runs random inputs through each available model at several batch sizes
+(and, for TFLite and ONNX Runtime, several intra-op thread counts), using
+the same InferenceBackend classes as the API's startup self-benchmark.
+
+Usage:
+    python benchmarks/bench_model.py --batch-sizes 1,4,8,16 --threads 1,2,4
+"""
+import argparse
+import os
+
+import numpy as np
+
+import common  # noqa: F401  (sets up sys.path)
+from common import percentiles, time_call, write_report
+
+from backends import KerasBackend, OnnxBackend, TFLiteBackend
+from main import H5_MODEL_PATH, INPUT_SIZE, ONNX_MODEL_PATH, TFLITE_MODEL_PATH
+
+
+def bench(run, batch_sizes, repeats):
+    rows = []
+    for batch_size in batch_sizes:
+        batch = np.random.default_rng(0).random((batch_size, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+        stats = percentiles(time_call(lambda: run(batch), repeats, warmup=2))
+        stats["images_per_sec"] = round(batch_size / (stats["mean_ms"] / 1000), 2)
+        rows.append({"batch_size": batch_size, **stats})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Keras vs TFLite vs ONNX Runtime inference.")
+    parser.add_argument("--batch-sizes", default="1,4,8,16")
+    parser.add_argument("--threads", default="1,2,4", help="TFLite / ONNX Runtime thread counts")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--tflite", default=TFLITE_MODEL_PATH)
+    parser.add_argument("--onnx", default=ONNX_MODEL_PATH)
+    parser.add_argument("--h5", default=H5_MODEL_PATH)
+    parser.add_argument("--skip-keras", action="store_true")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+    thread_counts = [int(t) for t in args.threads.split(",")]
+    results = []
+
+    for backend_cls, path in ((TFLiteBackend, args.tflite), (OnnxBackend, args.onnx)):
+        if not os.path.exists(path):
+            print(f"[WARN] No {backend_cls.label} model at {path}")
+            continue
+        for threads in thread_counts:
+            backend = backend_cls(path, num_threads=threads).load()
+            for row in bench(backend.predict_batch, batch_sizes, args.repeats):
+                results.append({"engine": backend.name, "threads": threads, **row})
+
+    if not args.skip_keras:
+        backend = KerasBackend(args.h5).load()
+        for row in bench(backend.predict_batch, batch_sizes, args.repeats):
+            results.append({"engine": "keras", "threads": None, **row})
+
+    write_report("model", results, args.output, {"repeats": args.repeats, "batch_sizes": batch_sizes})
+
+
+if __name__ == "__main__":
+    main()
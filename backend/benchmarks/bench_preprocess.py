@@ -0,0 +1,53 @@
+"""
+Micro-benchmark of preprocess_image across image sizes and formats.
+
+Compares the configured fast path (JPEG draft + PREPROCESS_RESAMPLE) with
+the original full-decode + LANCZOS pipeline.
+
+Usage:
+    python benchmarks/bench_preprocess.py --repeats 20 --output preprocess.json
+"""
+import argparse
+
+import common  # noqa: F401  (sets up sys.path)
+from common import percentiles, synthetic_image, time_call, write_report
+
+from main import INPUT_SIZE, PREPROCESS_JPEG_DRAFT, PREPROCESS_RESAMPLE, preprocess_image
+from preprocessing import preprocess_image_reference
+
+SIZES = [(640, 480), (1920, 1080), (4032, 3024)]
+FORMATS = ["JPEG", "PNG", "WEBP"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing.")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    results = []
+    for fmt in args.formats.split(","):
+        for width, height in SIZES:
+            contents = synthetic_image(width, height, fmt)
+            for pipeline, fn in (
+                ("fast", lambda: preprocess_image(contents)),
+                ("reference", lambda: preprocess_image_reference(contents, INPUT_SIZE)),
+            ):
+                results.append({
+                    "format": fmt,
+                    "size": f"{width}x{height}",
+                    "bytes": len(contents),
+                    "pipeline": pipeline,
+                    **percentiles(time_call(fn, args.repeats)),
+                })
+
+    write_report("preprocess", results, args.output, {
+        "repeats": args.repeats,
+        "resample": PREPROCESS_RESAMPLE,
+        "jpeg_draft": PREPROCESS_JPEG_DRAFT,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of response serialization and compression.
+
+Encodes generated /predict responses (full and compact) as stdlib JSON,
+orjson and msgpack, then gzip / brotli, and reports encode latency and
+bytes per prediction for a single response and for a /predict/batch body.
+
+Usage:
+    python benchmarks/bench_serialization.py --batch-size 50 --output serialization.json
+"""
+import argparse
+import gzip
+import json
+import random
+
+import numpy as np
+
+import common  # noqa: F401  (sets up sys.path)
+from common import percentiles, time_call, write_report
+
+from main import build_prediction_response
+from responses import DISCLAIMER_REF, brotli, compact_batch_item, compact_prediction, msgpack, orjson
+
+
+def sample_responses(count, seed=0):
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    responses = []
+    for p in rng.uniform(0, 1, count):
+        response = build_prediction_response(np.array([p], dtype=np.float32), "production (TFLite)",
+                                             float(rng.uniform(5, 40)), model_version="0123456789ab")
+        responses.append(response)
+    return responses
+
+
+def batch_body(responses, compact):
+    results = [{"index": i, "filename": f"lesion_{i:04d}.jpg", "result": r} for i, r in enumerate(responses)]
+    body = {"count": len(results), "results": results}
+    if compact:
+        body["results"] = [compact_batch_item(item) for item in results]
+        body["disclaimer"] = DISCLAIMER_REF
+    return body
+
+
+def serializers():
+    found = {"json": lambda c: json.dumps(c, ensure_ascii=False, separators=(",", ":")).encode("utf-8")}
+    if orjson is not None:
+        found["orjson"] = lambda c: orjson.dumps(c)
+    if msgpack is not None:
+        found["msgpack"] = lambda c: msgpack.packb(c, use_bin_type=True)
+    return found
+
+
+def compressors(level):
+    found = {"none": lambda b: b, "gzip": lambda b: gzip.compress(b, compresslevel=level)}
+    if brotli is not None:
+        found["br"] = lambda b: brotli.compress(b, quality=level)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response serialization and compression.")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--level", type=int, default=5, help="gzip / brotli level")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    responses = sample_responses(args.batch_size)
+    payloads = {
+        ("single", "full"): (responses[0], 1),
+        ("single", "compact"): (compact_prediction(responses[0]), 1),
+        ("batch", "full"): (batch_body(responses, compact=False), args.batch_size),
+        ("batch", "compact"): (batch_body(responses, compact=True), args.batch_size),
+    }
+
+    results = []
+    for (shape, form), (content, predictions) in payloads.items():
+        for encoding, serialize in serializers().items():
+            for compression, compress in compressors(args.level).items():
+                body = compress(serialize(content))
+                results.append({
+                    "payload": shape,
+                    "form": form,
+                    "encoding": encoding,
+                    "compression": compression,
+                    "bytes": len(body),
+                    "bytes_per_prediction": round(len(body) / predictions, 1),
+                    **percentiles(time_call(lambda: compress(serialize(content)), args.repeats)),
+                })
+
+    write_report("serialization", results, args.output, {
+        "batch_size": args.batch_size,
+        "repeats": args.repeats,
+        "level": args.level,
+        "orjson": orjson is not None,
+        "msgpack": msgpack is not None,
+        "brotli": brotli is not None,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Compare two benchmark reports (e.g. from two commits).
+
+Rows are matched on their non-metric fields and the relative change of
+each latency / throughput metric is printed.
+
+Usage:
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import json
+
+METRICS = ("mean_ms", "p50_ms", "p95_ms", "p99_ms", "requests_per_sec", "images_per_sec")
+
+
+def row_key(row):
+    return tuple(sorted(
+        (k, json.dumps(v)) for k, v in row.items()
+        if k not in METRICS and not k.endswith("_ms") and k not in ("count", "duration_s", "status_counts")
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two benchmark JSON reports.")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"{before['benchmark']}: {before.get('commit')} -> {after.get('commit')}")
+    baseline = {row_key(row): row for row in before["results"]}
+
+    for row in after["results"]:
+        old = baseline.get(row_key(row))
+        if old is None:
+            continue
+        label = ", ".join(f"{k}={json.loads(v)}" for k, v in row_key(row))
+        changes = []
+        for metric in METRICS:
+            if metric in row and old.get(metric):
+                delta = (row[metric] - old[metric]) / old[metric] * 100
+                changes.append(f"{metric} {old[metric]} -> {row[metric]} ({delta:+.1f}%)")
+        print(f"  {label}: " + "; ".join(changes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Offline builder for the DermaVision similar-case reference index.
+
+Runs reference images through the same preprocessing and model as /predict,
+takes the penultimate-layer embedding of each and writes the memory-mapped
+index that /predict?similar=K searches (see similarity.py). The API picks
+up changes within SIMILAR_REFRESH_SECONDS, without a restart.
+
+Labels come from a CSV (--labels, columns id,label; id is the path relative
+to --images or the file name without extension) or else from the first
+sub-folder, e.g. refs/Malignant/isic_0001.jpg.
+
+Usage:
+    python build_index.py build --images refs/ --dtype int8
+    python build_index.py add --images new_refs/
+    python build_index.py compact --retrain
+    python build_index.py info
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from main import SIMILAR_INDEX_DIR, load_model_file, load_model_lazy, preprocess_image
+from preprocessing import list_image_files
+from similarity import DTYPES, EmbeddingIndex, append_to_index, compact_index, read_items, write_index
+
+
+# ==================== EMBEDDING ====================
+def load_embedding_model(path=None):
+    """The given model file, or the one the API would serve (same backend preference), with its embedding output."""
+    loaded = load_model_file(path) if path else load_model_lazy()
+    if loaded is None:
+        raise SystemExit("[ERROR] No loadable model found")
+    path = loaded.path
+    if not loaded.has_embeddings:
+        hint = " (re-export it with convert_model.py --with-embeddings)" if loaded.format != "keras" else ""
+        raise SystemExit(f"[ERROR] {path} has no embedding output{hint}")
+    print(f"[OK] Embedding model {os.path.basename(path)} (version {loaded.version})")
+    return loaded
+
+
+def read_labels(csv_path):
+    if not csv_path:
+        return {}
+    with open(csv_path, newline="") as f:
+        return {row["id"]: row["label"] for row in csv.DictReader(f)}
+
+
+def reference_items(folder, labels, skip_ids=(), limit=None):
+    """(path, item) for every reference image not already indexed."""
+    for path in list_image_files(folder, limit):
+        ref_id = os.path.relpath(path, folder).replace(os.sep, "/")
+        if ref_id in skip_ids:
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        label = labels.get(ref_id) or labels.get(stem)
+        if label is None and "/" in ref_id:
+            label = ref_id.split("/", 1)[0]
+        yield path, {"id": ref_id, "label": label}
+
+
+def embed_references(loaded, refs, batch_size=32):
+    """Embeddings and items for (path, item) pairs, in batches through the model."""
+    embeddings, items = [], []
+    batch, batch_items = [], []
+
+    def flush():
+        if batch:
+            _, batch_embeddings = loaded.predict_with_embeddings(np.stack(batch))
+            embeddings.append(np.asarray(batch_embeddings, dtype=np.float32).reshape(len(batch), -1))
+            items.extend(batch_items)
+            batch.clear()
+            batch_items.clear()
+            print(f"[INFO] Embedded {len(items)} references")
+
+    for path, item in refs:
+        with open(path, "rb") as f:
+            try:
+                batch.append(preprocess_image(f.read())[0])
+            except ValueError as e:
+                print(f"[WARN] Skipping {path}: {e}")
+                continue
+        batch_items.append(item)
+        if len(batch) == batch_size:
+            flush()
+    flush()
+
+    if not embeddings:
+        return np.empty((0, 0), dtype=np.float32), []
+    return np.concatenate(embeddings), items
+
+
+# ==================== COMMANDS ====================
+def cmd_build(args):
+    loaded = load_embedding_model(args.model)
+    refs = reference_items(args.images, read_labels(args.labels), limit=args.limit)
+    embeddings, items = embed_references(loaded, refs, args.batch_size)
+    if not items:
+        raise SystemExit(f"[ERROR] No usable images found in {args.images}")
+
+    start = time.perf_counter()
+    meta = write_index(args.index, embeddings, items, args.dtype, args.nlist, loaded.version)
+    print(f"[OK] Wrote {meta['count']} references ({meta['dim']}-d {meta['dtype']}, "
+          f"{meta['nlist']} lists) to {args.index} in {time.perf_counter() - start:.1f}s")
+
+
+def cmd_add(args):
+    loaded = load_embedding_model(args.model)
+    known = {item["id"] for item in read_items(args.index)}
+    refs = reference_items(args.images, read_labels(args.labels), skip_ids=known, limit=args.limit)
+    embeddings, items = embed_references(loaded, refs, args.batch_size)
+    if not items:
+        print("[INFO] Nothing new to add")
+        return
+
+    meta = append_to_index(args.index, embeddings, items, loaded.version)
+    print(f"[OK] Added {len(items)} references ({meta['count']} total, "
+          f"{meta['count'] - meta['sorted_count']} waiting for compaction)")
+
+
+def cmd_compact(args):
+    start = time.perf_counter()
+    meta = compact_index(args.index, args.nlist, args.retrain)
+    print(f"[OK] Compacted {meta['count']} references into {meta['nlist']} lists in {time.perf_counter() - start:.1f}s")
+
+
+def cmd_info(args):
+    print(json.dumps(EmbeddingIndex(args.index, refresh_seconds=0).stats(), indent=2))
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Build and update the similar-case reference index.")
+    parser.add_argument("--index", default=SIMILAR_INDEX_DIR, help="Index directory (default SIMILAR_INDEX_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_embedding_args(command):
+        command.add_argument("--images", required=True, help="Folder of reference images (searched recursively)")
+        command.add_argument("--labels", help="CSV with id,label columns")
+        command.add_argument("--model", help="Model file (default: the one the API would serve)")
+        command.add_argument("--batch-size", type=int, default=32)
+        command.add_argument("--limit", type=int, help="Only the first N images")
+
+    build = commands.add_parser("build", help="Embed a reference folder and write a new index")
+    add_embedding_args(build)
+    build.add_argument("--dtype", default="float16", choices=sorted(DTYPES))
+    build.add_argument("--nlist", type=int, help="IVF lists (default about sqrt(N); 0 = flat scan)")
+    build.set_defaults(fn=cmd_build)
+
+    add = commands.add_parser("add", help="Append references not indexed yet (no re-sorting)")
+    add_embedding_args(add)
+    add.set_defaults(fn=cmd_add)
+
+    compact = commands.add_parser("compact", help="Fold appended references into the IVF lists")
+    compact.add_argument("--nlist", type=int, help="New list count (retrains the centroids)")
+    compact.add_argument("--retrain", action="store_true", help="Retrain the centroids on all references")
+    compact.set_defaults(fn=cmd_compact)
+
+    info = commands.add_parser("info", help="Print index statistics")
+    info.set_defaults(fn=cmd_info)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Content-addressed prediction cache.
+
+Keys are a SHA-256 of the raw upload bytes plus the model version, so the
+same photo uploaded again (retry, refresh, second opinion) skips decoding and
+inference. Entries live in an in-memory LRU bounded by a byte budget and a
+TTL, optionally backed by a sqlite file that survives restarts.
+
+The sqlite tier blocks, so callers on an event loop should run get() in a
+worker thread when the cache is persistent; put() only updates memory and
+leaves the sqlite write to a background writer thread.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def hash_bytes(contents: bytes) -> str:
+    """SHA-256 of the upload (hashlib releases the GIL for large buffers)."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+class PredictionCache:
+    """
+    LRU + TTL cache of prediction responses.
+
+    - max_bytes: memory budget for cached entries (JSON-encoded size)
+    - ttl_seconds: how long an entry stays valid
+    - db_path: optional sqlite file used as a persistent second level
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl_seconds=3600, db_path=None):
+        self.max_bytes = int(max_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+        self.db_path = db_path
+
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = None
+        self._db_pid = None
+        self._db_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            db = self._connection()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM predictions WHERE expires_at < ?", (time.time(),))
+            db.commit()
+
+    def _connection(self):
+        """
+        sqlite connection for this process.
+
+        Connections must not cross a fork, so worker processes of a
+        preloaded app reopen their own.
+        """
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._db_pid = os.getpid()
+        return self._db
+
+    @property
+    def persistent(self) -> bool:
+        return bool(self.db_path)
+
+    @staticmethod
+    def make_key(content_hash: str, model_version: str) -> str:
+        return f"{content_hash}:{model_version}"
+
+    def get(self, key):
+        """Return a cached response dict, or None. Blocks on sqlite when persistent."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+                self._remove(key)
+
+        if self.db_path:
+            with self._db_lock:
+                row = self._connection().execute(
+                    "SELECT value, expires_at FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._insert(key, value, row[1], len(row[0]))
+                    self.hits += 1
+                    self.disk_hits += 1
+                return dict(value)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value: dict):
+        """Store a response in memory now; the sqlite copy is written behind on the writer thread."""
+        encoded = json.dumps(value)
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(key, value, expires_at, len(encoded))
+        if self.db_path:
+            self._writer_executor().submit(self._write, key, encoded, expires_at)
+
+    def _writer_executor(self):
+        # Like the connection, the writer thread does not survive a fork
+        if self._writer is None or self._writer_pid != os.getpid():
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-writer")
+            self._writer_pid = os.getpid()
+        return self._writer
+
+    def _write(self, key, encoded, expires_at):
+        try:
+            with self._db_lock:
+                db = self._connection()
+                db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, encoded, expires_at),
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"[WARN] Prediction cache write failed: {e}")
+
+    def flush(self):
+        """Wait for pending sqlite writes (shutdown)."""
+        if self._writer is not None and self._writer_pid == os.getpid():
+            self._writer.shutdown(wait=True)
+            self._writer = None
+
+    def _insert(self, key, value, expires_at, size):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, value, size)
+        self._bytes += size
+
+        # Evict least recently used entries until we are within budget
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": bool(self.db_path),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
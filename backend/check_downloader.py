@@ -0,0 +1,151 @@
+"""
+Self-check for the resumable model downloader.
+
+Serves a random payload from a local http.server that honours Range
+requests and can cut connections mid-body, then runs download_file
+through the cases that matter:
+
+- interrupted download -> resumed with a Range request -> SHA-256 match
+- checksum mismatch -> DownloadError, nothing renamed into place
+- server that ignores Range -> restarts from zero and still verifies
+- complete .part file left over (server answers 416) -> verified, renamed
+
+Exits non-zero if any case fails. No network access needed.
+
+Usage:
+    python check_downloader.py
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from downloader import DownloadError, download_file
+
+PAYLOAD = os.urandom(3 * 1024 * 1024 + 123)
+PAYLOAD_SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class PayloadHandler(BaseHTTPRequestHandler):
+    """GET /file; the server's settings decide whether Range is honoured and when to cut the body."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get("Range"))
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and server.honour_range:
+            start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+
+        body = PAYLOAD[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if server.cuts:
+            # Promise the whole body, send part of it and drop the connection
+            cut = server.cuts.pop(0)
+            self.wfile.write(body[:cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PayloadHandler)
+    server.honour_range = True
+    server.cuts = []
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reset(server, honour_range=True, cuts=()):
+    server.honour_range = honour_range
+    server.cuts = list(cuts)
+    server.requests = []
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# ==================== CASES ====================
+def case_resume(server, url, folder):
+    destination = os.path.join(folder, "resume.bin")
+    reset(server, cuts=[1024 * 1024])
+    download_file(url, destination, sha256=PAYLOAD_SHA256, chunk_size=64 * 1024, max_retries=3)
+    assert read(destination) == PAYLOAD, "resumed file differs from the payload"
+    assert server.requests == [None, f"bytes={1024 * 1024}-"], f"unexpected requests {server.requests}"
+    assert not os.path.exists(destination + ".part"), ".part file left behind"
+
+
+def case_mismatch(server, url, folder):
+    destination = os.path.join(folder, "mismatch.bin")
+    reset(server)
+    try:
+        download_file(url, destination, sha256="0" * 64, chunk_size=64 * 1024, max_retries=0)
+    except DownloadError as e:
+        assert "Checksum mismatch" in str(e), str(e)
+    else:
+        raise AssertionError("checksum mismatch was not reported")
+    assert not os.path.exists(destination), "unverified file was renamed into place"
+    assert not os.path.exists(destination + ".part"), "unverified .part file kept"
+
+
+def case_range_ignored(server, url, folder):
+    destination = os.path.join(folder, "norange.bin")
+    with open(destination + ".part", "wb") as f:
+        f.write(b"stale bytes from another file")
+    reset(server, honour_range=False)
+    download_file(url, destination, sha256=PAYLOAD_SHA256, chunk_size=64 * 1024, max_retries=0)
+    assert read(destination) == PAYLOAD, "restart after an ignored Range request kept stale bytes"
+
+
+def case_already_complete(server, url, folder):
+    destination = os.path.join(folder, "complete.bin")
+    with open(destination + ".part", "wb") as f:
+        f.write(PAYLOAD)
+    reset(server)
+    download_file(url, destination, sha256=PAYLOAD_SHA256, chunk_size=64 * 1024, max_retries=0)
+    assert read(destination) == PAYLOAD, "complete .part file was not verified and renamed"
+    assert server.requests == [f"bytes={len(PAYLOAD)}-"], f"unexpected requests {server.requests}"
+
+
+CASES = (case_resume, case_mismatch, case_range_ignored, case_already_complete)
+
+
+def main():
+    server = start_server()
+    url = f"http://127.0.0.1:{server.server_address[1]}/file"
+    failed = 0
+    with tempfile.TemporaryDirectory() as folder:
+        for case in CASES:
+            try:
+                case(server, url, folder)
+                print(f"[OK] {case.__name__}")
+            except Exception as e:
+                failed += 1
+                print(f"[ERROR] {case.__name__}: {e}")
+    server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Accuracy check for the fast preprocessing path.
+
+Runs every image through the original pipeline (full decode + LANCZOS) and
+the configured fast pipeline (JPEG draft + PREPROCESS_RESAMPLE), then
+compares pixels and, when a model is available, the predicted malignant
+probability. Exits non-zero if any prediction moves by more than the
+tolerance or flips class.
+
+Usage:
+    python check_preprocessing.py path/to/images --tolerance 0.02
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import main
+from main import malignant_probability
+from preprocessing import (
+    RESAMPLING_FILTERS, list_image_files, preprocess_image_fast, preprocess_image_reference,
+)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Compare fast vs reference preprocessing.")
+    parser.add_argument("folder", help="Folder of sample uploads (JPG/PNG/WebP)")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--resample", default=main.PREPROCESS_RESAMPLE, choices=sorted(RESAMPLING_FILTERS))
+    parser.add_argument("--no-draft", action="store_true", help="Disable JPEG draft decoding")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Max allowed |delta P(malignant)|")
+    parser.add_argument("--skip-model", action="store_true", help="Only compare pixels")
+    args = parser.parse_args()
+
+    paths = list_image_files(args.folder, args.limit)
+    if not paths:
+        raise SystemExit(f"[ERROR] No images found in {args.folder}")
+
+    reference, fast = [], []
+    reference_ms, fast_ms = 0.0, 0.0
+    for path in paths:
+        with open(path, "rb") as f:
+            contents = f.read()
+
+        start = time.perf_counter()
+        reference.append(preprocess_image_reference(contents, main.INPUT_SIZE)[0])
+        reference_ms += (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        fast.append(preprocess_image_fast(
+            contents, main.INPUT_SIZE, resample=args.resample, jpeg_draft=not args.no_draft
+        )[0])
+        fast_ms += (time.perf_counter() - start) * 1000
+
+    reference, fast = np.stack(reference), np.stack(fast)
+    pixel_delta = np.abs(reference - fast)
+    print(f"[INFO] {len(paths)} images, resample={args.resample}, draft={not args.no_draft}")
+    print(f"[INFO] Preprocessing: reference {reference_ms / len(paths):.2f}ms, fast {fast_ms / len(paths):.2f}ms per image")
+    print(f"[INFO] Pixel delta: mean {pixel_delta.mean():.4f}, max {pixel_delta.max():.4f}")
+
+    if args.skip_model:
+        return 0
+
+    main.MODEL_LOAD_RETRIES = 1
+    if main.load_model_lazy() is None:
+        print("[WARN] No model available - pixel comparison only")
+        return 0
+
+    reference_probs = malignant_probability(main.run_model_batch(reference))
+    fast_probs = malignant_probability(main.run_model_batch(fast))
+    prob_delta = np.abs(reference_probs - fast_probs)
+    flips = int(np.sum((reference_probs >= 0.5) != (fast_probs >= 0.5)))
+
+    print(f"[INFO] P(malignant) delta: mean {prob_delta.mean():.4f}, max {prob_delta.max():.4f}")
+    print(f"[INFO] Class flips: {flips}/{len(paths)}")
+
+    if prob_delta.max() > args.tolerance or flips:
+        print(f"[ERROR] Fast preprocessing is outside tolerance {args.tolerance}")
+        return 1
+
+    print(f"[OK] Fast preprocessing matches the reference within {args.tolerance}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,78 @@
+"""
+Single-flight request coalescing for DermaVision.
+
+A client retrying a slow upload sends the same image again while the first
+request is still being processed. Requests for the same key that arrive
+while a prediction is in flight wait on that prediction's task instead of
+decoding the image and calling the model again.
+
+This only shares work between requests that overlap in time; finished
+results are the prediction cache's job.
+"""
+import asyncio
+
+
+class SingleFlight:
+    """
+    Share one in-flight coroutine between concurrent callers with the same key.
+
+    - The first caller for a key (the leader) starts the work as a task
+    - Callers arriving before it finishes (followers) await the same task
+    - The key is forgotten as soon as the task finishes, so later callers
+      start fresh work
+    - Exceptions reach every waiter; a waiter being cancelled does not
+      cancel the shared task for the others
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+        # Metrics
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+        self._waiters = {}
+
+    async def run(self, key, fn):
+        """
+        Await fn() once per key across concurrent callers.
+
+        fn is a zero-argument coroutine function. Returns (result, shared),
+        where shared is True for followers that reused another request's work.
+        """
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self._waiters[key] = 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+            del self._waiters[key]
+        # Mark the exception retrieved even if every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> dict:
+        requests = self.leaders + self.coalesced
+        return {
+            "in_flight": self.in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / requests, 4) if requests else 0.0,
+            "max_waiters": self.max_waiters,
+        }
@@ -0,0 +1,242 @@
+"""
+Offline H5 -> TFLite conversion for DermaVision.
+
+Writes float32, float16 and full-int8 TFLite variants of the Keras model and
+reports size, load time, latency and benign/malignant agreement against the
+Keras model for each one. The chosen variant is installed as
+models/skin_cancer_cnn.tflite, which load_model_lazy prefers over the H5.
+--with-embeddings adds the penultimate-layer embedding as a second output,
+for /predict?similar=K and build_index.py. --onnx also exports the model for
+ONNX Runtime as models/skin_cancer_cnn.onnx, which INFERENCE_BACKEND=auto
+prefers over the TFLite and H5 files (see BACKEND_ORDER).
+--onnx needs tf2onnx (pip install -r requirements-tools.txt).
+
+Usage:
+    python convert_model.py --calibration-dir path/to/images
+    python convert_model.py --variants float32,float16 --install float16
+    python convert_model.py --variants float16 --with-embeddings
+    python convert_model.py --variants float16 --onnx
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from embeddings import keras_embedding_model
+from backends import OnnxBackend
+from interpreter_pool import PooledInterpreter
+from keras_compat import load_h5_model
+from main import (
+    EMBEDDING_LAYER, H5_MODEL_PATH, INPUT_SIZE, MODELS_DIR, ONNX_MODEL_PATH, TFLITE_MODEL_PATH,
+    malignant_probability, preprocess_image,
+)
+from preprocessing import list_image_files
+
+VARIANTS = ("float32", "float16", "int8")
+
+
+# ==================== DATA ====================
+def load_image_folder(folder, limit=None) -> np.ndarray:
+    """Preprocess every image in a folder exactly as /predict does."""
+    images = []
+    for path in list_image_files(folder, limit):
+        with open(path, "rb") as f:
+            try:
+                images.append(preprocess_image(f.read())[0])
+            except ValueError as e:
+                print(f"[WARN] Skipping {path}: {e}")
+
+    if not images:
+        raise SystemExit(f"[ERROR] No usable images found in {folder}")
+    return np.stack(images)
+
+
+# ==================== CONVERSION ====================
+def convert(keras_model, variant, calibration=None) -> bytes:
+    """Convert the Keras model to one TFLite variant."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if calibration is None:
+            raise ValueError("int8 conversion needs --calibration-dir")
+
+        def representative_dataset():
+            for image in calibration:
+                yield [image[np.newaxis, ...].astype(np.float32)]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    return converter.convert()
+
+
+# ==================== EVALUATION ====================
+def run_tflite(path, images, repeats):
+    """Load a TFLite file and time single-image inference over the eval set."""
+    start = time.perf_counter()
+    runner = PooledInterpreter(tf.lite.Interpreter(model_path=path))
+    load_ms = (time.perf_counter() - start) * 1000
+
+    outputs, latencies = [], []
+    for _ in range(repeats):
+        outputs = []
+        for image in images:
+            start = time.perf_counter()
+            outputs.append(runner.run(image[np.newaxis, ...])[0])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return load_ms, np.stack(outputs), latencies
+
+
+def convert_onnx(keras_model, path, opset=13):
+    """Export the Keras model for ONNX Runtime (input batch dimension left dynamic)."""
+    import tf2onnx  # only needed for --onnx (requirements-tools.txt)
+
+    signature = [tf.TensorSpec((None, INPUT_SIZE, INPUT_SIZE, 3), tf.float32, name="input")]
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=opset, output_path=path)
+
+
+def run_onnx(path, images, repeats):
+    """Load an ONNX file and time single-image inference over the eval set."""
+    backend = OnnxBackend(path).load()
+
+    outputs, latencies = [], []
+    for _ in range(repeats):
+        outputs = []
+        for image in images:
+            start = time.perf_counter()
+            outputs.append(backend.predict_batch(image[np.newaxis, ...])[0])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return backend.load_ms, np.stack(outputs), latencies
+
+
+def run_keras(h5_path, images, repeats):
+    start = time.perf_counter()
+    keras_model = load_h5_model(h5_path)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    outputs, latencies = [], []
+    for _ in range(repeats):
+        outputs = []
+        for image in images:
+            start = time.perf_counter()
+            outputs.append(keras_model(image[np.newaxis, ...], training=False).numpy()[0])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    return keras_model, load_ms, np.stack(outputs), latencies
+
+
+def summarize(name, path, load_ms, latencies, probs, reference_probs):
+    """One report row; agreement is on the benign/malignant decision at 0.5."""
+    return {
+        "variant": name,
+        "path": path,
+        "size_mb": round(os.path.getsize(path) / (1024 * 1024), 2),
+        "load_time_ms": round(load_ms, 1),
+        "latency_ms_mean": round(statistics.fmean(latencies), 2),
+        "latency_ms_p50": round(statistics.median(latencies), 2),
+        "agreement": round(float(np.mean((probs >= 0.5) == (reference_probs >= 0.5))), 4),
+        "max_prob_delta": round(float(np.max(np.abs(probs - reference_probs))), 4),
+    }
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Convert the DermaVision H5 model to TFLite variants.")
+    parser.add_argument("--h5", default=H5_MODEL_PATH, help="Source Keras H5 model")
+    parser.add_argument("--out-dir", default=MODELS_DIR, help="Where to write the .tflite files")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="Comma-separated: float32,float16,int8")
+    parser.add_argument("--calibration-dir", help="Representative images for int8 calibration")
+    parser.add_argument("--calibration-samples", type=int, default=200)
+    parser.add_argument("--eval-dir", help="Images for the agreement check (defaults to --calibration-dir)")
+    parser.add_argument("--eval-samples", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=1, help="Timing passes over the eval set")
+    parser.add_argument("--with-embeddings", action="store_true",
+                        help="Also export the penultimate-layer embedding (for similar-case search)")
+    parser.add_argument("--embedding-layer", default=EMBEDDING_LAYER or None,
+                        help="Layer to export as the embedding (default: last flat layer before the head)")
+    parser.add_argument("--onnx", action="store_true", help="Also export skin_cancer_cnn.onnx for ONNX Runtime")
+    parser.add_argument("--onnx-opset", type=int, default=13)
+    parser.add_argument("--install", default="float16", help="Variant to copy to skin_cancer_cnn.tflite, or 'none'")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = set(variants) - set(VARIANTS)
+    if unknown:
+        parser.error(f"Unknown variants: {', '.join(sorted(unknown))}")
+    if args.install != "none" and args.install not in variants:
+        parser.error(f"--install {args.install} is not in --variants (use --install none to skip installing)")
+    if "int8" in variants and not args.calibration_dir:
+        parser.error("int8 needs --calibration-dir")
+
+    calibration = None
+    if args.calibration_dir:
+        calibration = load_image_folder(args.calibration_dir, args.calibration_samples)
+        print(f"[INFO] Loaded {len(calibration)} calibration images")
+
+    eval_dir = args.eval_dir or args.calibration_dir
+    if eval_dir:
+        images = load_image_folder(eval_dir, args.eval_samples)
+    else:
+        print("[WARN] No eval images given - agreement is measured on random inputs")
+        images = np.random.default_rng(0).random((16, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+
+    keras_model, keras_load_ms, keras_outputs, keras_latencies = run_keras(args.h5, images, args.repeats)
+    reference = malignant_probability(keras_outputs)
+    report = [summarize("keras", args.h5, keras_load_ms, keras_latencies, reference, reference)]
+
+    # Same weights with [prediction, embedding] outputs; PooledInterpreter tells them apart by width
+    export_model = keras_model
+    if args.with_embeddings:
+        export_model = keras_embedding_model(tf.keras, keras_model, args.embedding_layer)
+        print(f"[INFO] Exporting embedding {export_model.outputs[1].shape} as a second output")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    written = {}
+    for variant in variants:
+        print(f"[INFO] Converting {variant}...")
+        path = os.path.join(args.out_dir, f"skin_cancer_cnn_{variant}.tflite")
+        with open(path, "wb") as f:
+            f.write(convert(export_model, variant, calibration))
+        written[variant] = path
+
+        load_ms, outputs, latencies = run_tflite(path, images, args.repeats)
+        row = summarize(variant, path, load_ms, latencies, malignant_probability(outputs), reference)
+        report.append(row)
+        print(f"[OK] {variant}: {row['size_mb']}MB, {row['latency_ms_p50']}ms p50, agreement {row['agreement']:.2%}")
+
+    if args.onnx:
+        print("[INFO] Exporting ONNX...")
+        path = os.path.join(args.out_dir, os.path.basename(ONNX_MODEL_PATH))
+        convert_onnx(export_model, path, args.onnx_opset)
+        load_ms, outputs, latencies = run_onnx(path, images, args.repeats)
+        row = summarize("onnx", path, load_ms, latencies, malignant_probability(outputs), reference)
+        report.append(row)
+        print(f"[OK] onnx: {row['size_mb']}MB, {row['latency_ms_p50']}ms p50, agreement {row['agreement']:.2%}")
+
+    if args.install != "none":
+        target = os.path.join(args.out_dir, os.path.basename(TFLITE_MODEL_PATH))
+        shutil.copyfile(written[args.install], target)
+        print(f"[OK] Installed {args.install} variant as {target}")
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Streaming, resumable, checksummed model downloader.
+
+Downloads go to "<destination>.part" and are renamed over the destination
+only after the SHA-256 matches, so a half-finished download can never be
+mistaken for a model. Interrupted downloads resume with an HTTP Range
+request instead of starting over.
+
+The expected checksums live in models/manifest.json. When an entry is
+missing, the oid from a Git LFS pointer file at the destination is used.
+
+Usage:
+    python downloader.py                       # fetch everything in the manifest
+    python downloader.py --only skin_cancer_cnn.h5
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import requests
+
+BASE_DIR = os.path.dirname(__file__)
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+MANIFEST_PATH = os.path.join(MODELS_DIR, "manifest.json")
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_PROGRESS_INTERVAL = 5.0
+
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed or fails verification."""
+
+
+# ==================== CHECKSUMS ====================
+def sha256_file(path, chunk_size=DEFAULT_CHUNK_SIZE) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def read_lfs_pointer(path):
+    """Return {"sha256", "size"} from a Git LFS pointer file, or None."""
+    try:
+        if os.path.getsize(path) >= 1024:
+            return None
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            lines = dict(line.strip().split(" ", 1) for line in f if " " in line)
+    except OSError:
+        return None
+
+    oid = lines.get("oid", "")
+    if not oid.startswith("sha256:"):
+        return None
+    return {"sha256": oid.split(":", 1)[1], "size": int(lines.get("size", 0))}
+
+
+def load_manifest(path=MANIFEST_PATH) -> dict:
+    """Manifest format: {"<file name>": {"url": ..., "sha256": ..., "size": ...}}"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def expected_checksum(destination, manifest=None):
+    """SHA-256 for a destination from the manifest, falling back to its LFS pointer."""
+    manifest = load_manifest() if manifest is None else manifest
+    entry = manifest.get(os.path.basename(destination), {})
+    if entry.get("sha256"):
+        return entry["sha256"]
+    pointer = read_lfs_pointer(destination)
+    return pointer["sha256"] if pointer else None
+
+
+# ==================== DOWNLOAD ====================
+def download_file(
+    url,
+    destination,
+    sha256=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    max_retries=5,
+    progress_interval=DEFAULT_PROGRESS_INTERVAL,
+    timeout=60,
+    session=None,
+):
+    """
+    Download url to destination atomically.
+
+    - Resumes "<destination>.part" with a Range request after interruptions
+    - Verifies sha256 (if given) before renaming into place
+    - Logs progress at most every progress_interval seconds
+    """
+    session = session or requests.Session()
+    part_path = destination + ".part"
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+
+    if sha256 and os.path.exists(destination) and read_lfs_pointer(destination) is None:
+        if sha256_file(destination) == sha256:
+            print(f"[OK] {destination} already present and verified")
+            return destination
+
+    attempt = 0
+    while True:
+        try:
+            _fetch(session, url, part_path, chunk_size, progress_interval, timeout)
+            break
+        except (requests.RequestException, OSError) as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise DownloadError(f"Download failed after {max_retries} retries: {e}")
+            delay = min(2 ** attempt, 60)
+            print(f"[WARN] Download interrupted ({e}), resuming in {delay}s ({attempt}/{max_retries})...")
+            time.sleep(delay)
+
+    if sha256:
+        actual = sha256_file(part_path, chunk_size)
+        if actual != sha256:
+            os.remove(part_path)
+            raise DownloadError(f"Checksum mismatch for {url}: expected {sha256}, got {actual}")
+        print(f"[OK] SHA-256 verified")
+
+    os.replace(part_path, destination)
+    print(f"[OK] Model downloaded successfully to {destination}")
+    return destination
+
+
+def _fetch(session, url, part_path, chunk_size, progress_interval, timeout):
+    """One HTTP attempt, appending to part_path from wherever it left off."""
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, stream=True, timeout=timeout, headers=headers) as response:
+        if response.status_code == 416:
+            # Nothing left to fetch - the part file is already complete
+            return
+        response.raise_for_status()
+
+        if offset and response.status_code != 206:
+            print(f"[WARN] Server ignored Range request, restarting download")
+            offset = 0
+
+        total = int(response.headers.get("content-length", 0)) + offset
+        downloaded = offset
+        if offset:
+            print(f"[INFO] Resuming download at {offset / (1024 * 1024):.1f}MB")
+        else:
+            print(f"[INFO] Downloading {url} ({total / (1024 * 1024):.1f}MB)...")
+
+        last_report = time.monotonic()
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                downloaded += len(chunk)
+
+                now = time.monotonic()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    percent = f" ({downloaded / total * 100:.1f}%)" if total else ""
+                    print(f"[INFO] Downloaded {downloaded / (1024 * 1024):.1f}MB / {total / (1024 * 1024):.1f}MB{percent}")
+            f.flush()
+            os.fsync(f.fileno())
+
+        if total and downloaded < total:
+            raise requests.ConnectionError(f"Connection closed at {downloaded} of {total} bytes")
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Download and verify DermaVision model files.")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--only", action="append", help="Only fetch these manifest entries")
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_SIZE / (1024 * 1024))
+    parser.add_argument("--retries", type=int, default=5)
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    if not manifest:
+        print(f"[ERROR] No entries in {args.manifest}")
+        return 1
+
+    failed = 0
+    for name, entry in manifest.items():
+        if args.only and name not in args.only:
+            continue
+        try:
+            download_file(
+                entry["url"],
+                os.path.join(args.models_dir, name),
+                sha256=entry.get("sha256"),
+                chunk_size=int(args.chunk_mb * 1024 * 1024),
+                max_retries=args.retries,
+            )
+        except DownloadError as e:
+            print(f"[ERROR] {name}: {e}")
+            failed += 1
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Penultimate-layer embeddings for DermaVision.
+
+The similar-case search compares the CNN's last hidden representation of a
+photo with those of reference lesions. Instead of a second model call, the
+classifier is rebuilt with two outputs (prediction, embedding) that share
+all weights, so the embedding comes out of the same forward pass.
+
+- Keras: keras_embedding_model wraps the loaded model
+- TFLite: convert_model.py --with-embeddings exports both outputs, and
+  PooledInterpreter picks them apart by shape
+"""
+
+
+def find_embedding_layer(keras_model, layer_name=None):
+    """
+    The layer whose output is used as the embedding.
+
+    Defaults to the last layer before the classifier head with a flat
+    (batch, D) output wider than the model output - typically the global
+    pooling or the last hidden Dense layer.
+    """
+    if layer_name:
+        return keras_model.get_layer(layer_name)
+
+    output_dim = keras_model.output_shape[-1]
+    for layer in reversed(keras_model.layers[:-1]):
+        shape = layer.output_shape
+        if isinstance(shape, tuple) and len(shape) == 2 and shape[-1] and shape[-1] > output_dim:
+            return layer
+    raise ValueError("No flat layer before the classifier head to use as the embedding")
+
+
+def keras_embedding_model(keras, keras_model, layer_name=None):
+    """A model with the same weights returning [prediction, embedding] from one pass."""
+    layer = find_embedding_layer(keras_model, layer_name)
+    return keras.Model(inputs=keras_model.inputs, outputs=[keras_model.output, layer.output])
@@ -0,0 +1,191 @@
+"""
+Shadow and A/B evaluation of a candidate model for DermaVision.
+
+- ab: a share of /predict requests is answered by the candidate instead of
+  the active model (the response's model_version says which one)
+- shadow: every (or a sampled share of) request is also run through the
+  candidate after the response is built, and the two are compared; for
+  latency, both models are timed on the same single-image call on the
+  shadow thread (the response's inference_time_ms includes micro-batch
+  queueing and batch size, so it is not comparable)
+
+Shadow work runs on its own small thread pool with a bounded number of
+pending images. When it is full new shadow work is dropped instead of
+queued, so the candidate never adds latency to user requests.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+EXPERIMENT_MODES = ("off", "shadow", "ab")
+
+
+class ModelExperiment:
+    """
+    Routes or mirrors traffic to a candidate LoadedModel and compares results.
+
+    - mode: "off", "shadow" or "ab"
+    - candidate_percent: share of requests answered by the candidate in ab mode
+    - shadow_percent: share of requests mirrored to the candidate in shadow mode
+    - max_pending: shadow images allowed to wait or run at once
+    - workers: threads running shadow inference
+    - postprocess_fn: turns one candidate output row into a response dict
+    - log_path: optional JSONL file with one line per shadow comparison
+    """
+
+    def __init__(self, mode="off", candidate_percent=10.0, shadow_percent=100.0,
+                 max_pending=16, workers=1, postprocess_fn=None, log_path=None, window=1000):
+        if mode not in EXPERIMENT_MODES:
+            raise ValueError(f"Experiment mode must be one of {', '.join(EXPERIMENT_MODES)}")
+        self.mode = mode
+        self.candidate_percent = float(candidate_percent)
+        self.shadow_percent = float(shadow_percent)
+        self.max_pending = max(1, int(max_pending))
+        self.workers = max(1, int(workers))
+        self.postprocess_fn = postprocess_fn
+        self.log_path = log_path
+
+        self.candidate = None
+        self.candidate_error = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+        # Routing / shadow counters
+        self.routed = {"active": 0, "candidate": 0}
+        self.pending = 0
+        self.dropped = 0
+        self.failed = 0
+
+        # Comparison results (latencies and deltas over a sliding window)
+        self.compared = 0
+        self.agreed = 0
+        self._deltas = deque(maxlen=window)
+        self._latency = {"active": deque(maxlen=window), "candidate": deque(maxlen=window)}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and self.candidate is not None
+
+    def set_candidate(self, loaded):
+        self.candidate = loaded
+        if self.mode == "shadow" and self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="shadow")
+
+    # ---------- A/B routing ----------
+    def route(self, active):
+        """The model that should answer this request (ab mode may pick the candidate)."""
+        if self.mode == "ab" and self.candidate is not None and active is not None:
+            if random.uniform(0, 100) < self.candidate_percent:
+                self.routed["candidate"] += 1
+                return self.candidate
+        self.routed["active"] += 1
+        return active
+
+    # ---------- Shadow ----------
+    def shadow(self, img_array, response: dict, active):
+        """
+        Mirror one preprocessed image to the candidate, without waiting.
+
+        Called from the event loop after the user's response is built;
+        active is the LoadedModel that answered it.
+        """
+        if self.mode != "shadow" or self.candidate is None:
+            return
+        if response.get("model_version") == self.candidate.version:
+            return
+        if random.uniform(0, 100) >= self.shadow_percent:
+            return
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self.pending += 1
+        self._executor.submit(self._run_shadow, active, self.candidate, img_array, response)
+
+    @staticmethod
+    def _timed_predict(loaded, img_array):
+        start = time.perf_counter()
+        output = loaded.predict(img_array)
+        return output, (time.perf_counter() - start) * 1000
+
+    def _run_shadow(self, active, candidate, img_array, response):
+        try:
+            # Both models timed the same way, on the same image
+            _, active_ms = self._timed_predict(active, img_array)
+            output, candidate_ms = self._timed_predict(candidate, img_array)
+            shadow_response = self.postprocess_fn(np.asarray(output)[0])
+            self._compare(response, shadow_response, active_ms, candidate_ms, candidate.version)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"[WARN] Shadow prediction failed: {e}")
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def _compare(self, active, shadow, active_latency_ms, candidate_latency_ms, candidate_version):
+        agree = active["predicted_class"] == shadow["predicted_class"]
+        delta = shadow["probabilities"]["Malignant"] - active["probabilities"]["Malignant"]
+
+        with self._lock:
+            self.compared += 1
+            self.agreed += int(agree)
+            self._deltas.append(abs(delta))
+            self._latency["active"].append(active_latency_ms)
+            self._latency["candidate"].append(candidate_latency_ms)
+
+        if self.log_path:
+            record = {
+                "timestamp": time.time(),
+                "active_version": active.get("model_version"),
+                "candidate_version": candidate_version,
+                "active_class": active["predicted_class"],
+                "candidate_class": shadow["predicted_class"],
+                "agree": agree,
+                "malignant_delta": round(delta, 4),
+                "active_ms": round(active_latency_ms, 2),
+                "candidate_ms": round(candidate_latency_ms, 2),
+            }
+            with self._lock, open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    # ---------- Reporting ----------
+    def stats(self) -> dict:
+        with self._lock:
+            deltas = np.array(self._deltas) if self._deltas else None
+            latency = {role: np.array(values) for role, values in self._latency.items() if values}
+
+        return {
+            "mode": self.mode,
+            "candidate": self.candidate.info() if self.candidate is not None else None,
+            "candidate_error": self.candidate_error,
+            "candidate_percent": self.candidate_percent if self.mode == "ab" else None,
+            "shadow_percent": self.shadow_percent if self.mode == "shadow" else None,
+            "routed": dict(self.routed),
+            "shadow_pending": self.pending,
+            "shadow_dropped": self.dropped,
+            "shadow_failed": self.failed,
+            "compared": self.compared,
+            "agreement_rate": round(self.agreed / self.compared, 4) if self.compared else None,
+            "malignant_delta": {
+                "mean": round(float(deltas.mean()), 4),
+                "max": round(float(deltas.max()), 4),
+            } if deltas is not None else None,
+            "latency_ms": {
+                role: {
+                    "p50": round(float(np.percentile(values, 50)), 2),
+                    "p95": round(float(np.percentile(values, 95)), 2),
+                }
+                for role, values in latency.items()
+            },
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
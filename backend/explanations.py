@@ -0,0 +1,423 @@
+"""
+Grad-CAM explanations for DermaVision, computed off the critical path.
+
+Gradients cost roughly two extra passes through the network, so /predict
+never computes them. With ?explain=true it returns an explanation id, and
+the heatmap is computed on a small dedicated thread pool:
+
+- the id is derived from the image hash and model version, so repeated
+  requests for the same image share one computation and one cached result
+- at most `workers` explanations run at once, on their own threads (never
+  the inference pool), and at most `max_pending` wait; beyond that new
+  requests are refused instead of queued
+- finished heatmaps are kept as small PNG overlays in an LRU with a byte
+  budget and a TTL, and served by GET /explanations/{id}
+- with a db_path, pending/finished/failed explanations are also kept in
+  sqlite, so a GET answered by another worker process (gunicorn pre-fork)
+  finds them too
+
+Only the Keras backend has gradients; TFLite and ONNX models cannot be explained.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Errors kept for GET /explanations/{id} after a failed computation
+MAX_ERRORS = 256
+
+# How often wait() re-reads the shared store for an explanation running in another process
+STORE_POLL_SECONDS = 0.25
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ExplanationStore:
+    """
+    sqlite copy of explanation states, shared by the worker processes.
+
+    Rows are (id, status, png, error, owner_pid, expires_at); a pending row
+    whose owner process has died is treated as missing. Blocking - call it
+    off the event loop. One connection per process.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS explanations ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, png BLOB, error TEXT, "
+                "owner_pid INTEGER, expires_at REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM explanations WHERE expires_at < ?", (time.time(),))
+            self._db = db
+            self._db_pid = os.getpid()
+        return self._db
+
+    def get(self, explanation_id):
+        """(status, png, error), or None if unknown, expired or orphaned."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT status, png, error, owner_pid, expires_at FROM explanations WHERE id = ?",
+                (explanation_id,),
+            ).fetchone()
+        if row is None or row[4] <= time.time():
+            return None
+        status, png, error, owner_pid, _ = row
+        if status == "pending" and not _pid_alive(owner_pid):
+            return None
+        return status, png, error
+
+    def claim(self, explanation_id, expires_at) -> bool:
+        """Record a pending explanation owned by this process; False if another process already has it."""
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT status, owner_pid, expires_at FROM explanations WHERE id = ?", (explanation_id,)
+                ).fetchone()
+                if row is not None and row[2] > now and row[0] != "failed" and (
+                    row[0] == "done" or (row[1] != os.getpid() and _pid_alive(row[1]))
+                ):
+                    db.execute("COMMIT")
+                    return False
+                db.execute(
+                    "INSERT OR REPLACE INTO explanations (id, status, png, error, owner_pid, expires_at) "
+                    "VALUES (?, 'pending', NULL, NULL, ?, ?)",
+                    (explanation_id, os.getpid(), expires_at),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return True
+
+    def finish(self, explanation_id, png, error, expires_at):
+        """Store the PNG (done) or the error (failed) and purge expired rows."""
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT OR REPLACE INTO explanations (id, status, png, error, owner_pid, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (explanation_id, "done" if error is None else "failed", png, error, os.getpid(), expires_at),
+            )
+            db.execute("DELETE FROM explanations WHERE expires_at < ?", (time.time(),))
+
+
+def find_conv_layer(keras_model, layer_name=None):
+    """The last layer with a spatial (batch, H, W, C) output, or the named layer."""
+    if layer_name:
+        return keras_model.get_layer(layer_name)
+    for layer in reversed(keras_model.layers):
+        shape = layer.output_shape
+        if isinstance(shape, tuple) and len(shape) == 4:
+            return layer
+    raise ValueError("No convolutional layer to explain")
+
+
+class GradCam:
+    """Grad-CAM for one Keras model; the gradient model is built once per model version."""
+
+    def __init__(self, keras_model, layer_name=None):
+        import tensorflow as tf  # only reached when a Keras model is loaded
+
+        self.tf = tf
+        layer = find_conv_layer(keras_model, layer_name)
+        self.layer_name = layer.name
+        self.grad_model = tf.keras.Model(keras_model.inputs, [layer.output, keras_model.output])
+
+    def heatmap(self, img_array: np.ndarray) -> np.ndarray:
+        """(h, w) map in [0, 1] of where the predicted class's score comes from."""
+        tf = self.tf
+        with tf.GradientTape() as tape:
+            conv_output, predictions = self.grad_model(img_array, training=False)
+            if predictions.shape[-1] == 1:
+                # Sigmoid: explain whichever class was predicted
+                p_malignant = predictions[:, 0]
+                score = tf.where(p_malignant >= 0.5, p_malignant, 1.0 - p_malignant)
+            else:
+                score = tf.reduce_max(predictions, axis=-1)
+
+        grads = tape.gradient(score, conv_output)
+        channel_weights = tf.reduce_mean(grads, axis=(1, 2))
+        cam = tf.nn.relu(tf.reduce_sum(conv_output * channel_weights[:, None, None, :], axis=-1))[0].numpy()
+        peak = cam.max()
+        return cam / peak if peak > 0 else cam
+
+
+def colorize(heat: np.ndarray) -> np.ndarray:
+    """Jet-style colormap: (H, W) in [0, 1] -> (H, W, 3) in [0, 1]."""
+    x = heat[..., None] * 4.0
+    channels = np.concatenate([x - 3.0, x - 2.0, x - 1.0], axis=-1)
+    return np.clip(1.5 - np.abs(channels), 0.0, 1.0)
+
+
+def overlay_png(img_array: np.ndarray, cam: np.ndarray, alpha=0.5) -> bytes:
+    """Blend the heatmap over the (1, H, W, 3) model input; cold regions keep the original pixels."""
+    image = img_array[0] if img_array.ndim == 4 else img_array
+    height, width = image.shape[:2]
+    heat = Image.fromarray(np.uint8(cam * 255)).resize((width, height), Image.Resampling.BILINEAR)
+    heat = np.asarray(heat, dtype=np.float32) / 255.0
+
+    weight = alpha * heat[..., None]
+    blended = image * (1.0 - weight) + colorize(heat) * weight
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.uint8(np.clip(blended, 0.0, 1.0) * 255)).save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+class ExplanationService:
+    """
+    Asynchronous, cached Grad-CAM overlays.
+
+    - preprocess_fn: raw upload bytes -> (1, H, W, 3) model input
+    - workers: explanations computed at once (dedicated threads)
+    - max_pending: explanations allowed to wait or run before requests are refused
+    - cache_bytes / ttl_seconds: budget and lifetime of finished PNGs
+    - layer_name: conv layer to explain (default: the last one)
+    - alpha: heatmap opacity at its hottest point
+    - db_path: optional sqlite file shared by worker processes
+    """
+
+    def __init__(self, preprocess_fn, workers=1, max_pending=8, cache_bytes=16 * 1024 * 1024,
+                 ttl_seconds=3600, layer_name=None, alpha=0.5, db_path=None):
+        self.preprocess_fn = preprocess_fn
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.cache_bytes = int(cache_bytes)
+        self.ttl_seconds = float(ttl_seconds)
+        self.layer_name = layer_name
+        self.alpha = float(alpha)
+        self.store = ExplanationStore(db_path) if db_path else None
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = {}  # id -> Future
+        self._results = OrderedDict()  # id -> (expires_at, png)
+        self._bytes = 0
+        self._errors = OrderedDict()  # id -> message
+        self._explainers = {}  # model version -> GradCam
+        self._explainer_lock = threading.Lock()
+
+        # Metrics
+        self.requested = 0
+        self.cache_hits = 0
+        self.computed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_compute_ms = 0.0
+
+    @staticmethod
+    def make_id(content_hash: str, model_version: str) -> str:
+        return hashlib.sha256(f"{content_hash}:{model_version}".encode()).hexdigest()[:32]
+
+    def request(self, explanation_id, contents, loaded) -> str:
+        """
+        Start explaining one upload with a Keras LoadedModel, without waiting.
+
+        Returns "done" (cached), "pending" (queued or already running) or
+        "busy" (max_pending reached, nothing queued). Call from a worker
+        thread: mmap'd uploads are copied, since they are unmapped when the
+        request ends, and the shared store blocks.
+        """
+        with self._lock:
+            self.requested += 1
+            if self._cached(explanation_id) is not None:
+                self.cache_hits += 1
+                return "done"
+            if explanation_id in self._pending:
+                return "pending"
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return "busy"
+
+        if self.store is not None:
+            # Done or running in another worker process
+            shared = self.store.get(explanation_id)
+            if shared is not None and shared[0] == "done":
+                with self._lock:
+                    self.cache_hits += 1
+                return "done"
+            if not self.store.claim(explanation_id, time.time() + self.ttl_seconds):
+                return "pending"
+
+        with self._lock:
+            if explanation_id in self._pending:
+                return "pending"
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="explain")
+            self._errors.pop(explanation_id, None)
+            self._pending[explanation_id] = self._executor.submit(
+                self._compute, explanation_id, bytes(contents), loaded
+            )
+            return "pending"
+
+    def _compute(self, explanation_id, contents, loaded):
+        start = time.perf_counter()
+        try:
+            img_array = self.preprocess_fn(contents)
+            cam = self._explainer(loaded).heatmap(img_array)
+            png = overlay_png(img_array, cam, self.alpha)
+        except Exception as e:
+            self._share(explanation_id, None, str(e))
+            with self._lock:
+                self.failed += 1
+                self._errors[explanation_id] = str(e)
+                while len(self._errors) > MAX_ERRORS:
+                    self._errors.popitem(last=False)
+                self._pending.pop(explanation_id, None)
+            print(f"[WARN] Explanation {explanation_id} failed: {e}")
+            return None
+
+        self._share(explanation_id, png, None)
+        with self._lock:
+            self.computed += 1
+            self.total_compute_ms += (time.perf_counter() - start) * 1000
+            self._store(explanation_id, png)
+            self._pending.pop(explanation_id, None)
+        return png
+
+    def _share(self, explanation_id, png, error):
+        """Publish the outcome to the other worker processes (before it leaves _pending here)."""
+        if self.store is None:
+            return
+        try:
+            self.store.finish(explanation_id, png, error, time.time() + self.ttl_seconds)
+        except sqlite3.Error as e:
+            print(f"[WARN] Explanation store write failed: {e}")
+
+    def _explainer(self, loaded):
+        explainer = self._explainers.get(loaded.version)
+        if explainer is None:
+            with self._explainer_lock:
+                explainer = self._explainers.get(loaded.version)
+                if explainer is None:
+                    explainer = GradCam(loaded.backend.keras_model, self.layer_name)
+                    # Only the newest model version is explained; drop older gradient models
+                    self._explainers = {loaded.version: explainer}
+        return explainer
+
+    def _cached(self, explanation_id):
+        entry = self._results.get(explanation_id)
+        if entry is None:
+            return None
+        expires_at, png = entry
+        if expires_at <= time.time():
+            self._remove(explanation_id)
+            return None
+        self._results.move_to_end(explanation_id)
+        return png
+
+    def _store(self, explanation_id, png):
+        if len(png) > self.cache_bytes:
+            return
+        if explanation_id in self._results:
+            self._remove(explanation_id)
+        self._results[explanation_id] = (time.time() + self.ttl_seconds, png)
+        self._bytes += len(png)
+        while self._bytes > self.cache_bytes:
+            self._remove(next(iter(self._results)))
+
+    def _remove(self, explanation_id):
+        _, png = self._results.pop(explanation_id)
+        self._bytes -= len(png)
+
+    def get(self, explanation_id):
+        """
+        (status, png, error) with status "done", "pending", "failed" or "unknown".
+
+        Falls back to the shared store (blocking) for explanations this
+        process does not know about.
+        """
+        with self._lock:
+            png = self._cached(explanation_id)
+            if png is not None:
+                return "done", png, None
+            if explanation_id in self._pending:
+                return "pending", None, None
+            if explanation_id in self._errors:
+                return "failed", None, self._errors[explanation_id]
+
+        if self.store is not None:
+            try:
+                shared = self.store.get(explanation_id)
+            except sqlite3.Error as e:
+                print(f"[WARN] Explanation store read failed: {e}")
+                shared = None
+            if shared is not None:
+                status, png, error = shared
+                if status == "done":
+                    with self._lock:
+                        self._store(explanation_id, png)
+                return status, png, error
+        return "unknown", None, None
+
+    async def wait(self, explanation_id, timeout=0.0):
+        """get(), after waiting up to timeout seconds for a pending explanation to finish."""
+        with self._lock:
+            future = self._pending.get(explanation_id)
+        if future is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.store is None:
+            return self.get(explanation_id)
+
+        # Running in another worker process: poll the shared store
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            result = await loop.run_in_executor(None, self.get, explanation_id)
+            if result[0] != "pending" or loop.time() >= deadline:
+                return result
+            await asyncio.sleep(min(STORE_POLL_SECONDS, max(0.0, deadline - loop.time())))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": len(self._pending),
+                "requested": self.requested,
+                "cache_hits": self.cache_hits,
+                "computed": self.computed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_compute_ms": round(self.total_compute_ms / self.computed, 1) if self.computed else 0.0,
+                "cached": len(self._results),
+                "cache_bytes": self._bytes,
+                "layer": next(iter(self._explainers.values())).layer_name if self._explainers else self.layer_name,
+                "shared_store": self.store.db_path if self.store is not None else None,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,61 @@
+"""
+Gunicorn config for multi-process serving.
+
+    gunicorn main:app -c gunicorn.conf.py
+
+- Worker count follows the available cores (WORKERS_PER_CORE, MAX_WORKERS),
+  or WEB_CONCURRENCY when set explicitly.
+- The app is preloaded in the master and the TFLite flatbuffer is mapped
+  and prefaulted before forking, so every worker shares the same pages.
+- TFLite intra-op threads are split between workers so they do not
+  oversubscribe the CPU.
+"""
+import os
+
+from serving import SharedModelFile, available_cores, workers_for_cores
+
+# ==================== WORKERS ====================
+if os.environ.get("WEB_CONCURRENCY"):
+    workers = int(os.environ["WEB_CONCURRENCY"])
+else:
+    workers = workers_for_cores(
+        per_core=float(os.environ.get("WORKERS_PER_CORE", "1")),
+        max_workers=int(os.environ.get("MAX_WORKERS", "0")) or None,
+    )
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+keepalive = 300
+timeout = 300
+preload_app = True
+
+# Split cores between workers (read by main.py when the app is preloaded)
+os.environ.setdefault("TFLITE_NUM_THREADS", str(max(1, available_cores() // workers)))
+
+# ==================== PRE-FORK MODEL ====================
+shared_model = None
+
+
+def on_starting(server):
+    """Map and prefault the TFLite model once, before any worker is forked, if it is the one served."""
+    global shared_model
+    import main
+
+    print("=" * 60)
+    print(f"🧩 Multi-process mode: {workers} workers, {os.environ['TFLITE_NUM_THREADS']} TFLite threads each")
+
+    served = main.preferred_model_path()
+    if served == main.TFLITE_MODEL_PATH:
+        shared_model = SharedModelFile(main.TFLITE_MODEL_PATH)
+        print(f"[OK] Shared TFLite model mapped ({shared_model.size / (1024 * 1024):.1f}MB, one copy for all workers)")
+    elif served is None:
+        print("[WARN] No model file for INFERENCE_BACKEND - workers will fail to load a model")
+    else:
+        print(f"[WARN] Serving {os.path.basename(served)} - each worker will load its own copy of the model")
+        print("[INFO] Run convert_model.py and keep tflite first in BACKEND_ORDER to share one memory-mapped model")
+    print("=" * 60)
+
+
+def on_exit(server):
+    if shared_model is not None:
+        shared_model.close()
@@ -0,0 +1,214 @@
+"""
+Thread-safe pool of TFLite interpreters.
+
+A single tf.lite.Interpreter must not be used from several threads at once,
+so each forward pass checks out its own interpreter. All interpreters are
+built from the same model file path, which TFLite memory-maps read-only:
+the flatbuffer pages are shared between interpreters through the page cache
+instead of being read into the Python heap once per interpreter.
+"""
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class PooledInterpreter:
+    """
+    One interpreter with its tensor indices resolved once.
+
+    Models exported with convert_model.py --with-embeddings have a second
+    output; the narrower one is the prediction, the wider one the embedding
+    (output order is not guaranteed by the converter).
+    """
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.interpreter.allocate_tensors()
+
+        input_details = interpreter.get_input_details()[0]
+        outputs = sorted(interpreter.get_output_details(), key=lambda details: details['shape'][-1])
+        output_details = outputs[0]
+        self.input_index = input_details['index']
+        self.output_index = output_details['index']
+        self.input_shape = tuple(input_details['shape'])
+        self.input_dtype = input_details['dtype']
+        self.output_dtype = output_details['dtype']
+
+        # Full-int8 models take quantized input and return quantized output
+        self.input_scale, self.input_zero_point = input_details.get('quantization', (0.0, 0))
+        self.output_scale, self.output_zero_point = output_details.get('quantization', (0.0, 0))
+
+        self.embedding_details = outputs[-1] if len(outputs) > 1 else None
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self.embedding_details is not None
+
+    def run(self, batch: np.ndarray, embeddings=False):
+        """
+        Run one forward pass, resizing the input tensor only when the batch size changes.
+
+        With embeddings=True returns (outputs, embeddings).
+        """
+        if batch.shape != self.input_shape:
+            self.interpreter.resize_tensor_input(self.input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self.input_shape = batch.shape
+
+        self.interpreter.set_tensor(self.input_index, self._quantize(batch))
+        self.interpreter.invoke()
+        outputs = self._dequantize(self.interpreter.get_tensor(self.output_index))
+        if not embeddings:
+            return outputs
+        details = self.embedding_details
+        scale, zero_point = details.get('quantization', (0.0, 0))
+        embedding = self.interpreter.get_tensor(details['index'])
+        if np.issubdtype(details['dtype'], np.integer) and scale:
+            embedding = (embedding.astype(np.float32) - zero_point) * scale
+        return outputs, embedding
+
+    def _quantize(self, batch):
+        if not np.issubdtype(self.input_dtype, np.integer) or not self.input_scale:
+            return batch.astype(self.input_dtype, copy=False)
+        info = np.iinfo(self.input_dtype)
+        quantized = np.round(batch / self.input_scale + self.input_zero_point)
+        return np.clip(quantized, info.min, info.max).astype(self.input_dtype)
+
+    def _dequantize(self, output):
+        if not np.issubdtype(self.output_dtype, np.integer) or not self.output_scale:
+            return output
+        return (output.astype(np.float32) - self.output_zero_point) * self.output_scale
+
+
+def batch_buckets(max_batch_size):
+    """Padded batch sizes: powers of two below max_batch_size, then max_batch_size itself."""
+    buckets = []
+    size = 1
+    while size < max_batch_size:
+        buckets.append(size)
+        size *= 2
+    buckets.append(max(1, int(max_batch_size)))
+    return buckets
+
+
+def padded_size(batch_size, buckets):
+    """The smallest bucket that fits the batch (the pool splits batches beyond the largest)."""
+    for bucket in buckets:
+        if batch_size <= bucket:
+            return bucket
+    return batch_size
+
+
+class InterpreterPool:
+    """
+    N interpreters over one model file, checked out per request.
+
+    - interpreter_cls: tf.lite.Interpreter (or a compatible class)
+    - size: number of pool slots (= forward passes that can run at once)
+    - num_threads: intra-op threads per interpreter (None = TFLite default)
+    - max_batch_size: largest micro-batch; batches are zero-padded up to
+      a few fixed sizes (batch_buckets) and each slot keeps one
+      interpreter per size, so a batch size change never re-allocates
+      tensors; larger batches run in chunks of max_batch_size. None = one
+      interpreter per slot, resized on demand.
+
+    Interpreters share the mmap'd flatbuffer; each size only adds its own
+    activation arena.
+    """
+
+    def __init__(self, interpreter_cls, model_path, size=1, num_threads=None, max_batch_size=None):
+        self.interpreter_cls = interpreter_cls
+        self.model_path = model_path
+        self.size = max(1, int(size))
+        self.num_threads = num_threads
+        self.buckets = batch_buckets(max_batch_size) if max_batch_size else None
+        self._available = queue.Queue()
+        self._lock = threading.Lock()
+        self.padded_items = 0
+
+        for _ in range(self.size):
+            slot = {}  # batch size -> PooledInterpreter (None = any size)
+            first = self._runner(slot, self.buckets[0] if self.buckets else None)
+            self._available.put(slot)
+        self.has_embeddings = first.has_embeddings
+
+    def _runner(self, slot, batch_size):
+        """The slot's interpreter for one padded batch size, allocated for it on first use."""
+        runner = slot.get(batch_size)
+        if runner is None:
+            interpreter = self.interpreter_cls(model_path=self.model_path, num_threads=self.num_threads)
+            if batch_size is not None:
+                input_details = interpreter.get_input_details()[0]
+                shape = list(input_details['shape'])
+                if shape[0] != batch_size:
+                    interpreter.resize_tensor_input(input_details['index'], [batch_size] + shape[1:])
+            runner = slot[batch_size] = PooledInterpreter(interpreter)
+        return runner
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Borrow a slot; blocks until one is free."""
+        slot = self._available.get(timeout=timeout)
+        try:
+            yield slot
+        finally:
+            self._available.put(slot)
+
+    def _run(self, slot, batch, embeddings=False):
+        if self.buckets is None:
+            return self._runner(slot, None).run(batch, embeddings)
+        largest = self.buckets[-1]
+        if len(batch) <= largest:
+            return self._run_padded(slot, batch, embeddings)
+
+        # Chunks of the largest bucket, rather than a new interpreter per oversized batch size
+        results = [self._run_padded(slot, batch[start:start + largest], embeddings)
+                   for start in range(0, len(batch), largest)]
+        if embeddings:
+            return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+        return np.concatenate(results)
+
+    def _run_padded(self, slot, batch, embeddings):
+        count = len(batch)
+        bucket = padded_size(count, self.buckets)
+        if bucket != count:
+            padding = np.zeros((bucket - count,) + batch.shape[1:], dtype=batch.dtype)
+            batch = np.concatenate([batch, padding])
+            with self._lock:
+                self.padded_items += bucket - count
+        result = self._runner(slot, bucket).run(batch, embeddings)
+        if embeddings:
+            outputs, embedding = result
+            return outputs[:count], embedding[:count]
+        return result[:count]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self.checkout() as slot:
+            return self._run(slot, batch)
+
+    def predict_with_embeddings(self, batch: np.ndarray):
+        with self.checkout() as slot:
+            return self._run(slot, batch, embeddings=True)
+
+    def warm_up(self, batch: np.ndarray):
+        """Run one pass through every interpreter in the pool, at every padded batch size."""
+        slots = [self._available.get() for _ in range(self.size)]
+        try:
+            for slot in slots:
+                for bucket in self.buckets or [len(batch)]:
+                    self._run(slot, np.repeat(batch[:1], bucket, axis=0))
+        finally:
+            for slot in slots:
+                self._available.put(slot)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "available": self._available.qsize(),
+            "num_threads": self.num_threads,
+            "embeddings": self.has_embeddings,
+            "batch_buckets": self.buckets,
+            "padded_items": self.padded_items,
+        }
@@ -0,0 +1,362 @@
+"""
+Asynchronous prediction jobs for DermaVision.
+
+Bulk clients submit a folder of images, get a job id back right away and
+poll (or long-poll) for the results, instead of holding one request open
+past the keep-alive timeout. Jobs and their images are kept in sqlite:
+
+- queued and half-finished jobs survive a restart; results are saved
+  chunk by chunk, so a resumed job only redoes the chunk it was on
+- image bytes are dropped as soon as their result is stored
+- finished jobs are purged after the retention period
+
+Workers are asyncio tasks that run each chunk through the same
+preprocessing, cache and micro-batcher as /predict. Higher priority
+jobs are claimed first, then oldest first.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL, "
+    "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+    "total INTEGER NOT NULL, completed INTEGER NOT NULL DEFAULT 0, "
+    "errors INTEGER NOT NULL DEFAULT 0, error TEXT, owner_pid INTEGER)",
+    "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)",
+    "CREATE TABLE IF NOT EXISTS job_items ("
+    "job_id TEXT NOT NULL, idx INTEGER NOT NULL, filename TEXT, content_type TEXT, "
+    "data BLOB, result TEXT, error TEXT, PRIMARY KEY (job_id, idx))",
+)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _pid_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    sqlite persistence for jobs and their images.
+
+    Blocking; JobQueue calls it from a single store thread. The database is
+    opened on first use, one connection per process.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._db = None
+        self._db_pid = None
+
+    def _connection(self):
+        if self._db is None or self._db_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                db.execute(statement)
+            self._db = db
+            self._db_pid = os.getpid()
+        return self._db
+
+    def create(self, items, priority=0) -> dict:
+        """Store a new queued job; items are (filename, content_type, contents)."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "INSERT INTO jobs (id, status, priority, created_at, total) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, int(priority), now, len(items)),
+            )
+            for idx, (filename, content_type, contents) in enumerate(items):
+                with memoryview(contents) as data:
+                    db.execute(
+                        "INSERT INTO job_items (job_id, idx, filename, content_type, data) VALUES (?, ?, ?, ?, ?)",
+                        (job_id, idx, filename, content_type, data),
+                    )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return self.get(job_id)
+
+    def claim(self):
+        """Mark the next queued job as running in this process and return it, or None."""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), owner_pid = ? "
+                    "WHERE id = ?",
+                    (time.time(), os.getpid(), row["id"]),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return self.get(row["id"]) if row is not None else None
+
+    def pending_items(self, job_id, limit):
+        """Next items without a result: (idx, filename, content_type, bytes)."""
+        rows = self._connection().execute(
+            "SELECT idx, filename, content_type, data FROM job_items "
+            "WHERE job_id = ? AND result IS NULL AND error IS NULL ORDER BY idx LIMIT ?",
+            (job_id, limit),
+        ).fetchall()
+        return [(row["idx"], row["filename"], row["content_type"], row["data"]) for row in rows]
+
+    def save_results(self, job_id, results):
+        """Store (idx, result_dict_or_None, error_or_None) rows and drop their image bytes."""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for idx, result, error in results:
+                db.execute(
+                    "UPDATE job_items SET result = ?, error = ?, data = NULL WHERE job_id = ? AND idx = ?",
+                    (json.dumps(result) if result is not None else None, error, job_id, idx),
+                )
+            db.execute(
+                "UPDATE jobs SET completed = completed + ?, errors = errors + ? WHERE id = ?",
+                (len(results), sum(1 for _, _, error in results if error is not None), job_id),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def finish(self, job_id, status, error=None):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+            (status, error, time.time(), job_id),
+        )
+
+    def requeue(self, job_id):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'queued', owner_pid = NULL WHERE id = ? AND status = 'running'", (job_id,)
+        )
+
+    def cancel(self, job_id) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+            "WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id),
+        )
+        if cursor.rowcount:
+            self._connection().execute("UPDATE job_items SET data = NULL WHERE job_id = ?", (job_id,))
+        return bool(cursor.rowcount)
+
+    def get(self, job_id):
+        row = self._connection().execute(
+            "SELECT id, status, priority, created_at, started_at, finished_at, total, completed, errors, error "
+            "FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def results(self, job_id) -> list:
+        """Per-item results in the /predict/batch item format (finished items only)."""
+        items = []
+        rows = self._connection().execute(
+            "SELECT idx, filename, result, error FROM job_items "
+            "WHERE job_id = ? AND (result IS NOT NULL OR error IS NOT NULL) ORDER BY idx",
+            (job_id,),
+        )
+        for row in rows:
+            item = {"index": row["idx"], "filename": row["filename"]}
+            if row["error"] is not None:
+                item["error"] = row["error"]
+            else:
+                item["result"] = json.loads(row["result"])
+            items.append(item)
+        return items
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a process that is gone (crash or restart)."""
+        db = self._connection()
+        stale = [
+            row["id"] for row in db.execute("SELECT id, owner_pid FROM jobs WHERE status = 'running'")
+            if row["owner_pid"] is None or row["owner_pid"] == os.getpid() or not _pid_alive(row["owner_pid"])
+        ]
+        for job_id in stale:
+            self.requeue(job_id)
+        return len(stale)
+
+    def purge(self, older_than) -> int:
+        """Delete finished jobs (and their results) that ended before older_than."""
+        db = self._connection()
+        ids = [
+            row["id"] for row in db.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+                (older_than,),
+            )
+        ]
+        for job_id in ids:
+            db.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(ids)
+
+    def counts(self) -> dict:
+        rows = self._connection().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+
+class JobQueue:
+    """
+    Background job processing on the event loop.
+
+    - process_fn: async generator fn(items) yielding /predict/batch style items
+      ({"index", "filename", "result" | "error"}) for (filename, content_type, bytes) items
+    - ready_fn: jobs are only claimed while this returns True (e.g. model loaded)
+    - workers: jobs processed at once
+    - chunk_size: images per chunk; results are persisted after every chunk
+    - max_queued: submissions beyond this many queued jobs raise JobQueueFull
+    - retention_seconds: how long finished jobs and results are kept
+    """
+
+    def __init__(self, store, process_fn, ready_fn=None, workers=1, chunk_size=8,
+                 max_queued=100, retention_seconds=86400, poll_interval=1.0):
+        self.store = store
+        self.process_fn = process_fn
+        self.ready_fn = ready_fn or (lambda: True)
+        self.workers = max(1, int(workers))
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_queued = int(max_queued)
+        self.retention_seconds = float(retention_seconds)
+        self.poll_interval = float(poll_interval)
+
+        # sqlite calls run on one thread so they never block the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._wakeup = None
+        self._tasks = []
+        self._last_purge = 0.0
+
+        self.processed_items = 0
+
+    async def _db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # ---------- Lifecycle ----------
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        recovered = await self._db(self.store.recover)
+        if recovered:
+            print(f"[INFO] Resuming {recovered} interrupted job(s)")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+
+    # ---------- API ----------
+    async def submit(self, items, priority=0) -> dict:
+        counts = await self._db(self.store.counts)
+        if counts.get("queued", 0) >= self.max_queued:
+            raise JobQueueFull(f"Too many queued jobs (max {self.max_queued})")
+        job = await self._db(self.store.create, items, priority)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id, wait=0.0):
+        """Job status; with wait > 0, long-poll until it finishes or wait seconds pass."""
+        deadline = time.monotonic() + wait
+        while True:
+            job = await self._db(self.store.get, job_id)
+            if job is None or job["status"] in TERMINAL_STATES or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(min(0.25, max(0.0, deadline - time.monotonic())))
+
+    async def results(self, job_id):
+        return await self._db(self.store.results, job_id)
+
+    async def cancel(self, job_id) -> bool:
+        return await self._db(self.store.cancel, job_id)
+
+    async def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "max_queued": self.max_queued,
+            "jobs": await self._db(self.store.counts),
+            "processed_items": self.processed_items,
+        }
+
+    # ---------- Workers ----------
+    async def _worker(self):
+        while True:
+            job = None
+            if self.ready_fn():
+                job = await self._db(self.store.claim)
+            if job is None:
+                await self._maybe_purge()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._process(job["id"])
+            except asyncio.CancelledError:
+                # Shutting down: leave it for the next start
+                await asyncio.shield(self._db(self.store.requeue, job["id"]))
+                raise
+            except Exception as e:
+                print(f"[ERROR] Job {job['id']} failed: {e}")
+                await self._db(self.store.finish, job["id"], "failed", str(e))
+
+    async def _process(self, job_id):
+        while True:
+            job = await self._db(self.store.get, job_id)
+            if job is None or job["status"] != "running":
+                return  # cancelled meanwhile
+
+            chunk = await self._db(self.store.pending_items, job_id, self.chunk_size)
+            if not chunk:
+                await self._db(self.store.finish, job_id, "done")
+                return
+
+            results = []
+            items = [(filename, content_type, data) for _, filename, content_type, data in chunk]
+            async for item in self.process_fn(items):
+                idx = chunk[item["index"]][0]
+                results.append((idx, item.get("result"), item.get("error")))
+            await self._db(self.store.save_results, job_id, results)
+            self.processed_items += len(results)
+
+    async def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        purged = await self._db(self.store.purge, now - self.retention_seconds)
+        if purged:
+            print(f"[INFO] Purged {purged} finished job(s)")
@@ -0,0 +1,70 @@
+"""
+Keras compatibility shims for loading older H5 model files.
+
+Shared by the API server and the offline tools so every loader sees the
+same custom objects. Importing this module requires TensorFlow.
+"""
+from tensorflow import keras
+from tensorflow.keras.layers import InputLayer
+from tensorflow.keras.utils import get_custom_objects
+
+
+# Register compatible classes for older model formats
+class CompatibleInputLayer(InputLayer):
+    def __init__(self, *args, **kwargs):
+        # Convert batch_shape to input_shape for compatibility
+        if 'batch_shape' in kwargs:
+            batch_shape = kwargs.pop('batch_shape')
+            if batch_shape and len(batch_shape) > 1:
+                kwargs['input_shape'] = batch_shape[1:]
+        super().__init__(*args, **kwargs)
+
+# Handle DTypePolicy compatibility (Keras 2.x vs 3.x)
+try:
+    from tensorflow.keras.dtype_policies import DTypePolicy as TFDTypePolicy
+    # Use the real DTypePolicy if available
+    CompatibleDTypePolicy = TFDTypePolicy
+except ImportError:
+    try:
+        from keras.dtype_policies import DTypePolicy as KerasDTypePolicy
+        CompatibleDTypePolicy = KerasDTypePolicy
+    except ImportError:
+        # Create a simple DTypePolicy wrapper for compatibility
+        class CompatibleDTypePolicy:
+            def __init__(self, name='float32'):
+                self.name = name
+                # Add required attributes
+                import numpy as np
+                self.compute_dtype = getattr(np, name, np.float32)
+                self.variable_dtype = getattr(np, name, np.float32)
+
+            @classmethod
+            def from_config(cls, config):
+                # Handle nested config structure
+                if isinstance(config, dict):
+                    if 'config' in config:
+                        # Nested structure: {'module': 'keras', 'class_name': 'DTypePolicy', 'config': {'name': 'float32'}}
+                        return cls(config['config'].get('name', 'float32'))
+                    else:
+                        # Direct config: {'name': 'float32'}
+                        return cls(config.get('name', 'float32'))
+                return cls('float32')
+
+
+def register_custom_objects():
+    """Register the shims globally before any model loading."""
+    custom_objs = get_custom_objects()
+    custom_objs['InputLayer'] = CompatibleInputLayer
+    custom_objs['DTypePolicy'] = CompatibleDTypePolicy
+    return custom_objs
+
+
+def load_h5_model(path):
+    """Load an H5 model, retrying with explicit custom objects if needed."""
+    try:
+        return keras.models.load_model(path, compile=False)
+    except Exception:
+        return keras.models.load_model(path, compile=False, custom_objects=register_custom_objects())
+
+
+register_custom_objects()
@@ -1,80 +1,43 @@
 import os
 import io
 import time
+import asyncio
 import numpy as np
 import random
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Header, Query, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from PIL import Image
-import requests
 import shutil
+import secrets
+import threading
+from typing import List, Optional
 
+from batching import MicroBatcher
+from workers import WorkerPools
+from backends import KerasBackend, OnnxBackend, TFLiteBackend, select_backend
+from registry import LoadedModel, ModelRegistry
+from experiments import ModelExperiment
+from jobs import JobQueue, JobQueueFull, JobStore
+from tta import MAX_VIEWS, augment_views, summarize_views
+from quality import ImageQualityRejected, QualityGate
+from similarity import EmbeddingIndex
+from explanations import ExplanationService
+from responses import (
+    DISCLAIMER_REF, compact_batch_item, compact_prediction, dumps_json, encode_response, wants_compact, wants_msgpack
+)
+from cache import PredictionCache, hash_bytes
+from coalescing import SingleFlight
+from archives import ArchiveTooLarge, is_archive, expand_archive
+from preprocessing import RESAMPLING_FILTERS, ImageRejected, list_image_files, preprocess_image_fast
+from uploads import RequestSizeLimitMiddleware, read_upload, release_upload
+from downloader import DownloadError, download_file, expected_checksum
+import runtime
+from metrics import Counter, Gauge, Histogram, Registry, StageTimings, process_rss_bytes
 
-# Try importing TensorFlow/Keras - handle version differences
-try:
-    import tensorflow as tf
-    from tensorflow import keras
-    from tensorflow.keras.layers import InputLayer
-    from tensorflow.keras.utils import get_custom_objects
-    
-    # Register compatible classes for older model formats
-    class CompatibleInputLayer(InputLayer):
-        def __init__(self, *args, **kwargs):
-            # Convert batch_shape to input_shape for compatibility
-            if 'batch_shape' in kwargs:
-                batch_shape = kwargs.pop('batch_shape')
-                if batch_shape and len(batch_shape) > 1:
-                    kwargs['input_shape'] = batch_shape[1:]
-            super().__init__(*args, **kwargs)
-    
-    # Handle DTypePolicy compatibility (Keras 2.x vs 3.x)
-    try:
-        from tensorflow.keras.dtype_policies import DTypePolicy as TFDTypePolicy
-        # Use the real DTypePolicy if available
-        CompatibleDTypePolicy = TFDTypePolicy
-    except ImportError:
-        try:
-            from keras.dtype_policies import DTypePolicy as KerasDTypePolicy
-            CompatibleDTypePolicy = KerasDTypePolicy
-        except ImportError:
-            # Create a simple DTypePolicy wrapper for compatibility
-            class CompatibleDTypePolicy:
-                def __init__(self, name='float32'):
-                    self.name = name
-                    # Add required attributes
-                    import numpy as np
-                    self.compute_dtype = getattr(np, name, np.float32)
-                    self.variable_dtype = getattr(np, name, np.float32)
-                
-                @classmethod
-                def from_config(cls, config):
-                    # Handle nested config structure
-                    if isinstance(config, dict):
-                        if 'config' in config:
-                            # Nested structure: {'module': 'keras', 'class_name': 'DTypePolicy', 'config': {'name': 'float32'}}
-                            return cls(config['config'].get('name', 'float32'))
-                        else:
-                            # Direct config: {'name': 'float32'}
-                            return cls(config.get('name', 'float32'))
-                    return cls('float32')
-    
-    # Register custom objects before any model loading
-    custom_objs = get_custom_objects()
-    custom_objs['InputLayer'] = CompatibleInputLayer
-    custom_objs['DTypePolicy'] = CompatibleDTypePolicy
-except ImportError:
-    try:
-        import keras
-        tf = None
-        InputLayer = None
-        get_custom_objects = None
-    except ImportError:
-        tf = None
-        keras = None
-        InputLayer = None
-        get_custom_objects = None
+# TensorFlow is NOT imported here: runtime.py imports tflite_runtime / tf.lite
+# or TensorFlow Keras lazily, depending on which model format is on disk.
 
 # ==================== INITIALIZATION ====================
 app = FastAPI(
@@ -105,25 +68,58 @@ async def startup_event():
     """Log startup information."""
     print("="*60)
     print("🚀 DermaVision API Starting...")
-    print(f"📊 Model Loading: Lazy (on first request)")
+    if MODEL_LOAD_MODE == "eager":
+        print(f"📊 Model Loading: Eager (background warm-up, see /ready)")
+        threading.Thread(target=load_model_lazy, name="model-loader", daemon=True).start()
+    else:
+        print(f"📊 Model Loading: Lazy (on first request)")
+    if EXPERIMENT_MODE != "off":
+        print(f"🧪 Experiment: {EXPERIMENT_MODE} with candidate {CANDIDATE_MODEL_PATH or '(none set)'}")
+        threading.Thread(target=load_candidate_model, name="candidate-loader", daemon=True).start()
+    if MODEL_WATCH_INTERVAL_SECONDS > 0:
+        print(f"🔄 Watching model files every {MODEL_WATCH_INTERVAL_SECONDS:.0f}s for hot reload")
+        model_registry.watch(MODEL_WATCH_INTERVAL_SECONDS)
+    formats = runtime.detect_model_formats(*backend_candidates())
+    order = f" order {','.join(BACKEND_ORDER)}" if INFERENCE_BACKEND == "auto" else ""
+    print(f"🧠 Inference backend: {INFERENCE_BACKEND}{order} (model files: {', '.join(formats) or 'none'})")
     print(f"🌐 CORS Enabled for: {len(origins)} origins")
+    print(f"🧵 Workers: {pools.preprocess_workers} preprocess / {pools.inference_workers} inference, max in-flight {pools.max_in_flight}")
+    await job_queue.start()
+    print(f"📬 Jobs: {job_queue.workers} worker(s), store {JOB_DB}")
+    if EXPLAIN_DB:
+        print(f"🔥 Explanations shared across workers via {EXPLAIN_DB}")
     print("="*60)
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop job workers, the model watcher, shadow evaluation, explanations and worker pools."""
+    await job_queue.stop()
+    if prediction_cache is not None:
+        prediction_cache.flush()
+    model_registry.stop()
+    experiment.shutdown()
+    explanations.shutdown()
+    pools.shutdown()
+
 
 # ==================== MODEL LOADING ====================
 # Paths
 BASE_DIR = os.path.dirname(__file__)
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 TFLITE_MODEL_PATH = os.path.join(MODELS_DIR, "skin_cancer_cnn.tflite")
+ONNX_MODEL_PATH = os.path.join(MODELS_DIR, "skin_cancer_cnn.onnx")
 H5_MODEL_PATH = os.path.join(MODELS_DIR, "skin_cancer_cnn.h5")
+BACKEND_MODEL_PATHS = {"onnx": ONNX_MODEL_PATH, "tflite": TFLITE_MODEL_PATH, "keras": H5_MODEL_PATH}
 
 # GitHub LFS download URL (fallback for H5)
 MODEL_DOWNLOAD_URL = "https://github.com/sa1165/DermaVision-AI-Skin-Cancer-Prediction-/raw/main/models/skin_cancer_cnn.h5"
 
-# Global model variables
-model = None
-is_tflite = False
-model_loading_attempted = False
+# Serializes the first load (the registry handles later reloads)
+model_lock = threading.Lock()
+
+# Readiness: not_loaded -> loading -> ready | failed
+model_status = "not_loaded"
+model_error = None
 
 def is_git_lfs_pointer(filepath):
     """Check if a file is a Git LFS pointer file."""
@@ -142,110 +138,262 @@ def is_git_lfs_pointer(filepath):
     except Exception:
         return False
 
+def compute_model_version(filepath):
+    """Short SHA-256 of the model file, used to tell model versions apart."""
+    return model_registry.file_version(filepath)
+
 def download_model_from_url(url, destination):
-    """Download model file from URL with progress."""
+    """Download model file from URL (resumable, SHA-256 verified, atomic rename)."""
     try:
         print(f"[INFO] Downloading model from {url}...")
         print(f"[INFO] This may take a few minutes (model is ~500MB)...")
         
-        response = requests.get(url, stream=True, timeout=300)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        # Create models directory if it doesn't exist
-        os.makedirs(os.path.dirname(destination), exist_ok=True)
-        
-        with open(destination, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        if downloaded % (10 * 1024 * 1024) == 0:  # Log every 10MB
-                            print(f"[INFO] Downloaded {downloaded / (1024*1024):.1f}MB / {total_size / (1024*1024):.1f}MB ({percent:.1f}%)")
-        
-        print(f"[OK] Model downloaded successfully to {destination}")
+        # Read the expected checksum before the LFS pointer gets replaced
+        download_file(
+            url,
+            destination,
+            sha256=expected_checksum(destination),
+            chunk_size=DOWNLOAD_CHUNK_MB * 1024 * 1024,
+            max_retries=DOWNLOAD_RETRIES,
+        )
         return True
-    except Exception as e:
+    except DownloadError as e:
         print(f"[ERROR] Failed to download model: {e}")
         return False
 
 def load_model_lazy():
-    """Load model lazily on first request (Prioritizes TFLite)."""
-    global model, is_tflite, model_loading_attempted
-    
-    if model is not None:
-        return model
+    """Return the active LoadedModel, loading and warming it (with retries) if nobody has yet."""
+    if model_status == "ready":
+        return model_registry.active
     
-    if model_loading_attempted:
-        return None
-    
-    model_loading_attempted = True
+    # Loading runs on background/worker threads - only one of them may do it
+    with model_lock:
+        if model_status == "ready":
+            return model_registry.active
+        
+        if model_status == "failed":
+            return None
+        
+        return _load_with_retry()
+
+def _load_with_retry():
+    """Load and warm the model, backing off between failed attempts. Caller holds model_lock."""
+    global model_status, model_error
     
-    print(f"[INFO] lazy_load triggered. Checking for models...")
+    delay = MODEL_LOAD_BACKOFF_SECONDS
+    for attempt in range(1, MODEL_LOAD_RETRIES + 1):
+        model_status = "loading"
+        try:
+            loaded = _load_model()
+            if loaded is not None:
+                warm_up_model(loaded)
+                model_registry.activate(loaded)
+                return loaded
+            model_error = "No loadable model found"
+        except Exception as e:
+            model_error = str(e)
+        
+        if attempt < MODEL_LOAD_RETRIES:
+            print(f"[WARN] Model load attempt {attempt}/{MODEL_LOAD_RETRIES} failed ({model_error}), retrying in {delay:.0f}s...")
+            time.sleep(delay)
+            delay = min(delay * 2, MODEL_LOAD_MAX_BACKOFF_SECONDS)
     
-    # 1. Try Loading TFLite Model (Preferred for Memory)
-    if os.path.exists(TFLITE_MODEL_PATH):
+    model_status = "failed"
+    print(f"[ERROR] Model loading failed after {MODEL_LOAD_RETRIES} attempts: {model_error}")
+    return None
+
+def _mark_ready(loaded):
+    """Registry callback: a model version is active, so the service is ready."""
+    global model_status, model_error
+    model_status = "ready"
+    model_error = None
+
+def warm_up_model(loaded):
+    """Dummy forward pass at INPUT_SIZE so graph building happens before real traffic."""
+    start = time.time()
+    dummy = np.zeros((1, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+    loaded.backend.warm_up(dummy)
+    print(f"[OK] Model warm-up done in {(time.time() - start) * 1000:.0f}ms")
+
+def make_backend(path, pool_size=None, num_threads=None):
+    """An unloaded InferenceBackend for a model file, sized like the serving pool unless told otherwise."""
+    if path.endswith(TFLiteBackend.extension):
+        # Micro-batches are padded to a few fixed sizes, each with its own pre-allocated interpreter
+        return TFLiteBackend(path, pool_size or TFLITE_POOL_SIZE, num_threads or TFLITE_NUM_THREADS, BATCH_MAX_SIZE)
+    if path.endswith(OnnxBackend.extension):
+        return OnnxBackend(path, num_threads or ONNX_NUM_THREADS)
+    return KerasBackend(path, EMBEDDING_LAYER or None)
+
+def load_model_file(path, pool_size=1, num_threads=None):
+    """Load any .tflite, .onnx or .h5 file as a LoadedModel (no download or self-benchmark, raises on failure)."""
+    backend = make_backend(path, pool_size, num_threads).load()
+    return LoadedModel(backend, version=compute_model_version(path))
+
+def backend_candidates():
+    """Model files the loader may serve, per INFERENCE_BACKEND (all of them, in BACKEND_ORDER, for "auto")."""
+    if INFERENCE_BACKEND == "auto":
+        return [BACKEND_MODEL_PATHS[name] for name in BACKEND_ORDER]
+    return [BACKEND_MODEL_PATHS[INFERENCE_BACKEND]]
+
+def preferred_model_path():
+    """
+    The file _load_model will serve, without loading anything: the first
+    candidate present on disk (the H5 last, since it can be downloaded).
+    Used by gunicorn.conf.py to decide what to share before forking.
+    """
+    candidates = backend_candidates()
+    for path in candidates:
+        if os.path.exists(path) and not is_git_lfs_pointer(path):
+            return path
+    return H5_MODEL_PATH if H5_MODEL_PATH in candidates else None
+
+def calibration_batch():
+    """The self-benchmark input: BACKEND_CALIBRATION_DIR images, else a fixed random batch."""
+    if BACKEND_CALIBRATION_DIR:
+        images = []
+        for path in list_image_files(BACKEND_CALIBRATION_DIR, BACKEND_BENCHMARK_BATCH):
+            with open(path, "rb") as f:
+                try:
+                    images.append(preprocess_image(f.read())[0])
+                except ValueError as e:
+                    print(f"[WARN] Skipping calibration image {path}: {e}")
+        if images:
+            return np.stack(images)
+        print(f"[WARN] No usable calibration images in {BACKEND_CALIBRATION_DIR}, using random inputs")
+    return np.random.default_rng(0).random((BACKEND_BENCHMARK_BATCH, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+
+def _ensure_h5_downloaded():
+    """Download the H5 if it is missing or only a Git LFS pointer; False if that failed."""
+    if os.path.exists(H5_MODEL_PATH) and not is_git_lfs_pointer(H5_MODEL_PATH):
+        return True
+    print(f"[WARN] H5 Model file is missing or a Git LFS pointer")
+    print(f"[INFO] Attempting to download H5 model from GitHub...")
+    if download_model_from_url(MODEL_DOWNLOAD_URL, H5_MODEL_PATH):
+        print(f"[OK] Download complete, attempting to load...")
+        return True
+    return False
+
+def _load_primary_backend():
+    """The first candidate file that loads, in BACKEND_ORDER (the H5 is downloaded if needed)."""
+    for path in backend_candidates():
+        if path == H5_MODEL_PATH:
+            # TensorFlow/Keras is only imported when no converted model loaded
+            if not _ensure_h5_downloaded():
+                continue
+        elif not os.path.exists(path):
+            print(f"[INFO] {os.path.basename(path)} not found")
+            continue
+        backend = make_backend(path)
         try:
-            print(f"[INFO] Found TFLite model at {TFLITE_MODEL_PATH}")
-            # Initialize TFLite Interpreter
-            interpreter = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH)
-            interpreter.allocate_tensors()
-            
-            model = interpreter
-            is_tflite = True
-            print(f"[OK] TFLite Model loaded successfully!")
-            print(f"[INFO] Memory usage should be minimal (~100MB)")
-            return model
+            print(f"[INFO] Found {backend.label} model at {path}")
+            return backend.load()
         except Exception as e:
-            print(f"[ERROR] Failed to load TFLite model: {e}")
-            print(f"[INFO] Falling back to H5 model...")
-            is_tflite = False
-    else:
-        print(f"[INFO] TFLite model not found at {TFLITE_MODEL_PATH}")
+            print(f"[ERROR] Failed to load {backend.label} model: {e}")
+    return None
+
+def _self_benchmark(primary):
+    """
+    BACKEND_BENCHMARK: load the other model files present and serve the
+    fastest one whose outputs on the calibration batch stay within
+    BACKEND_ACCURACY_TOLERANCE of the Keras reference (of the preferred
+    file when there is no H5). Returns (backend to serve, report).
+    """
+    backends = [primary]
+    for path in backend_candidates():
+        if path == primary.path or not os.path.exists(path) or is_git_lfs_pointer(path):
+            continue
+        backend = make_backend(path)
+        try:
+            backends.append(backend.load())
+        except Exception as e:
+            print(f"[WARN] Skipping {backend.label} in the self-benchmark: {e}")
+    if len(backends) == 1:
+        return primary, None
+    
+    reference = "keras" if any(backend.name == "keras" for backend in backends) else primary.name
+    print(f"[INFO] Self-benchmarking {', '.join(b.name for b in backends)} against {reference}...")
+    selected, selection = select_backend(
+        backends,
+        calibration_batch(),
+        malignant_probability,
+        runs=BACKEND_BENCHMARK_RUNS,
+        tolerance=BACKEND_ACCURACY_TOLERANCE,
+        reference=reference,
+    )
+    for row in selection["candidates"]:
+        print(f"[INFO]   {row['name']}: {row.get('p50_ms', '-')}ms p50, "
+              f"max delta {row.get('max_prob_delta', '-')}, within tolerance {row.get('within_tolerance', False)}")
+    for backend in backends:
+        if backend is not selected:
+            backend.close()
+    return selected, selection
+
+def _load_model():
+    """
+    Load the model on disk as a new LoadedModel (not yet warmed or active).
+    
+    Takes the first model file that loads in BACKEND_ORDER (the H5 is
+    downloaded if missing), so with the default order TensorFlow is only
+    imported when no converted model exists, and the same files always
+    give the same model version. With BACKEND_BENCHMARK=true every model
+    file present is timed and checked against the Keras reference, and the
+    fastest one that agrees serves; the version stays the preferred
+    file's. Used for the first load and for hot reloads, so it must not
+    touch the active model.
+    """
+    print(f"[INFO] Model load triggered. Checking for models ({INFERENCE_BACKEND})...")
+    
+    primary = _load_primary_backend()
+    if primary is None:
+        return None
+    
+    selected, selection = primary, None
+    if BACKEND_BENCHMARK and INFERENCE_BACKEND == "auto":
+        if SERVING_MODE == "multiprocess":
+            # Each worker would benchmark on its own and could pick a different engine
+            print("[WARN] BACKEND_BENCHMARK is ignored with SERVING_MODE=multiprocess")
+        else:
+            selected, selection = _self_benchmark(primary)
+    print(f"[OK] Serving with the {selected.label} backend ({os.path.basename(selected.path)})")
+    
+    return LoadedModel(selected, version=compute_model_version(primary.path),
+                       sources=model_registry.disk_versions(), selection=selection)
 
-    # 2. Fallback to H5 Model (Original Logic)
+def load_candidate_model():
+    """Load and warm CANDIDATE_MODEL_PATH for shadow / A/B evaluation (background thread)."""
+    if not CANDIDATE_MODEL_PATH:
+        experiment.candidate_error = "CANDIDATE_MODEL_PATH is not set"
+        print(f"[WARN] EXPERIMENT_MODE={EXPERIMENT_MODE} but CANDIDATE_MODEL_PATH is not set")
+        return
+    
+    # Relative paths are resolved against the models directory
+    path = os.path.join(MODELS_DIR, CANDIDATE_MODEL_PATH)
     try:
-        # Check if model file exists and is not a Git LFS pointer
-        if os.path.exists(H5_MODEL_PATH):
-            if is_git_lfs_pointer(H5_MODEL_PATH):
-                print(f"[WARN] H5 Model file is a Git LFS pointer")
-                print(f"[INFO] Attempting to download H5 model from GitHub...")
-                
-                if download_model_from_url(MODEL_DOWNLOAD_URL, H5_MODEL_PATH):
-                    print(f"[OK] Download complete, attempting to load...")
-                else:
-                    return None
-        
-        # Load H5
-        if keras is not None:
-            try:
-                model = keras.models.load_model(H5_MODEL_PATH, compile=False)
-                print(f"[OK] H5 Model loaded successfully")
-                return model
-            except Exception as e1:
-                try:
-                    custom_objs = get_custom_objects()
-                    model = keras.models.load_model(H5_MODEL_PATH, compile=False, custom_objects=custom_objs)
-                    print(f"[OK] H5 Model loaded with custom objects")
-                    return model
-                except Exception as e2:
-                    print(f"[ERROR] H5 Model loading failed: {e2}")
-                    return None
+        print(f"[INFO] Loading candidate model from {path}...")
+        if EXPERIMENT_MODE == "ab":
+            # Serves real traffic, so size it like the active model
+            loaded = load_model_file(path, TFLITE_POOL_SIZE, TFLITE_NUM_THREADS)
         else:
-            print("[WARN] Keras not available")
-            return None
-            
+            loaded = load_model_file(path, SHADOW_WORKERS, SHADOW_NUM_THREADS)
+        warm_up_model(loaded)
+        experiment.set_candidate(loaded)
+        print(f"[OK] Candidate model {loaded.version} ready for {EXPERIMENT_MODE} evaluation")
     except Exception as e:
-        print(f"[ERROR] Error loading H5 model: {e}")
-        return None
+        experiment.candidate_error = str(e)
+        print(f"[ERROR] Candidate model loading failed, experiment disabled: {e}")
 
+# Versions by content hash; loads new versions in the background and swaps them in
+model_registry = ModelRegistry(
+    list(BACKEND_MODEL_PATHS.values()),
+    load_fn=_load_model,
+    warm_up_fn=warm_up_model,
+    on_activate=_mark_ready,
+)
 
 
 # ==================== CONFIGURATION ====================
+# "multiprocess" when started under gunicorn by start.sh (gunicorn.conf.py)
+SERVING_MODE = os.environ.get("SERVING_MODE", "").lower()
 INPUT_SIZE = 224
 CLASS_NAMES = {0: "Benign", 1: "Malignant"}
 CONFIDENCE_THRESHOLDS = {
@@ -254,6 +402,142 @@ CONFIDENCE_THRESHOLDS = {
     "Low": 0.00
 }
 
+# Model download (used when the H5 is missing or a Git LFS pointer)
+DOWNLOAD_CHUNK_MB = int(os.environ.get("DOWNLOAD_CHUNK_MB", "4"))
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", "5"))
+
+# Preprocessing: resampling filter and JPEG draft (reduced-size) decoding
+PREPROCESS_RESAMPLE = os.environ.get("PREPROCESS_RESAMPLE", "bilinear").lower()
+PREPROCESS_JPEG_DRAFT = os.environ.get("PREPROCESS_JPEG_DRAFT", "true").lower() in ("1", "true", "yes")
+if PREPROCESS_RESAMPLE not in RESAMPLING_FILTERS:
+    raise ValueError(f"PREPROCESS_RESAMPLE must be one of {', '.join(RESAMPLING_FILTERS)}")
+
+# Micro-batching window for /predict
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+
+# Worker pools and backpressure
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", "0")) or None
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "1"))
+MAX_IN_FLIGHT = int(os.environ.get("MAX_IN_FLIGHT", "32"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "2"))
+
+# Model loading: "eager" warms up in the background at startup, "lazy" on first request
+MODEL_LOAD_MODE = os.environ.get("MODEL_LOAD_MODE", "eager").lower()
+MODEL_LOAD_RETRIES = int(os.environ.get("MODEL_LOAD_RETRIES", "5"))
+MODEL_LOAD_BACKOFF_SECONDS = float(os.environ.get("MODEL_LOAD_BACKOFF_SECONDS", "2"))
+MODEL_LOAD_MAX_BACKOFF_SECONDS = float(os.environ.get("MODEL_LOAD_MAX_BACKOFF_SECONDS", "60"))
+
+# Prediction cache (0 MB disables it; set a db path to persist across restarts)
+PREDICTION_CACHE_MB = float(os.environ.get("PREDICTION_CACHE_MB", "32"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+PREDICTION_CACHE_DB = os.environ.get("PREDICTION_CACHE_DB", "")
+
+# Concurrent /predict uploads of identical bytes share one preprocessing + inference run
+REQUEST_COALESCING = os.environ.get("REQUEST_COALESCING", "true").lower() in ("1", "true", "yes")
+
+# Test-time augmentation for /predict: views per image (flips, rotations, crops) and default on/off
+TTA_VIEWS = min(int(os.environ.get("TTA_VIEWS", "8")), MAX_VIEWS)
+TTA_ENABLED = os.environ.get("TTA_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Image-quality gate run before inference (blur, exposure, skin ratio); 0 disables a threshold.
+# Off by default: the thresholds are heuristics, not yet calibrated on dermoscopy images
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "false").lower() in ("1", "true", "yes")
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", "10"))
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get("QUALITY_MIN_BRIGHTNESS", "0.08"))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get("QUALITY_MAX_BRIGHTNESS", "0.95"))
+QUALITY_MAX_DARK_FRACTION = float(os.environ.get("QUALITY_MAX_DARK_FRACTION", "0.7"))
+QUALITY_MAX_BRIGHT_FRACTION = float(os.environ.get("QUALITY_MAX_BRIGHT_FRACTION", "0.7"))
+QUALITY_MIN_SKIN_RATIO = float(os.environ.get("QUALITY_MIN_SKIN_RATIO", "0.1"))
+
+# Similar-case search: index built offline with build_index.py ("" disables it)
+SIMILAR_INDEX_DIR = os.environ.get("SIMILAR_INDEX_DIR", os.path.join(BASE_DIR, "data", "similar_index"))
+SIMILAR_MAX_K = int(os.environ.get("SIMILAR_MAX_K", "20"))
+SIMILAR_NPROBE = int(os.environ.get("SIMILAR_NPROBE", "8"))
+SIMILAR_REFRESH_SECONDS = float(os.environ.get("SIMILAR_REFRESH_SECONDS", "5"))
+# Keras layer used as the embedding (default: last flat layer before the classifier head)
+EMBEDDING_LAYER = os.environ.get("EMBEDDING_LAYER", "")
+
+# Grad-CAM explanations (/predict?explain=true): own worker threads, bounded queue, PNG cache
+EXPLAIN_WORKERS = int(os.environ.get("EXPLAIN_WORKERS", "1"))
+EXPLAIN_MAX_PENDING = int(os.environ.get("EXPLAIN_MAX_PENDING", "8"))
+EXPLAIN_CACHE_MB = float(os.environ.get("EXPLAIN_CACHE_MB", "16"))
+EXPLAIN_CACHE_TTL_SECONDS = float(os.environ.get("EXPLAIN_CACHE_TTL_SECONDS", "3600"))
+EXPLAIN_LAYER = os.environ.get("EXPLAIN_LAYER", "")
+EXPLAIN_MAX_WAIT_SECONDS = float(os.environ.get("EXPLAIN_MAX_WAIT_SECONDS", "30"))
+# sqlite store so GET /explanations/{id} works from any worker; on by default with SERVING_MODE=multiprocess
+EXPLAIN_DB = os.environ.get(
+    "EXPLAIN_DB",
+    os.path.join(BASE_DIR, "data", "explanations.db") if SERVING_MODE == "multiprocess" else "",
+)
+
+# Response compression (gzip / brotli) for bodies at least this large; 0 disables it
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_COMPRESS_LEVEL = int(os.environ.get("RESPONSE_COMPRESS_LEVEL", "5"))
+
+# Upload limits: per image, per /predict/batch body, and decoded size (decompression-bomb guard)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+MAX_BATCH_UPLOAD_BYTES = int(float(os.environ.get("MAX_BATCH_UPLOAD_MB", "200")) * 1024 * 1024)
+# Total size of the images in a /predict/batch request once archives are expanded (zip-bomb guard)
+MAX_BATCH_EXPANDED_BYTES = int(float(os.environ.get("MAX_BATCH_EXPANDED_MB", "400")) * 1024 * 1024)
+MAX_IMAGE_PIXELS = int(float(os.environ.get("MAX_IMAGE_MEGAPIXELS", "64")) * 1000 * 1000)
+
+# Asynchronous job API (/jobs): sqlite store, background workers and limits
+JOB_DB = os.environ.get("JOB_DB", os.path.join(BASE_DIR, "data", "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))
+JOB_MAX_FILES = int(os.environ.get("JOB_MAX_FILES", "1000"))
+MAX_JOB_UPLOAD_BYTES = int(float(os.environ.get("JOB_MAX_UPLOAD_MB", "1000")) * 1024 * 1024)
+MAX_JOB_EXPANDED_BYTES = int(float(os.environ.get("JOB_MAX_EXPANDED_MB", "2000")) * 1024 * 1024)
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", "100"))
+JOB_RETENTION_HOURS = float(os.environ.get("JOB_RETENTION_HOURS", "24"))
+JOB_MAX_WAIT_SECONDS = float(os.environ.get("JOB_MAX_WAIT_SECONDS", "60"))
+
+# /predict/batch limits
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "100"))
+MAX_ARCHIVE_MEMBER_BYTES = int(os.environ.get("MAX_ARCHIVE_MEMBER_MB", "20")) * 1024 * 1024
+
+# Hot reload: poll the model files every N seconds (0 disables the watcher)
+MODEL_WATCH_INTERVAL_SECONDS = float(os.environ.get("MODEL_WATCH_INTERVAL_SECONDS", "0"))
+
+# Candidate model evaluation: "shadow" mirrors requests to it, "ab" answers a share of them with it
+EXPERIMENT_MODE = os.environ.get("EXPERIMENT_MODE", "off").lower()
+CANDIDATE_MODEL_PATH = os.environ.get("CANDIDATE_MODEL_PATH", "")
+AB_CANDIDATE_PERCENT = float(os.environ.get("AB_CANDIDATE_PERCENT", "10"))
+SHADOW_SAMPLE_PERCENT = float(os.environ.get("SHADOW_SAMPLE_PERCENT", "100"))
+SHADOW_MAX_PENDING = int(os.environ.get("SHADOW_MAX_PENDING", "16"))
+SHADOW_WORKERS = int(os.environ.get("SHADOW_WORKERS", "1"))
+SHADOW_NUM_THREADS = int(os.environ.get("SHADOW_NUM_THREADS", "1"))
+EXPERIMENT_LOG = os.environ.get("EXPERIMENT_LOG", "")
+
+# Token for /admin endpoints (sent as X-Admin-Token); admin endpoints are disabled when unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Random predictions when no model is available - off unless explicitly enabled
+ALLOW_DEMO_MODE = os.environ.get("ALLOW_DEMO_MODE", "false").lower() in ("1", "true", "yes")
+
+# TFLite interpreter pool (one interpreter per inference worker by default)
+TFLITE_POOL_SIZE = int(os.environ.get("TFLITE_POOL_SIZE", str(INFERENCE_WORKERS)))
+TFLITE_NUM_THREADS = int(os.environ.get("TFLITE_NUM_THREADS", "0")) or None
+ONNX_NUM_THREADS = int(os.environ.get("ONNX_NUM_THREADS", "0")) or None
+
+# Inference backend: "auto" serves the first model file that loads, in BACKEND_ORDER
+# (onnx,tflite,keras; tflite first with SERVING_MODE=multiprocess so workers share one mmap'd model).
+# BACKEND_BENCHMARK=true (opt-in, single-process only) also loads the other files present and serves
+# the fastest one within BACKEND_ACCURACY_TOLERANCE (max P(malignant) delta) of the Keras model
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "auto").lower()
+BACKEND_ORDER = [name.strip() for name in os.environ.get(
+    "BACKEND_ORDER", "tflite,onnx,keras" if SERVING_MODE == "multiprocess" else "onnx,tflite,keras"
+).lower().split(",") if name.strip()]
+BACKEND_BENCHMARK = os.environ.get("BACKEND_BENCHMARK", "false").lower() in ("1", "true", "yes")
+BACKEND_BENCHMARK_RUNS = int(os.environ.get("BACKEND_BENCHMARK_RUNS", "5"))
+BACKEND_BENCHMARK_BATCH = int(os.environ.get("BACKEND_BENCHMARK_BATCH", str(BATCH_MAX_SIZE)))
+BACKEND_ACCURACY_TOLERANCE = float(os.environ.get("BACKEND_ACCURACY_TOLERANCE", "0.02"))
+BACKEND_CALIBRATION_DIR = os.environ.get("BACKEND_CALIBRATION_DIR", "")
+if INFERENCE_BACKEND != "auto" and INFERENCE_BACKEND not in BACKEND_MODEL_PATHS:
+    raise ValueError(f"INFERENCE_BACKEND must be auto or one of {', '.join(BACKEND_MODEL_PATHS)}")
+if not BACKEND_ORDER or any(name not in BACKEND_MODEL_PATHS for name in BACKEND_ORDER):
+    raise ValueError(f"BACKEND_ORDER must list some of {', '.join(BACKEND_MODEL_PATHS)}")
+
 # ==================== DISCLAIMER ====================
 DISCLAIMER = (
     "⚠️ RESEARCH & EDUCATIONAL TOOL ONLY\n"
@@ -263,39 +547,47 @@ DISCLAIMER = (
 )
 
 # ==================== UTILITY FUNCTIONS ====================
-def preprocess_image(image_file) -> np.ndarray:
+def preprocess_image(image_file, timings=None) -> np.ndarray:
     """
     Load and preprocess image from UploadFile.
     
+    - Rejects unsupported formats and oversized images from the header
+    - Decodes JPEGs in draft mode close to the target size
     - Converts to RGB
-    - Resizes to 224x224
-    - Normalizes to [0, 1] range
+    - Resizes to 224x224 (PREPROCESS_RESAMPLE filter)
+    - Normalizes to [0, 1] range with a batch dimension
     """
     try:
-        # Read image from uploaded file
-        img = Image.open(io.BytesIO(image_file))
-        
-        # Convert RGBA/grayscale to RGB
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        
-        # Resize to model input size
-        img = img.resize((INPUT_SIZE, INPUT_SIZE), Image.Resampling.LANCZOS)
-        
-        # Convert to numpy array
-        img_array = np.array(img, dtype=np.float32)
-        
-        # Normalize to [0, 1]
-        img_array = img_array / 255.0
-        
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        return img_array
-    
+        return preprocess_image_fast(
+            image_file,
+            size=INPUT_SIZE,
+            resample=PREPROCESS_RESAMPLE,
+            jpeg_draft=PREPROCESS_JPEG_DRAFT,
+            timings=timings,
+            max_pixels=MAX_IMAGE_PIXELS,
+        )
+    except ImageRejected:
+        raise
     except Exception as e:
         raise ValueError(f"Image preprocessing failed: {str(e)}")
 
+def preprocess_checked(image_file, timings=None) -> np.ndarray:
+    """
+    preprocess_image followed by the quality gate (when QUALITY_GATE is on).
+    
+    Raises ImageQualityRejected for blurry, badly exposed or non-skin photos,
+    so they never reach the model.
+    """
+    img_array = preprocess_image(image_file, timings)
+    if quality_gate is not None:
+        try:
+            quality_gate.check(img_array, timings)
+        except ImageQualityRejected as e:
+            for reason in e.report["reasons"]:
+                QUALITY_REJECTIONS.inc(reason=reason)
+            raise
+    return img_array
+
 def calculate_confidence_band(confidence: float) -> str:
     """
     Calculate confidence band based on confidence score.
@@ -311,6 +603,603 @@ def calculate_confidence_band(confidence: float) -> str:
     else:
         return "Low"
 
+def malignant_probability(outputs: np.ndarray) -> np.ndarray:
+    """P(malignant) per row: sigmoid models output it directly, softmax models in column 1."""
+    outputs = np.asarray(outputs, dtype=np.float32)
+    return outputs[:, 0] if outputs.shape[-1] == 1 else outputs[:, 1]
+
+def run_model_batch(batch: np.ndarray, loaded=None, embeddings=False):
+    """
+    Run one forward pass over a stacked (N, 224, 224, 3) batch.
+
+    Uses the given LoadedModel (the version a request started with), or the
+    active one. Returns the raw model output with one row per image, or
+    (outputs, embeddings) with embeddings=True.
+    """
+    loaded = loaded or model_registry.active
+    if loaded is None:
+        raise RuntimeError("Model is not loaded")
+    if embeddings:
+        return loaded.predict_with_embeddings(batch)
+    return loaded.predict(batch)
+
+# Reject oversized bodies while they are received (plus room for multipart headers)
+app.add_middleware(RequestSizeLimitMiddleware, limits={
+    "/predict": MAX_UPLOAD_BYTES + 64 * 1024,
+    "/predict/batch": MAX_BATCH_UPLOAD_BYTES,
+    "/jobs": MAX_JOB_UPLOAD_BYTES,
+})
+
+# PIL's own decompression-bomb guard, for decode paths that skip the header check
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Worker pools keep decode and inference off the event loop
+pools = WorkerPools(
+    preprocess_workers=PREPROCESS_WORKERS,
+    inference_workers=INFERENCE_WORKERS,
+    max_in_flight=MAX_IN_FLIGHT,
+    retry_after=RETRY_AFTER_SECONDS,
+)
+
+# Repeat uploads of the same image skip decode and inference
+prediction_cache = PredictionCache(
+    max_bytes=PREDICTION_CACHE_MB * 1024 * 1024,
+    ttl_seconds=PREDICTION_CACHE_TTL_SECONDS,
+    db_path=PREDICTION_CACHE_DB or None,
+) if PREDICTION_CACHE_MB > 0 else None
+
+# Unusable photos are rejected before they reach the model
+quality_gate = QualityGate(
+    min_sharpness=QUALITY_MIN_SHARPNESS,
+    min_brightness=QUALITY_MIN_BRIGHTNESS,
+    max_brightness=QUALITY_MAX_BRIGHTNESS,
+    max_dark_fraction=QUALITY_MAX_DARK_FRACTION,
+    max_bright_fraction=QUALITY_MAX_BRIGHT_FRACTION,
+    min_skin_ratio=QUALITY_MIN_SKIN_RATIO,
+) if QUALITY_GATE else None
+
+# Reference lesions for similar-case search (memory-mapped, picks up offline updates)
+similar_index = None
+if SIMILAR_INDEX_DIR and os.path.exists(os.path.join(SIMILAR_INDEX_DIR, "index.json")):
+    try:
+        similar_index = EmbeddingIndex(SIMILAR_INDEX_DIR, nprobe=SIMILAR_NPROBE, refresh_seconds=SIMILAR_REFRESH_SECONDS)
+    except Exception as e:
+        print(f"[WARN] Similar-case index at {SIMILAR_INDEX_DIR} could not be opened: {e}")
+
+# Grad-CAM heatmaps, computed on request after the prediction is returned
+explanations = ExplanationService(
+    preprocess_image,
+    workers=EXPLAIN_WORKERS,
+    max_pending=EXPLAIN_MAX_PENDING,
+    cache_bytes=EXPLAIN_CACHE_MB * 1024 * 1024,
+    ttl_seconds=EXPLAIN_CACHE_TTL_SECONDS,
+    layer_name=EXPLAIN_LAYER or None,
+    db_path=EXPLAIN_DB or None,
+)
+
+# Identical uploads already being predicted wait on that prediction (works with or without the cache)
+inflight_predictions = SingleFlight()
+
+# Shared batching scheduler in front of the model
+batcher = MicroBatcher(
+    run_model_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    executor=pools.inference_pool,
+    max_concurrent_batches=INFERENCE_WORKERS,
+)
+
+# Shadow / A/B evaluation of a candidate model (candidate loaded at startup)
+experiment = ModelExperiment(
+    mode=EXPERIMENT_MODE,
+    candidate_percent=AB_CANDIDATE_PERCENT,
+    shadow_percent=SHADOW_SAMPLE_PERCENT,
+    max_pending=SHADOW_MAX_PENDING,
+    workers=SHADOW_WORKERS,
+    postprocess_fn=lambda pred_output: build_prediction_response(pred_output, "shadow", 0.0),
+    log_path=EXPERIMENT_LOG or None,
+)
+
+# ==================== METRICS ====================
+metrics_registry = Registry()
+
+STAGE_SECONDS = metrics_registry.register(Histogram(
+    "dermavision_stage_duration_seconds",
+    "Per-stage request latency (upload_read, hash, coalesced, cache, decode, resize, quality, queue, invoke, similar, postprocess, serialize, total)",
+    labelnames=("stage",)
+))
+PREDICTIONS = metrics_registry.register(Counter(
+    "dermavision_predictions_total",
+    "Predictions served by mode and confidence band",
+    labelnames=("mode", "confidence_band", "cached")
+))
+REQUEST_ERRORS = metrics_registry.register(Counter(
+    "dermavision_request_errors_total",
+    "Rejected or failed requests",
+    labelnames=("endpoint", "reason")
+))
+QUALITY_REJECTIONS = metrics_registry.register(Counter(
+    "dermavision_quality_rejections_total",
+    "Images rejected by the quality gate, by reason (one image can have several)",
+    labelnames=("reason",)
+))
+metrics_registry.register(Gauge("dermavision_process_rss_bytes", "Resident memory of this process", process_rss_bytes))
+metrics_registry.register(Gauge("dermavision_model_memory_bytes", "Model weights (Keras) or mapped flatbuffer (TFLite) size", lambda: model_registry.active.memory_bytes if model_registry.active else None))
+metrics_registry.register(Gauge("dermavision_model_reloads", "Model versions swapped in without a restart", lambda: model_registry.reloads))
+metrics_registry.register(Gauge("dermavision_model_ready", "1 when the model is loaded and warmed", lambda: 1 if model_status == "ready" else 0))
+metrics_registry.register(Gauge("dermavision_batch_queue_depth", "Images waiting for a forward pass", lambda: batcher.stats()["queue_depth"]))
+metrics_registry.register(Gauge("dermavision_batch_avg_size", "Average images per forward pass", lambda: batcher.stats()["avg_batch_size"]))
+metrics_registry.register(Gauge("dermavision_batches_run", "Forward passes run by the micro-batcher", lambda: batcher.batches_run))
+metrics_registry.register(Gauge("dermavision_in_flight_requests", "Requests currently admitted", lambda: pools.in_flight))
+metrics_registry.register(Gauge("dermavision_rejected_requests", "Requests rejected by backpressure", lambda: pools.rejected))
+metrics_registry.register(Gauge("dermavision_ab_candidate_requests", "Requests answered by the A/B candidate model", lambda: experiment.routed["candidate"]))
+metrics_registry.register(Gauge("dermavision_shadow_comparisons", "Shadow predictions compared with the active model", lambda: experiment.compared))
+metrics_registry.register(Gauge("dermavision_shadow_agreement_rate", "Share of shadow predictions with the same predicted_class", lambda: experiment.agreed / experiment.compared if experiment.compared else None))
+metrics_registry.register(Gauge("dermavision_shadow_dropped", "Shadow predictions skipped because the shadow queue was full", lambda: experiment.dropped))
+metrics_registry.register(Gauge("dermavision_job_items_processed", "Images processed by background jobs", lambda: job_queue.processed_items))
+metrics_registry.register(Gauge("dermavision_quality_checked", "Images measured by the quality gate", lambda: quality_gate.checked if quality_gate else None))
+metrics_registry.register(Gauge("dermavision_quality_rejected", "Images rejected by the quality gate", lambda: quality_gate.rejected if quality_gate else None))
+metrics_registry.register(Gauge("dermavision_similar_searches", "Similar-case index searches", lambda: similar_index.searches if similar_index else None))
+metrics_registry.register(Gauge("dermavision_explanations_computed", "Grad-CAM heatmaps computed", lambda: explanations.computed))
+metrics_registry.register(Gauge("dermavision_explanations_rejected", "Explanation requests refused because the queue was full", lambda: explanations.rejected))
+metrics_registry.register(Gauge("dermavision_explanations_pending", "Explanations waiting or running", lambda: explanations.stats()["pending"]))
+metrics_registry.register(Gauge("dermavision_coalesced_requests", "Requests that reused an identical in-flight prediction", lambda: inflight_predictions.coalesced))
+metrics_registry.register(Gauge("dermavision_coalescing_leaders", "Predictions run on behalf of one or more identical requests", lambda: inflight_predictions.leaders))
+metrics_registry.register(Gauge("dermavision_coalescing_in_flight", "Distinct uploads currently being predicted", lambda: inflight_predictions.in_flight))
+metrics_registry.register(Gauge("dermavision_cache_hits", "Prediction cache hits", lambda: prediction_cache.hits if prediction_cache else None))
+metrics_registry.register(Gauge("dermavision_cache_misses", "Prediction cache misses", lambda: prediction_cache.misses if prediction_cache else None))
+
+# ==================== PREDICTION PIPELINE ====================
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "image/webp"]
+
+async def get_current_model():
+    """
+    Return the LoadedModel to predict with, or None for demo mode.
+    
+    Callers keep using this version for the whole request, even if a
+    reload swaps in a new one meanwhile. In A/B mode this may be the
+    candidate model.
+    
+    Raises 503 when no model is available and demo mode is off.
+    """
+    # Eager mode loads in the background; lazy mode loads on first request
+    if model_status == "ready":
+        current_model = model_registry.active
+    elif MODEL_LOAD_MODE == "lazy" and model_status == "not_loaded":
+        current_model = await pools.run_inference(load_model_lazy)
+    else:
+        current_model = None
+    
+    if current_model is None and not ALLOW_DEMO_MODE:
+        if model_status == "failed":
+            raise HTTPException(status_code=503, detail=f"Model unavailable: {model_error}")
+        raise HTTPException(
+            status_code=503,
+            detail="Model is loading. Please retry shortly.",
+            headers={"Retry-After": str(pools.retry_after)}
+        )
+    
+    return experiment.route(current_model) if current_model is not None else None
+
+def build_prediction_response(pred_output, mode: str, inference_time: float, model_version=None, uncertainty=None) -> dict:
+    """
+    Turn one model output row into the /predict response.
+    
+    pred_output=None generates a random demo prediction. uncertainty (from
+    TTA) is reported next to confidence_band when given.
+    """
+    if pred_output is not None:
+        # === PROCESS OUTPUT ===
+        # Check if model outputs sigmoid (single value) or softmax (2 values)
+        if len(pred_output) == 1:
+            # SIGMOID output: single value represents probability of Malignant (class 1)
+            malignant_prob = float(pred_output[0])
+            benign_prob = 1.0 - malignant_prob
+            
+            # Class prediction: >= 0.5 = Malignant (1), < 0.5 = Benign (0)
+            predicted_class = 1 if malignant_prob >= 0.5 else 0
+            
+            # Confidence is the probability of the predicted class
+            confidence_score = malignant_prob if predicted_class == 1 else benign_prob
+        else:
+            # SOFTMAX output: 2 values [benign_prob, malignant_prob]
+            benign_prob = float(pred_output[0])
+            malignant_prob = float(pred_output[1])
+            
+            # Class prediction: argmax
+            predicted_class = int(np.argmax(pred_output))
+            
+            # Confidence is the probability of the predicted class
+            confidence_score = malignant_prob if predicted_class == 1 else benign_prob
+    else:
+        # Demo mode: Generate random realistic prediction
+        malignant_prob = round(random.uniform(0.0, 1.0), 4)
+        benign_prob = 1.0 - malignant_prob
+        predicted_class = 1 if malignant_prob >= 0.5 else 0
+        confidence_score = malignant_prob if predicted_class == 1 else benign_prob
+    
+    confidence_band = calculate_confidence_band(confidence_score)
+    class_name = CLASS_NAMES[predicted_class]
+    
+    response = {
+        "predicted_class": class_name,
+        "class_index": predicted_class,
+        "confidence": round(confidence_score, 4),
+        "confidence_percentage": round(confidence_score * 100, 2),
+        "confidence_band": confidence_band,
+    }
+    if uncertainty is not None:
+        response["uncertainty"] = uncertainty
+    response.update({
+        "probabilities": {
+            "Benign": round(float(benign_prob), 4),
+            "Malignant": round(float(malignant_prob), 4)
+        },
+        "inference_time_ms": round(inference_time, 2),
+        "disclaimer": DISCLAIMER,
+        "mode": mode,
+        "model_version": model_version,
+        "cached": False,
+        "timestamp": time.time()
+    })
+    return response
+
+def prediction_variant(current_model, tta_views=0, similar_k=0) -> str:
+    """What besides the upload bytes determines a prediction: model version, TTA views, similar-case k and index."""
+    variant = f"{current_model.version}+tta{tta_views}" if tta_views else current_model.version
+    if similar_k:
+        variant += f"+knn{similar_k}@{similar_index.version}"
+    return variant
+
+def similar_cases_unavailable(current_model):
+    """Why similar-case search cannot run for this model, or None if it can."""
+    if similar_index is None:
+        return "no reference index is loaded"
+    if current_model is None:
+        return "no model is loaded"
+    if not current_model.has_embeddings:
+        return "the model has no embedding output"
+    if similar_index.model_version and similar_index.model_version != current_model.version:
+        return f"the index was built for model {similar_index.model_version}, not {current_model.version}"
+    return None
+
+def explanation_unavailable(current_model):
+    """Why this model cannot be explained, or None if it can."""
+    if current_model is None:
+        return "no model is loaded"
+    if not current_model.supports_gradients:
+        return f"Grad-CAM needs the Keras model (the {current_model.backend.label} backend has no gradients)"
+    return None
+
+async def request_explanation(contents, current_model) -> dict:
+    """
+    Queue a Grad-CAM explanation of one upload and describe it for the response.
+    
+    Never waits for the heatmap itself; status is "pending", "done" (cached),
+    "busy" (queue full, retry later) or "unavailable".
+    """
+    reason = explanation_unavailable(current_model)
+    if reason:
+        return {"status": "unavailable", "reason": reason}
+    content_hash = await pools.run_preprocess(hash_bytes, contents)
+    explanation_id = ExplanationService.make_id(content_hash, current_model.version)
+    status = await pools.run_preprocess(explanations.request, explanation_id, contents, current_model)
+    if status == "busy":
+        return {"status": status}
+    return {"id": explanation_id, "status": status, "url": f"/explanations/{explanation_id}"}
+
+async def find_similar_cases(embedding: np.ndarray, k: int, timings=None) -> list:
+    """Search the reference index on the preprocessing pool (CPU-bound, memory-mapped reads)."""
+    search_start = time.time()
+    cases = await pools.run_preprocess(similar_index.search, embedding, k)
+    if timings is not None:
+        timings.add("similar", (time.time() - search_start) * 1000)
+    return cases
+
+async def prepare_prediction(contents: bytes, current_model, timings=None, tta_views=0, content_hash=None, similar_k=0):
+    """
+    Stage 1: cache lookup and preprocessing.
+    
+    Returns (cached_response, None, None) on a cache hit, otherwise
+    (None, cache_key, img_array) ready for complete_prediction.
+    content_hash skips hashing the upload again when the caller already did.
+    """
+    # Serve repeat uploads from the cache (keyed on bytes + model version + TTA views)
+    cache_key = None
+    if prediction_cache is not None and current_model is not None:
+        lookup_start = time.time()
+        if content_hash is None:
+            content_hash = await pools.run_preprocess(hash_bytes, contents)
+        cache_key = PredictionCache.make_key(content_hash, prediction_variant(current_model, tta_views, similar_k))
+        if prediction_cache.persistent:
+            # The sqlite tier blocks; keep it off the event loop
+            cached = await pools.run_preprocess(prediction_cache.get, cache_key)
+        else:
+            cached = prediction_cache.get(cache_key)
+        lookup_ms = (time.time() - lookup_start) * 1000
+        if timings is not None:
+            timings.add("cache", lookup_ms)
+        if cached is not None:
+            cached["cached"] = True
+            cached["inference_time_ms"] = round(lookup_ms, 2)
+            cached["timestamp"] = time.time()
+            return cached, None, None
+    
+    # Preprocess image and check its quality (decode/resize on the preprocessing pool)
+    img_array = await pools.run_preprocess(preprocess_checked, contents, timings)
+    return None, cache_key, img_array
+
+async def run_tta(img_array: np.ndarray, current_model, views: int, timings=None, embeddings=False):
+    """
+    Run `views` augmented copies of one image as a single batch.
+    
+    Returns (mean output, uncertainty, mean embedding or None).
+    """
+    batch = await pools.run_preprocess(augment_views, img_array, views)
+    invoke_start = time.time()
+    result = await pools.run_inference(run_model_batch, batch, current_model, embeddings)
+    if timings is not None:
+        timings.add("invoke", (time.time() - invoke_start) * 1000)
+    outputs, view_embeddings = result if embeddings else (result, None)
+    pred_output, uncertainty = summarize_views(outputs, malignant_probability(outputs))
+    return pred_output, uncertainty, view_embeddings.mean(axis=0) if embeddings else None
+
+async def complete_prediction(img_array: np.ndarray, cache_key, current_model, timings=None, tta_views=0,
+                              similar_k=0) -> dict:
+    """
+    Stage 2: (batched) inference and response building.
+    
+    similar_k > 0 takes the embedding from the same forward pass and adds
+    the closest reference cases (callers check similar_cases_unavailable first).
+    """
+    # Record inference time
+    start_time = time.time()
+    uncertainty = None
+    embedding = None
+    
+    # Use actual model if available, otherwise use demo prediction
+    if current_model is not None:
+        if tta_views:
+            # All views of this image in one forward pass, averaged
+            pred_output, uncertainty, embedding = await run_tta(img_array, current_model, tta_views, timings, bool(similar_k))
+        elif similar_k:
+            pred_output, embedding = await batcher.submit(img_array, timings, current_model, embeddings=True)
+        else:
+            # Batched with other concurrent requests into one forward pass
+            pred_output = await batcher.submit(img_array, timings, current_model)
+        mode = f"production ({current_model.backend.label})"
+        version = current_model.version
+    else:
+        pred_output = None
+        mode = "demo"
+        version = None
+    
+    inference_time = (time.time() - start_time) * 1000  # Convert to ms
+    similar_cases = await find_similar_cases(embedding, similar_k, timings) if embedding is not None else None
+    
+    postprocess_start = time.time()
+    response = build_prediction_response(pred_output, mode, inference_time, version, uncertainty)
+    if similar_cases is not None:
+        response["similar_cases"] = similar_cases
+    if timings is not None:
+        timings.add("postprocess", (time.time() - postprocess_start) * 1000)
+    
+    # Demo predictions are random, so never cache them
+    if cache_key is not None:
+        prediction_cache.put(cache_key, response)
+    
+    # Mirror to the candidate model off the critical path (no-op unless shadow mode);
+    # TTA averages are not comparable with a single shadow pass
+    if current_model is not None and not tta_views:
+        experiment.shadow(img_array, response, current_model)
+    
+    return response
+
+async def _run_prediction(contents: bytes, current_model, timings=None, tta_views=0, content_hash=None,
+                          similar_k=0) -> dict:
+    cached, cache_key, img_array = await prepare_prediction(
+        contents, current_model, timings, tta_views, content_hash, similar_k
+    )
+    if cached is not None:
+        return cached
+    return await complete_prediction(img_array, cache_key, current_model, timings, tta_views, similar_k)
+
+async def run_prediction(contents: bytes, current_model, timings=None, tta_views=0, similar_k=0) -> dict:
+    """
+    Full single-image pipeline used by /predict.
+    
+    With REQUEST_COALESCING, a request whose upload bytes (and model version /
+    TTA views) match a prediction already in flight waits for that one
+    instead of preprocessing and running the model again. Its timings get a
+    "coalesced" stage instead of the leader's decode / inference stages.
+    """
+    # Demo predictions are random and cheap, so there is nothing to share
+    if not REQUEST_COALESCING or current_model is None:
+        return await _run_prediction(contents, current_model, timings, tta_views, similar_k=similar_k)
+    
+    hash_start = time.time()
+    content_hash = await pools.run_preprocess(hash_bytes, contents)
+    if timings is not None:
+        timings.add("hash", (time.time() - hash_start) * 1000)
+    
+    wait_start = time.time()
+    response, shared = await inflight_predictions.run(
+        (content_hash, prediction_variant(current_model, tta_views, similar_k)),
+        lambda: _run_prediction(contents, current_model, timings, tta_views, content_hash, similar_k),
+    )
+    if not shared:
+        return response
+    
+    if timings is not None:
+        timings.add("coalesced", (time.time() - wait_start) * 1000)
+    # Each request gets its own copy of the shared response
+    return dict(response)
+
+def record_prediction_metrics(response: dict, timings: StageTimings):
+    """Feed one finished prediction into the /metrics histograms and counters."""
+    for stage, ms in timings.stages.items():
+        STAGE_SECONDS.observe(ms / 1000, stage=stage)
+    STAGE_SECONDS.observe(timings.total_ms() / 1000, stage="total")
+    PREDICTIONS.inc(mode=response["mode"], confidence_band=response["confidence_band"], cached=str(response["cached"]).lower())
+
+def batch_item_error(item: dict, error: Exception) -> dict:
+    if isinstance(error, ImageQualityRejected):
+        item["error"] = str(error)
+        item["quality"] = error.report
+    elif isinstance(error, ValueError):
+        item["error"] = str(error)
+    else:
+        item["error"] = f"Prediction failed: {str(error)}"
+    return item
+
+async def iter_batch_results(items: list, current_model):
+    """
+    Yield /predict/batch results chunk by chunk.
+    
+    All items start preprocessing at once (bounded by the preprocessing pool).
+    Each chunk of BATCH_MAX_SIZE is then submitted together so the
+    micro-batcher runs it as one forward pass while later chunks decode.
+    """
+    prepared = []
+    timings = [StageTimings() for _ in items]
+    for (name, content_type, contents), item_timings in zip(items, timings):
+        if content_type in ALLOWED_CONTENT_TYPES:
+            prepared.append(asyncio.ensure_future(prepare_prediction(contents, current_model, item_timings)))
+        else:
+            prepared.append(None)
+    
+    try:
+        for chunk_start in range(0, len(items), BATCH_MAX_SIZE):
+            chunk = range(chunk_start, min(chunk_start + BATCH_MAX_SIZE, len(items)))
+            results = {}
+            ready = {}
+            
+            # Wait for the whole chunk to be decoded before submitting any of it
+            for i in chunk:
+                item = {"index": i, "filename": items[i][0]}
+                results[i] = item
+                if prepared[i] is None:
+                    item["error"] = "Invalid file type. Please upload JPG, PNG, or WebP."
+                    continue
+                try:
+                    cached, cache_key, img_array = await prepared[i]
+                except Exception as e:
+                    batch_item_error(item, e)
+                    continue
+                if cached is not None:
+                    item["result"] = cached
+                else:
+                    ready[i] = (img_array, cache_key)
+            
+            pending = {
+                i: asyncio.ensure_future(complete_prediction(img_array, cache_key, current_model, timings[i]))
+                for i, (img_array, cache_key) in ready.items()
+            }
+            for i, task in pending.items():
+                try:
+                    results[i]["result"] = await task
+                except Exception as e:
+                    batch_item_error(results[i], e)
+            
+            for i in chunk:
+                if "result" in results[i]:
+                    record_prediction_metrics(results[i]["result"], timings[i])
+                yield results[i]
+    finally:
+        for task in prepared:
+            if task is not None:
+                task.cancel()
+
+async def collect_batch_uploads(files, buffers: list, max_files=None, max_total_bytes=None) -> list:
+    """
+    Read uploads and expand archives into (filename, content_type, contents) items.
+    
+    Large uploads are mmap'd rather than copied; they are appended to
+    buffers and must be passed to release_upload once the batch is done.
+    413 if the images add up to more than max_total_bytes once expanded.
+    """
+    max_files = max_files or MAX_BATCH_FILES
+    max_total_bytes = max_total_bytes or MAX_BATCH_EXPANDED_BYTES
+    items = []
+    total_bytes = 0
+    for upload in files:
+        if is_archive(upload.filename, upload.content_type):
+            # Bounded by the request body limit rather than the per-image one
+            contents = await read_upload(upload)
+            buffers.append(contents)
+            try:
+                members = await pools.run_preprocess(
+                    expand_archive, upload.filename, contents, max_files, MAX_ARCHIVE_MEMBER_BYTES,
+                    max_total_bytes - total_bytes
+                )
+            except ArchiveTooLarge:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Images are larger than {max_total_bytes // (1024 * 1024)}MB in total once expanded"
+                )
+            items.extend(members)
+            total_bytes += sum(len(member[2]) for member in members)
+        else:
+            contents = await read_upload(upload, MAX_UPLOAD_BYTES)
+            buffers.append(contents)
+            items.append((upload.filename, upload.content_type, contents))
+            total_bytes += len(contents)
+        
+        if len(items) > max_files:
+            raise HTTPException(status_code=413, detail=f"Too many images (max {max_files} per batch)")
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in the upload.")
+    return items
+
+def render_response(request: Request, content, compact=False, encoding=None, status_code=200):
+    """Serialize for the client: JSON or msgpack, compressed if large and accepted."""
+    return encode_response(
+        content,
+        accept_encoding=request.headers.get("accept-encoding"),
+        status_code=status_code,
+        use_msgpack=wants_msgpack(request.headers.get("accept"), encoding),
+        compact=compact,
+        min_compress_bytes=RESPONSE_COMPRESS_MIN_BYTES,
+        compress_level=RESPONSE_COMPRESS_LEVEL,
+    )
+
+def batch_content(results: list, compact=False, **extra) -> dict:
+    """The /predict/batch (and job results) body; compact drops static text per item."""
+    content = dict(extra)
+    content.update({
+        "count": len(results),
+        "errors": sum(1 for item in results if "error" in item),
+        "results": [compact_batch_item(item) for item in results] if compact else results
+    })
+    if compact:
+        content["disclaimer"] = DISCLAIMER_REF
+    return content
+
+# ==================== JOBS ====================
+def jobs_can_run() -> bool:
+    """Claim jobs only once predictions can be served (lazy mode loads on the first job)."""
+    if model_status == "ready" or ALLOW_DEMO_MODE:
+        return True
+    return MODEL_LOAD_MODE == "lazy" and model_status == "not_loaded"
+
+async def process_job_items(items):
+    """JobQueue hook: run one chunk of job images through the /predict/batch pipeline."""
+    current_model = await get_current_model()
+    async for item in iter_batch_results(items, current_model):
+        yield item
+
+# Bulk predictions persisted in sqlite and processed in the background
+job_queue = JobQueue(
+    JobStore(JOB_DB),
+    process_job_items,
+    ready_fn=jobs_can_run,
+    workers=JOB_WORKERS,
+    chunk_size=BATCH_MAX_SIZE,
+    max_queued=JOB_MAX_QUEUED,
+    retention_seconds=JOB_RETENTION_HOURS * 3600,
+)
+
 # ==================== API ENDPOINTS ====================
 
 @app.get("/")
@@ -318,128 +1207,341 @@ async def root():
     """Health check endpoint."""
     return {
         "status": "running",
-        "model": "loaded" if model else "not_loaded",
+        "model": "loaded" if model_status == "ready" else "not_loaded",
         "app": "DermaVision API"
     }
 
+@app.get("/ready")
+async def ready():
+    """Readiness endpoint: ready / loading / failed."""
+    if model_status == "ready":
+        active = model_registry.active
+        return {
+            "status": "ready",
+            "backend": active.backend.name,
+            "model_version": active.version
+        }
+    
+    status = "failed" if model_status == "failed" else "loading"
+    content = {"status": status}
+    if model_error:
+        content["error"] = model_error
+    return JSONResponse(status_code=503, content=content)
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(
+    request: Request,
+    file: UploadFile = File(...),
+    tta: Optional[bool] = None,
+    similar: int = 0,
+    explain: bool = False,
+    response_format: Optional[str] = Query(None, alias="format"),
+    encoding: Optional[str] = None,
+):
     """
     Make a skin lesion prediction.
     
     Input: An uploaded image file (JPG, PNG, WebP)
     Output: JSON with prediction, confidence, and metadata
+    
+    tta=true (default TTA_ENABLED) averages TTA_VIEWS flipped / rotated /
+    cropped views in one batched pass and adds an uncertainty estimate.
+    similar=K adds the K most similar reference lesions (similar_cases),
+    searched with the embedding from the same forward pass.
+    explain=true queues a Grad-CAM heatmap and returns its id and URL
+    (GET /explanations/{id}); the prediction does not wait for it.
+    format=compact (or Accept: application/vnd.dermavision.compact+json) drops
+    the disclaimer and derived fields; encoding=msgpack (or Accept:
+    application/msgpack) returns msgpack instead of JSON.
     """
     
+    timings = StageTimings()
+    
     # Validate file type
-    if file.content_type not in ["image/jpeg", "image/png", "image/webp"]:
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
+        REQUEST_ERRORS.inc(endpoint="predict", reason="invalid_type")
         raise HTTPException(
             status_code=400,
             detail="Invalid file type. Please upload JPG, PNG, or WebP."
         )
+    if not 0 <= similar <= SIMILAR_MAX_K:
+        REQUEST_ERRORS.inc(endpoint="predict", reason="400")
+        raise HTTPException(status_code=400, detail=f"similar must be between 0 and {SIMILAR_MAX_K}")
+    
+    # Backpressure: reject fast instead of queueing without bound
+    if not pools.try_acquire():
+        REQUEST_ERRORS.inc(endpoint="predict", reason="overloaded")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please retry shortly.",
+            headers={"Retry-After": str(pools.retry_after)}
+        )
     
+    contents = None
     try:
-        # Read file content
-        contents = await file.read()
+        # Small uploads are read, large ones mmap'd from Starlette's spooled temp file
+        with timings.stage("upload_read"):
+            contents = await read_upload(file, MAX_UPLOAD_BYTES)
         
-        # Preprocess image
-        img_array = preprocess_image(contents)
+        current_model = await get_current_model()
+        if similar:
+            reason = similar_cases_unavailable(current_model)
+            if reason:
+                raise HTTPException(status_code=503, detail=f"Similar-case search unavailable: {reason}")
         
-        # Record inference time
-        start_time = time.time()
+        tta_views = TTA_VIEWS if (TTA_ENABLED if tta is None else tta) else 0
+        response = await run_prediction(contents, current_model, timings, tta_views, similar)
+        if explain:
+            # A copy: the response object may be shared with the cache or coalesced requests
+            response = {**response, "explanation": await request_explanation(contents, current_model)}
         
-        # Load model lazily on first request
-        current_model = load_model_lazy()
+        compact = wants_compact(request.headers.get("accept"), response_format)
+        with timings.stage("serialize"):
+            http_response = render_response(
+                request, compact_prediction(response) if compact else response, compact, encoding
+            )
         
-        # Use actual model if available, otherwise use demo prediction
-        if current_model is not None:
-            # === PREDICTION LOGIC ===
-            if is_tflite:
-                # TFLite Inference
-                input_details = current_model.get_input_details()
-                output_details = current_model.get_output_details()
-                
-                # Set input tensor
-                current_model.set_tensor(input_details[0]['index'], img_array)
-                
-                # Run inference
-                current_model.invoke()
-                
-                # Get output tensor
-                result = current_model.get_tensor(output_details[0]['index'])
-                pred_output = result[0] # Single batch
-                
-            else:
-                # Keras Inference
-                prediction = current_model.predict(img_array, verbose=0)
-                pred_output = prediction[0]
-            
-            # === PROCESS OUTPUT ===
-            # Check if model outputs sigmoid (single value) or softmax (2 values)
-            if len(pred_output) == 1:
-                # SIGMOID output: single value represents probability of Malignant (class 1)
-                malignant_prob = float(pred_output[0])
-                benign_prob = 1.0 - malignant_prob
-                
-                # Class prediction: >= 0.5 = Malignant (1), < 0.5 = Benign (0)
-                predicted_class = 1 if malignant_prob >= 0.5 else 0
-                
-                # Confidence is the probability of the predicted class
-                confidence_score = malignant_prob if predicted_class == 1 else benign_prob
-            else:
-                # SOFTMAX output: 2 values [benign_prob, malignant_prob]
-                benign_prob = float(pred_output[0])
-                malignant_prob = float(pred_output[1])
-                
-                # Class prediction: argmax
-                predicted_class = int(np.argmax(pred_output))
-                
-                # Confidence is the probability of the predicted class
-                confidence_score = malignant_prob if predicted_class == 1 else benign_prob
-            
-            mode = "production (TFLite)" if is_tflite else "production (Keras)"
-        else:
-            # Demo mode: Generate random realistic prediction
-            malignant_prob = round(random.uniform(0.0, 1.0), 4)
-            benign_prob = 1.0 - malignant_prob
-            predicted_class = 1 if malignant_prob >= 0.5 else 0
-            confidence_score = malignant_prob if predicted_class == 1 else benign_prob
-            mode = "demo"
-        
-        inference_time = (time.time() - start_time) * 1000  # Convert to ms
-        confidence_band = calculate_confidence_band(confidence_score)
-        class_name = CLASS_NAMES[predicted_class]
-        
-        # Prepare response
-        response = {
-            "predicted_class": class_name,
-            "class_index": predicted_class,
-            "confidence": round(confidence_score, 4),
-            "confidence_percentage": round(confidence_score * 100, 2),
-            "confidence_band": confidence_band,
-            "probabilities": {
-                "Benign": round(float(benign_prob), 4),
-                "Malignant": round(float(malignant_prob), 4)
-            },
-            "inference_time_ms": round(inference_time, 2),
-            "disclaimer": DISCLAIMER,
-            "mode": mode,
-            "timestamp": time.time()
-        }
-        
-        return response
+        record_prediction_metrics(response, timings)
+        http_response.headers["Server-Timing"] = timings.server_timing()
+        return http_response
     
+    except HTTPException as e:
+        REQUEST_ERRORS.inc(endpoint="predict", reason=str(e.status_code))
+        raise
+    except ImageQualityRejected as e:
+        REQUEST_ERRORS.inc(endpoint="predict", reason="quality")
+        return JSONResponse(status_code=e.status_code, content=e.response_body())
+    except ImageRejected as e:
+        REQUEST_ERRORS.inc(endpoint="predict", reason=str(e.status_code))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except ValueError as e:
+        REQUEST_ERRORS.inc(endpoint="predict", reason="400")
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        REQUEST_ERRORS.inc(endpoint="predict", reason="500")
         raise HTTPException(
             status_code=500,
             detail=f"Prediction failed: {str(e)}"
         )
+    finally:
+        release_upload(contents)
+        pools.release()
+
+@app.post("/predict/batch")
+async def predict_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    stream: bool = False,
+    response_format: Optional[str] = Query(None, alias="format"),
+    encoding: Optional[str] = None,
+):
+    """
+    Predict many images in one request.
+    
+    Input: Several image files and/or a zip/tar archive of images
+    Output: Per-image results in the /predict schema, with per-item errors.
+            With ?stream=true results are sent as NDJSON as they finish.
+            format / encoding and compression work as for /predict.
+    """
+    # The whole batch counts as one in-flight request
+    if not pools.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please retry shortly.",
+            headers={"Retry-After": str(pools.retry_after)}
+        )
+    
+    timings = StageTimings()
+    buffers = []
+    
+    def finish():
+        for contents in buffers:
+            release_upload(contents)
+        pools.release()
+    
+    try:
+        with timings.stage("upload_read"):
+            items = await collect_batch_uploads(files, buffers)
+        current_model = await get_current_model()
+    except HTTPException:
+        finish()
+        raise
+    except ValueError as e:
+        finish()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        finish()
+        raise
+    
+    compact = wants_compact(request.headers.get("accept"), response_format)
+    if stream:
+        async def ndjson():
+            try:
+                async for item in iter_batch_results(items, current_model):
+                    yield dumps_json(compact_batch_item(item) if compact else item) + b"\n"
+            finally:
+                finish()
+        
+        # No Server-Timing here: headers go out before any prediction has run
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    
+    try:
+        results = [item async for item in iter_batch_results(items, current_model)]
+    finally:
+        finish()
+    
+    with timings.stage("serialize"):
+        http_response = render_response(request, batch_content(results, compact), compact, encoding)
+    http_response.headers["Server-Timing"] = timings.server_timing()
+    return http_response
+
+@app.post("/jobs")
+async def submit_job(files: List[UploadFile] = File(...), priority: int = 0):
+    """
+    Queue images for background prediction and return a job id right away.
+    
+    Input: Image files and/or zip/tar archives (up to JOB_MAX_FILES images)
+    Output: 202 with the job; poll GET /jobs/{job_id}, then GET /jobs/{job_id}/results.
+            Higher priority jobs are processed first.
+    """
+    if not pools.try_acquire():
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy. Please retry shortly.",
+            headers={"Retry-After": str(pools.retry_after)}
+        )
+    
+    buffers = []
+    try:
+        items = await collect_batch_uploads(files, buffers, JOB_MAX_FILES, MAX_JOB_EXPANDED_BYTES)
+        job = await job_queue.submit(items, priority)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "60"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        for contents in buffers:
+            release_upload(contents)
+        pools.release()
+    
+    job["status_url"] = f"/jobs/{job['id']}"
+    job["results_url"] = f"/jobs/{job['id']}/results"
+    return JSONResponse(status_code=202, content=job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Job status and progress (completed / total).
+    
+    wait=N long-polls for up to N seconds (max JOB_MAX_WAIT_SECONDS) until the job finishes.
+    """
+    job = await job_queue.get(job_id, wait=min(max(wait, 0), JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["results_url"] = f"/jobs/{job_id}/results"
+    return job
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(
+    request: Request,
+    job_id: str,
+    response_format: Optional[str] = Query(None, alias="format"),
+    encoding: Optional[str] = None,
+):
+    """Per-image results in the /predict/batch format (partial while the job runs)."""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    results = await job_queue.results(job_id)
+    compact = wants_compact(request.headers.get("accept"), response_format)
+    content = batch_content(results, compact, id=job_id, status=job["status"])
+    return render_response(request, content, compact, encoding)
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job (finished images keep their results)."""
+    if not await job_queue.cancel(job_id):
+        job = await job_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    return {"id": job_id, "status": "cancelled"}
+
+@app.get("/explanations/{explanation_id}")
+async def get_explanation(explanation_id: str, wait: float = 0):
+    """
+    Grad-CAM overlay (PNG) requested with /predict?explain=true.
+    
+    202 while it is being computed; wait=N long-polls for up to N seconds
+    (max EXPLAIN_MAX_WAIT_SECONDS). 404 once it has expired from the cache.
+    """
+    status, png, error = await explanations.wait(explanation_id, min(max(wait, 0), EXPLAIN_MAX_WAIT_SECONDS))
+    if status == "done":
+        return Response(content=png, media_type="image/png", headers={
+            "Cache-Control": f"private, max-age={int(EXPLAIN_CACHE_TTL_SECONDS)}",
+            "ETag": f'"{explanation_id}"',
+        })
+    if status == "pending":
+        return JSONResponse(
+            status_code=202,
+            content={"id": explanation_id, "status": status},
+            headers={"Retry-After": "1"}
+        )
+    if status == "failed":
+        raise HTTPException(status_code=500, detail=f"Explanation failed: {error}")
+    raise HTTPException(status_code=404, detail="Explanation not found or expired")
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text-format metrics."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_admin(token):
+    """Check the X-Admin-Token header against ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN).")
+    if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+@app.post("/admin/reload")
+async def reload_model(force: bool = False, wait: bool = False, x_admin_token: str = Header(None)):
+    """
+    Load the model on disk and swap it in without a restart.
+    
+    - Runs in the background; in-flight requests finish on the old version
+    - Skipped when the file's content hash matches the active version (unless force=true)
+    - wait=true blocks until the reload finishes and returns its result
+    """
+    require_admin(x_admin_token)
+    if model_status == "loading":
+        raise HTTPException(status_code=409, detail="Initial model load still in progress.")
+    if model_registry.reloading:
+        raise HTTPException(status_code=409, detail="A reload is already in progress.")
+    
+    if wait:
+        result = await asyncio.get_running_loop().run_in_executor(None, model_registry.reload, force)
+        return JSONResponse(status_code=500 if result["status"] == "failed" else 200, content=result)
+    
+    threading.Thread(target=model_registry.reload, args=(force,), name="model-reload", daemon=True).start()
+    return JSONResponse(status_code=202, content={"status": "reloading", "active_version": model_registry.version})
+
+def backend_info(active):
+    """The serving backend and how it was chosen, for /info."""
+    if active is None:
+        return None
+    return {
+        "selected": active.backend.name,
+        "mode": INFERENCE_BACKEND,
+        "order": BACKEND_ORDER if INFERENCE_BACKEND == "auto" else None,
+        "benchmark": BACKEND_BENCHMARK,
+        "stats": active.backend.stats(),
+        "self_benchmark": active.selection,
+    }
 
 @app.get("/info")
 async def info():
     """Get API and model information."""
+    active = model_registry.active
     return {
         "app_name": "DermaVision",
         "version": "1.0.0",
@@ -447,8 +1549,26 @@ async def info():
         "model_input_size": INPUT_SIZE,
         "classes": CLASS_NAMES,
         "confidence_thresholds": CONFIDENCE_THRESHOLDS,
-        "model_type": "TFLite" if is_tflite else "Keras H5",
-        "model_loaded": model is not None,
+        "backend": backend_info(active),
+        "model_loaded": model_status == "ready",
+        "model_status": model_status,
+        "model_version": model_registry.version,
+        "model_registry": model_registry.stats(),
+        "runtime": active.backend.runtime if active else None,
+        "batching": batcher.stats(),
+        "workers": pools.stats(),
+        "prediction_cache": prediction_cache.stats() if prediction_cache is not None else None,
+        "coalescing": inflight_predictions.stats() if REQUEST_COALESCING else None,
+        "quality_gate": quality_gate.stats() if quality_gate is not None else None,
+        "explanations": {**explanations.stats(), "unavailable_reason": explanation_unavailable(active)},
+        "similar_cases": {
+            "index": similar_index.stats() if similar_index is not None else None,
+            "max_k": SIMILAR_MAX_K,
+            "unavailable_reason": similar_cases_unavailable(active),
+        },
+        "experiment": experiment.stats() if EXPERIMENT_MODE != "off" else None,
+        "jobs": await job_queue.stats(),
+        "tta": {"enabled_by_default": TTA_ENABLED, "views": TTA_VIEWS},
         "disclaimer": DISCLAIMER
     }
 
@@ -468,7 +1588,8 @@ if __name__ == "__main__":
     print("DermaVision Backend Server")
     print("="*60)
     print(f"TFLite Path: {TFLITE_MODEL_PATH}")
+    print(f"ONNX Path: {ONNX_MODEL_PATH}")
     print(f"H5 Path: {H5_MODEL_PATH}")
-    print(f"Model Loaded: {'[OK]' if model else '[NO]'}")
+    print(f"Model Loaded: {'[OK]' if model_registry.active else '[NO]'}")
     print("Start with: uvicorn main:app --reload --host 0.0.0.0 --port 8000")
     print("="*60 + "\n")
@@ -0,0 +1,136 @@
+"""
+Image preprocessing for DermaVision.
+
+The fast path decodes JPEGs close to the target size with PIL's draft mode
+(DCT scaling, so a 12MP photo is never fully decoded), lets PIL reduce by an
+integer factor before resampling, and writes the result straight into a
+float32 buffer with a single fused scale. preprocess_image_reference keeps
+the original full-decode + LANCZOS pipeline for accuracy checks.
+"""
+import io
+import mmap
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+RESAMPLING_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Formats PIL may decode, checked from the file header (MPO = multi-picture camera JPEG)
+ALLOWED_FORMATS = ("JPEG", "MPO", "PNG", "WEBP")
+
+# Resample from at most this multiple of the target size; PIL reduces by an
+# integer factor first, which is much cheaper than filtering the full image.
+REDUCING_GAP = 2.0
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+class ImageRejected(ValueError):
+    """An image refused from its header, before decoding (status_code for the HTTP error)."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def open_image(image_file):
+    """Accept raw bytes, an mmap of the upload, or a binary file object."""
+    if isinstance(image_file, (bytes, bytearray, memoryview)):
+        image_file = io.BytesIO(image_file)
+    elif isinstance(image_file, mmap.mmap):
+        image_file.seek(0)
+    try:
+        return Image.open(image_file)
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(str(e), status_code=413)
+
+
+def check_image_header(img, max_pixels=None):
+    """
+    Reject an opened (not yet decoded) image by format and dimensions.
+
+    Image.open only parses the header, so this runs before any pixel data
+    is decompressed - a small PNG that inflates to gigapixels never is.
+    """
+    if img.format not in ALLOWED_FORMATS:
+        raise ImageRejected(f"Unsupported image format: {img.format or 'unknown'}", status_code=415)
+    width, height = img.size
+    if width <= 0 or height <= 0:
+        raise ImageRejected("Image has no pixels")
+    if max_pixels and width * height > max_pixels:
+        raise ImageRejected(
+            f"Image is too large ({width}x{height}, max {max_pixels / 1e6:.0f} megapixels)",
+            status_code=413,
+        )
+
+
+def preprocess_image_fast(image_file, size=224, resample="bilinear", jpeg_draft=True, out=None, timings=None,
+                          max_pixels=None) -> np.ndarray:
+    """
+    Decode, resize and normalize one image to a (1, size, size, 3) float32 array.
+
+    - jpeg_draft: let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers size
+    - resample: one of RESAMPLING_FILTERS
+    - out: optional preallocated (1, size, size, 3) or (size, size, 3) float32 buffer
+    - timings: optional StageTimings; records "decode" and "resize" stages
+    - max_pixels: reject larger images from the header, before decoding
+    """
+    start = time.perf_counter()
+    img = open_image(image_file)
+    check_image_header(img, max_pixels)
+
+    # Decode close to the target size (no-op for non-JPEG formats)
+    if jpeg_draft and img.format == "JPEG":
+        img.draft("RGB", (int(size * REDUCING_GAP), int(size * REDUCING_GAP)))
+    img.load()
+
+    # Convert RGBA/grayscale to RGB
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    decoded = time.perf_counter()
+    img = img.resize((size, size), RESAMPLING_FILTERS[resample], reducing_gap=REDUCING_GAP)
+
+    if out is None:
+        out = np.empty((1, size, size, 3), dtype=np.float32)
+
+    # uint8 -> float32 in [0, 1] in one pass, written into the output buffer
+    np.multiply(np.asarray(img), _SCALE, out=out.reshape(size, size, 3), casting="unsafe")
+
+    if timings is not None:
+        timings.add("decode", (decoded - start) * 1000)
+        timings.add("resize", (time.perf_counter() - decoded) * 1000)
+    return out
+
+
+def preprocess_image_reference(image_file, size=224) -> np.ndarray:
+    """The original pipeline: full decode, LANCZOS resize, /255, expand_dims."""
+    img = open_image(image_file)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img = img.resize((size, size), Image.Resampling.LANCZOS)
+    img_array = np.array(img, dtype=np.float32)
+    img_array = img_array / 255.0
+    return np.expand_dims(img_array, axis=0)
+
+
+def list_image_files(folder, limit=None):
+    """Sorted image paths under a folder (recursive), optionally capped."""
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, names in os.walk(folder)
+        for name in names
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
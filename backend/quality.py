@@ -0,0 +1,159 @@
+"""
+Image-quality gate for DermaVision.
+
+Blurry, badly exposed or non-skin photos still get a confident-looking
+prediction from the CNN. This runs a few vectorized NumPy checks on the
+(224, 224, 3) array preprocessing already produced, and rejects unusable
+images before the model is called:
+
+- sharpness: variance of the 4-neighbour Laplacian of luminance (0-255 scale)
+- exposure: mean luminance and the share of near-black / near-white pixels
+- skin ratio: share of pixels inside a YCbCr skin-tone box
+
+The checks cost well under a millisecond on the downsampled array. All
+thresholds are configurable; a threshold of 0 (or 1 for the clipped
+fractions) disables that check.
+"""
+import threading
+import time
+
+import numpy as np
+
+from preprocessing import ImageRejected
+
+# ITU-R BT.601 luma and chroma weights, for RGB in [0, 1]
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_CB = np.array([-0.168736, -0.331264, 0.5], dtype=np.float32)
+_CR = np.array([0.5, -0.418688, -0.081312], dtype=np.float32)
+
+# Skin-tone box in YCbCr (Chai & Ngan), 0-255 chroma offsets from 128
+SKIN_CB_RANGE = ((77 - 128) / 255.0, (127 - 128) / 255.0)
+SKIN_CR_RANGE = ((133 - 128) / 255.0, (173 - 128) / 255.0)
+
+# Luminance below / above these counts as clipped shadow / highlight
+DARK_LEVEL = 0.05
+BRIGHT_LEVEL = 0.95
+
+REASONS = ("blurry", "underexposed", "overexposed", "not_skin")
+
+
+class ImageQualityRejected(ImageRejected):
+    """An image failed the quality gate; report holds the measurements and reasons."""
+
+    def __init__(self, report):
+        super().__init__(
+            "Image quality too low for a reliable prediction: " + ", ".join(report["reasons"]),
+            status_code=422,
+        )
+        self.report = report
+
+    def response_body(self) -> dict:
+        """422 body: "detail" stays a plain message (what clients display), measurements under "quality"."""
+        return {"detail": str(self), "error": "image_quality", "quality": self.report}
+
+
+class QualityGate:
+    """
+    Cheap pre-inference checks on a preprocessed image.
+
+    - min_sharpness: minimum Laplacian variance (0-255 luminance scale)
+    - min_brightness / max_brightness: allowed mean luminance in [0, 1]
+    - max_dark_fraction / max_bright_fraction: allowed share of clipped pixels
+    - min_skin_ratio: minimum share of skin-toned pixels
+    """
+
+    def __init__(self, min_sharpness=10.0, min_brightness=0.08, max_brightness=0.95,
+                 max_dark_fraction=0.7, max_bright_fraction=0.7, min_skin_ratio=0.1):
+        self.min_sharpness = float(min_sharpness)
+        self.min_brightness = float(min_brightness)
+        self.max_brightness = float(max_brightness)
+        self.max_dark_fraction = float(max_dark_fraction)
+        self.max_bright_fraction = float(max_bright_fraction)
+        self.min_skin_ratio = float(min_skin_ratio)
+
+        # Metrics
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = 0
+        self.rejections = {reason: 0 for reason in REASONS}
+        self.total_check_ms = 0.0
+
+    @staticmethod
+    def measure(img_array: np.ndarray) -> dict:
+        """Sharpness, exposure and skin-ratio measurements of one (1, H, W, 3) or (H, W, 3) image in [0, 1]."""
+        img = img_array[0] if img_array.ndim == 4 else img_array
+        pixels = img.size // 3
+        luma = img @ _LUMA
+
+        laplacian = (4 * luma[1:-1, 1:-1] - luma[:-2, 1:-1] - luma[2:, 1:-1]
+                     - luma[1:-1, :-2] - luma[1:-1, 2:])
+        cb = img @ _CB
+        cr = img @ _CR
+        skin = ((cb >= SKIN_CB_RANGE[0]) & (cb <= SKIN_CB_RANGE[1])
+                & (cr >= SKIN_CR_RANGE[0]) & (cr <= SKIN_CR_RANGE[1]))
+
+        return {
+            "sharpness": round(float(laplacian.var()) * 255.0 ** 2, 2),
+            "brightness": round(float(luma.mean()), 4),
+            "dark_fraction": round(float(np.count_nonzero(luma < DARK_LEVEL) / pixels), 4),
+            "bright_fraction": round(float(np.count_nonzero(luma > BRIGHT_LEVEL) / pixels), 4),
+            "skin_ratio": round(float(np.count_nonzero(skin) / pixels), 4),
+        }
+
+    def reasons(self, metrics: dict) -> list:
+        reasons = []
+        if metrics["sharpness"] < self.min_sharpness:
+            reasons.append("blurry")
+        if metrics["brightness"] < self.min_brightness or metrics["dark_fraction"] > self.max_dark_fraction:
+            reasons.append("underexposed")
+        if metrics["brightness"] > self.max_brightness or metrics["bright_fraction"] > self.max_bright_fraction:
+            reasons.append("overexposed")
+        if metrics["skin_ratio"] < self.min_skin_ratio:
+            reasons.append("not_skin")
+        return reasons
+
+    def check(self, img_array: np.ndarray, timings=None) -> dict:
+        """
+        Measure one image and raise ImageQualityRejected if it fails.
+
+        Returns the measurements for images that pass. An optional
+        StageTimings gets a "quality" stage.
+        """
+        start = time.perf_counter()
+        metrics = self.measure(img_array)
+        reasons = self.reasons(metrics)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self.checked += 1
+            self.total_check_ms += elapsed_ms
+            if reasons:
+                self.rejected += 1
+                for reason in reasons:
+                    self.rejections[reason] += 1
+        if timings is not None:
+            timings.add("quality", elapsed_ms)
+
+        if reasons:
+            raise ImageQualityRejected({"reasons": reasons, "metrics": metrics})
+        return metrics
+
+    def thresholds(self) -> dict:
+        return {
+            "min_sharpness": self.min_sharpness,
+            "min_brightness": self.min_brightness,
+            "max_brightness": self.max_brightness,
+            "max_dark_fraction": self.max_dark_fraction,
+            "max_bright_fraction": self.max_bright_fraction,
+            "min_skin_ratio": self.min_skin_ratio,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "thresholds": self.thresholds(),
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "rejection_rate": round(self.rejected / self.checked, 4) if self.checked else 0.0,
+            "rejections": dict(self.rejections),
+            "avg_check_ms": round(self.total_check_ms / self.checked, 3) if self.checked else 0.0,
+        }
@@ -0,0 +1,232 @@
+"""
+Versioned model registry with hot reload for DermaVision.
+
+Model versions are identified by the content hash of the model file. A
+reload loads and warms the new version in the background while requests
+keep using the active one, then swaps it in with a single reference
+assignment. Requests hold on to the LoadedModel they started with, so
+in-flight predictions finish on the old version and it is freed once the
+last of them completes.
+
+Note that during a reload both versions are in memory at once.
+"""
+import os
+import threading
+import time
+
+from downloader import sha256_file
+
+
+class LoadedModel:
+    """
+    One loaded and warmed model version.
+
+    - backend: the InferenceBackend serving it (see backends.py)
+    - version: content hash of the backend's model file
+    - sources: {path: version} of every model file considered when it was
+      loaded; a reload is skipped while these are unchanged
+    - selection: the startup self-benchmark report, if one was run
+    """
+
+    def __init__(self, backend, version, sources=None, selection=None):
+        self.backend = backend
+        self.path = backend.path
+        self.version = version
+        self.sources = sources if sources is not None else {backend.path: version}
+        self.selection = selection
+        self.loaded_at = time.time()
+
+    @property
+    def format(self) -> str:
+        return self.backend.name
+
+    @property
+    def memory_bytes(self):
+        return self.backend.memory_bytes()
+
+    @property
+    def has_embeddings(self) -> bool:
+        return self.backend.has_embeddings
+
+    @property
+    def supports_gradients(self) -> bool:
+        return self.backend.supports_gradients
+
+    def predict(self, batch):
+        return self.backend.predict_batch(batch)
+
+    def predict_with_embeddings(self, batch):
+        """(outputs, penultimate-layer embeddings) from one forward pass."""
+        return self.backend.predict_with_embeddings(batch)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "format": self.format,
+            "path": os.path.basename(self.path),
+            "memory_bytes": self.memory_bytes,
+            "embeddings": self.has_embeddings,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def file_fingerprint(path):
+    """(mtime_ns, size) of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class ModelRegistry:
+    """
+    Tracks the active model version and swaps in new ones.
+
+    - candidates: model files the loader may choose from
+    - load_fn: callable returning an unwarmed LoadedModel (or None)
+    - warm_up_fn: callable run on a new LoadedModel before it is activated
+    - on_activate: callable run after a version is swapped in
+    - max_history: how many past versions /info reports
+    """
+
+    def __init__(self, candidates, load_fn, warm_up_fn=None, on_activate=None, max_history=10):
+        self.candidates = list(candidates)
+        self.load_fn = load_fn
+        self.warm_up_fn = warm_up_fn
+        self.on_activate = on_activate
+        self.max_history = max_history
+
+        self.active = None
+        self.history = []  # newest first
+        self.reloading = False
+        self.reloads = 0
+        self.last_reload_error = None
+
+        self._reload_lock = threading.Lock()
+        self._versions = {}  # path -> (fingerprint, version)
+        self._watcher = None
+        self._stop = threading.Event()
+
+    # ---------- Versions ----------
+    def file_version(self, path):
+        """Content hash of a model file, re-hashed only when its fingerprint changes."""
+        fingerprint = file_fingerprint(path)
+        if fingerprint is None:
+            return None
+        cached = self._versions.get(path)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        version = sha256_file(path)[:12]
+        self._versions[path] = (fingerprint, version)
+        return version
+
+    def disk_versions(self):
+        """{path: version} of the candidate files present on disk."""
+        versions = {}
+        for path in self.candidates:
+            version = self.file_version(path)
+            if version is not None:
+                versions[path] = version
+        return versions
+
+    # ---------- Swapping ----------
+    def activate(self, loaded):
+        """Make a loaded, warmed model the one new requests use."""
+        previous = self.active
+        self.active = loaded
+        if previous is not None and previous.version != loaded.version:
+            self.reloads += 1
+            print(f"[OK] Model swapped: {previous.version} -> {loaded.version}")
+        self.history.insert(0, loaded.info())
+        del self.history[self.max_history:]
+        if self.on_activate is not None:
+            self.on_activate(loaded)
+
+    def reload(self, force=False) -> dict:
+        """
+        Load the model on disk and swap it in if its version changed.
+
+        Blocks while loading; run it on a background thread. Returns a
+        status dict: "unchanged", "reloaded", "busy" or "failed".
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return {"status": "busy", "active_version": self.version}
+
+        try:
+            self.reloading = True
+            on_disk = self.disk_versions()
+            if not force and self.active is not None and on_disk == self.active.sources:
+                return {"status": "unchanged", "active_version": self.version}
+
+            print(f"[INFO] Reloading model (active {self.version}, on disk {sorted(on_disk.values())})...")
+            try:
+                loaded = self.load_fn()
+                if loaded is None:
+                    raise RuntimeError("No loadable model found")
+                if self.warm_up_fn is not None:
+                    self.warm_up_fn(loaded)
+            except Exception as e:
+                self.last_reload_error = str(e)
+                print(f"[ERROR] Model reload failed, keeping {self.version}: {e}")
+                return {"status": "failed", "error": str(e), "active_version": self.version}
+
+            self.last_reload_error = None
+            if self.active is not None and loaded.version == self.active.version and not force:
+                # Same file won again; remember what else was on disk
+                self.active.sources = loaded.sources
+                return {"status": "unchanged", "active_version": self.version}
+            self.activate(loaded)
+            return {"status": "reloaded", "active_version": self.version}
+        finally:
+            self.reloading = False
+            self._reload_lock.release()
+
+    # ---------- File watcher ----------
+    def watch(self, interval_seconds):
+        """Poll the model files and reload when one changes (daemon thread)."""
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch_loop, args=(interval_seconds,), name="model-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch_loop(self, interval_seconds):
+        seen = {path: file_fingerprint(path) for path in self.candidates}
+        pending = None
+
+        while not self._stop.wait(interval_seconds):
+            current = {path: file_fingerprint(path) for path in self.candidates}
+            if current == seen:
+                pending = None
+                continue
+
+            # Only reload once the file has stopped changing (copy finished)
+            if current != pending:
+                pending = current
+                continue
+
+            seen = current
+            pending = None
+            if self.active is not None:
+                print("[INFO] Model file changed on disk")
+                self.reload()
+
+    # ---------- Reporting ----------
+    @property
+    def version(self):
+        return self.active.version if self.active is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active.info() if self.active is not None else None,
+            "reloading": self.reloading,
+            "reloads": self.reloads,
+            "last_reload_error": self.last_reload_error,
+            "watching": self._watcher is not None,
+            "history": list(self.history),
+        }
@@ -0,0 +1,124 @@
+"""
+Response formats and compression for DermaVision.
+
+The full /predict response repeats the multi-line disclaimer and several
+derived fields in every prediction. High-volume clients can ask for:
+
+- a compact form (?format=compact, or an Accept header naming
+  application/vnd.dermavision.compact+json) that keeps one probability and
+  points to /info for the disclaimer and class/threshold metadata
+- msgpack instead of JSON (?encoding=msgpack or Accept: application/msgpack)
+- gzip or brotli for bodies over a size threshold (Accept-Encoding)
+
+JSON is written with orjson when it is installed, otherwise the stdlib.
+msgpack and brotli are optional too; without them JSON / gzip is used.
+"""
+import gzip
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPACT_MEDIA_TYPE = "application/vnd.dermavision.compact+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Where the static text dropped from compact responses lives
+DISCLAIMER_REF = "/info"
+
+
+def compact_prediction(response: dict) -> dict:
+    """The /predict response without static text and derived fields."""
+    compact = {
+        "predicted_class": response["predicted_class"],
+        "confidence": response["confidence"],
+        "confidence_band": response["confidence_band"],
+        "p_malignant": response["probabilities"]["Malignant"],
+        "model_version": response.get("model_version"),
+        "cached": response["cached"],
+        "inference_time_ms": response["inference_time_ms"],
+    }
+    if "uncertainty" in response:
+        compact["uncertainty"] = response["uncertainty"]["std"]
+    for key in ("similar_cases", "explanation"):
+        if key in response:
+            compact[key] = response[key]
+    return compact
+
+
+def compact_batch_item(item: dict) -> dict:
+    if "result" not in item:
+        return item
+    return {**item, "result": compact_prediction(item["result"])}
+
+
+def wants_compact(accept, format_param=None) -> bool:
+    if format_param:
+        return format_param.lower() == "compact"
+    return COMPACT_MEDIA_TYPE in (accept or "")
+
+
+def wants_msgpack(accept, encoding_param=None) -> bool:
+    if encoding_param:
+        return encoding_param.lower() == "msgpack"
+    return any(media_type in (accept or "") for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def dumps_json(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _accepted_encodings(accept_encoding):
+    encodings = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            encodings.add(name.lower())
+    return encodings
+
+
+def encode_response(content, accept_encoding=None, status_code=200, headers=None,
+                    use_msgpack=False, compact=False, min_compress_bytes=1024, compress_level=5) -> Response:
+    """
+    Serialize content for the client.
+
+    - use_msgpack: msgpack body (falls back to JSON when msgpack is missing)
+    - compact: labels the JSON with the compact media type
+    - bodies of at least min_compress_bytes are brotli or gzip compressed
+      when the client accepts it (0 disables compression)
+    """
+    if use_msgpack and msgpack is not None:
+        body = msgpack.packb(content, use_bin_type=True)
+        media_type = MSGPACK_MEDIA_TYPES[0]
+    else:
+        body = dumps_json(content)
+        media_type = COMPACT_MEDIA_TYPE if compact else "application/json"
+
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+
+    if min_compress_bytes and len(body) >= min_compress_bytes:
+        encodings = _accepted_encodings(accept_encoding)
+        if brotli is not None and "br" in encodings:
+            body = brotli.compress(body, quality=compress_level)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in encodings:
+            body = gzip.compress(body, compresslevel=compress_level)
+            headers["Content-Encoding"] = "gzip"
+
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
@@ -0,0 +1,55 @@
+"""
+Lazy ML runtime selection for DermaVision.
+
+Importing TensorFlow costs seconds and hundreds of MB, so nothing here runs
+at import time. The server detects which model format is on disk and imports
+only what that format needs:
+
+- TFLite: tflite_runtime if installed, otherwise tf.lite from TensorFlow
+- H5: TensorFlow/Keras plus the compatibility shims in keras_compat
+- ONNX: onnxruntime, for models exported with convert_model.py --onnx
+"""
+import os
+
+# Name of the package that provided the interpreter / model ("tflite_runtime", "tensorflow.lite", "keras", "onnxruntime")
+active_runtime = None
+
+
+def detect_model_formats(*paths):
+    """Extensions ('tflite', 'onnx', 'h5') of the given model files that exist on disk."""
+    return [os.path.splitext(path)[1].lstrip(".") for path in paths if os.path.exists(path)]
+
+
+def import_tflite_interpreter():
+    """Return an Interpreter class, preferring the slim tflite_runtime package."""
+    global active_runtime
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        active_runtime = "tflite_runtime"
+        return Interpreter
+    except ImportError:
+        pass
+
+    import tensorflow as tf
+    active_runtime = "tensorflow.lite"
+    return tf.lite.Interpreter
+
+
+def import_keras():
+    """Import TensorFlow Keras with the compatibility shims registered, or None."""
+    global active_runtime
+    try:
+        from tensorflow import keras
+        import keras_compat  # noqa: F401  (registers custom objects)
+    except ImportError:
+        return None
+    active_runtime = "keras"
+    return keras
+
+
+def import_onnxruntime():
+    """Import onnxruntime (only needed for .onnx models)."""
+    global active_runtime
+    import onnxruntime
+    active_runtime = "onnxruntime"
+    return onnxruntime
@@ -0,0 +1,64 @@
+"""
+Multi-process serving helpers for DermaVision.
+
+In multi-process mode (gunicorn + UvicornWorker, see gunicorn.conf.py) the
+master maps the TFLite flatbuffer read-only and faults its pages into the
+page cache before forking. Every worker then builds its interpreters from
+the same file path; TFLite memory-maps it, so all workers share one
+physical copy of the weights instead of each holding its own.
+
+Keras H5 models cannot be shared this way - each worker process loads its
+own copy into the heap - so convert to TFLite before scaling out.
+"""
+import mmap
+import os
+
+TFLITE_FILE_IDENTIFIER = b"TFL3"
+
+
+def available_cores() -> int:
+    """CPU cores this process may run on (respects container CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def workers_for_cores(per_core=1.0, max_workers=None, min_workers=1) -> int:
+    """Worker process count tied to the available cores."""
+    workers = max(min_workers, int(available_cores() * per_core))
+    if max_workers:
+        workers = min(workers, max_workers)
+    return workers
+
+
+class SharedModelFile:
+    """
+    A read-only memory map of a model file, prefaulted into the page cache.
+
+    Kept open in the master for the server's lifetime so the pages stay
+    mapped; forked workers that map the same file reuse those pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[4:8] != TFLITE_FILE_IDENTIFIER:
+            self.close()
+            raise ValueError(f"{path} is not a TFLite flatbuffer")
+
+        self._prefault()
+
+    def _prefault(self):
+        """Ask the kernel to read the whole file now rather than on first inference."""
+        if hasattr(self._map, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._map.madvise(mmap.MADV_WILLNEED)
+        page = mmap.PAGESIZE
+        for offset in range(0, self.size, page):
+            self._map[offset]
+
+    def close(self):
+        self._map.close()
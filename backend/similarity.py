@@ -0,0 +1,421 @@
+"""
+Memory-mapped nearest-neighbour index of reference lesion embeddings.
+
+Embeddings are L2-normalized and stored as a raw float16 or int8 matrix
+(int8 with a float32 scale per row), so cosine similarity is a dot product.
+The matrix is memory-mapped read-only: the OS pages in only the rows a
+query touches, and 100k+ references never have to fit in the Python heap.
+
+Rows are grouped into IVF lists (spherical k-means centroids). A query
+scores the centroids, then scans only the nprobe closest lists - contiguous
+slices of the matrix - plus any rows appended since the last compaction.
+
+On-disk layout (one directory):
+
+- index.json: dim, dtype, nlist, row counts, model version
+- vectors.bin: (count, dim) float16 or int8, sorted region first, then the unsorted tail
+- scales.bin: (count,) float32 per-row scales (int8 only)
+- centroids.npy / offsets.npy: IVF centroids and list boundaries of the sorted region
+- items.jsonl: one JSON object (id, label, ...) per row, in row order
+
+build_index.py builds, extends and compacts an index offline.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+DTYPES = {"float16": np.float16, "int8": np.int8}
+
+# Rows converted to float32 at a time while scanning
+SCAN_BLOCK_ROWS = 65536
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (float32), leaving all-zero rows at zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """Normalized float32 rows -> (stored rows, per-row scales or None)."""
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    rows = np.clip(np.round(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return rows, scales.astype(np.float32)
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations=10, sample=50000, seed=0) -> np.ndarray:
+    """Spherical k-means on (a sample of) normalized float32 rows; returns (nlist, dim) centroids."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+    nlist = max(1, min(int(nlist), len(vectors)))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = assign_lists(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        # Re-seed empty lists with random rows
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid for each row (chunked to bound memory)."""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+def default_nlist(count: int) -> int:
+    """About sqrt(N) lists; small indexes are scanned flat."""
+    return 0 if count < 4096 else int(np.sqrt(count))
+
+
+class EmbeddingIndex:
+    """
+    Read side of an index directory, used by the API.
+
+    - nprobe: IVF lists scanned per query (all lists when the index is flat)
+    - refresh_seconds: how often search() checks index.json for updates
+      written by build_index.py (0 = never)
+    """
+
+    def __init__(self, path, nprobe=8, refresh_seconds=5.0):
+        self.path = path
+        self.nprobe = max(1, int(nprobe))
+        self.refresh_seconds = float(refresh_seconds)
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._mtime = None
+        self._state = None
+
+        # Metrics
+        self.searches = 0
+        self.total_search_ms = 0.0
+
+        self._load()
+
+    def _load(self):
+        meta_path = os.path.join(self.path, "index.json")
+        mtime = os.stat(meta_path).st_mtime_ns
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        count, dim = meta["count"], meta["dim"]
+        dtype = DTYPES[meta["dtype"]]
+        state = {"meta": meta, "vectors": None, "scales": None, "items": None, "item_offsets": None}
+        if count:
+            state["vectors"] = np.memmap(os.path.join(self.path, "vectors.bin"), dtype=dtype, mode="r", shape=(count, dim))
+            if meta["dtype"] == "int8":
+                state["scales"] = np.memmap(os.path.join(self.path, "scales.bin"), dtype=np.float32, mode="r", shape=(count,))
+            # Line start offsets into items.jsonl; the items themselves stay on disk
+            state["items"] = np.memmap(os.path.join(self.path, "items.jsonl"), dtype=np.uint8, mode="r")
+            newlines = np.flatnonzero(state["items"] == ord("\n"))[:count]
+            state["item_offsets"] = np.concatenate(([0], newlines + 1))
+        state["centroids"] = np.load(os.path.join(self.path, "centroids.npy")) if meta["nlist"] else None
+        state["offsets"] = np.load(os.path.join(self.path, "offsets.npy")) if meta["nlist"] else None
+
+        # One reference assignment, so concurrent searches see old or new state, never a mix
+        self._state = state
+        self._mtime = mtime
+
+    def refresh(self):
+        """Reopen the index if build_index.py has written a new index.json."""
+        now = time.time()
+        if not self.refresh_seconds or now - self._checked_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if now - self._checked_at < self.refresh_seconds:
+                return
+            self._checked_at = now
+            try:
+                if os.stat(os.path.join(self.path, "index.json")).st_mtime_ns != self._mtime:
+                    self._load()
+                    print(f"[OK] Similar-case index reloaded ({self.count} references)")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[WARN] Similar-case index reload failed, keeping the old one: {e}")
+
+    @property
+    def meta(self) -> dict:
+        return self._state["meta"]
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    @property
+    def model_version(self):
+        return self.meta.get("model_version")
+
+    @property
+    def version(self) -> str:
+        """Changes whenever references are added or the index is rebuilt."""
+        return f"{self.count}@{self.meta.get('updated_at', 0):.3f}"
+
+    def _ranges(self, state, query):
+        """Row ranges to scan: the nprobe closest IVF lists plus the unsorted tail."""
+        meta = state["meta"]
+        sorted_count = meta["sorted_count"] if meta["nlist"] else 0
+        ranges = []
+        if meta["nlist"]:
+            scores = state["centroids"] @ query
+            nprobe = min(self.nprobe, len(scores))
+            probe = np.argpartition(-scores, nprobe - 1)[:nprobe]
+            offsets = state["offsets"]
+            ranges = [(int(offsets[c]), int(offsets[c + 1])) for c in probe if offsets[c + 1] > offsets[c]]
+        if meta["count"] > sorted_count:
+            ranges.append((sorted_count, meta["count"]))
+        return ranges
+
+    def search(self, embedding: np.ndarray, k=5) -> list:
+        """
+        The k most similar references to one embedding.
+
+        Returns [{"similarity", **item}] best first, similarity being the
+        cosine similarity (approximate for int8 indexes).
+        """
+        self.refresh()
+        state = self._state
+        if not state["meta"]["count"] or k <= 0:
+            return []
+
+        start = time.perf_counter()
+        query = normalize(np.ravel(embedding))
+        if len(query) != state["meta"]["dim"]:
+            raise ValueError(f"Embedding has {len(query)} dimensions, the index has {state['meta']['dim']}")
+
+        vectors, scales = state["vectors"], state["scales"]
+        best_scores, best_rows = [], []
+        for first, last in self._ranges(state, query):
+            for block_start in range(first, last, SCAN_BLOCK_ROWS):
+                block_end = min(block_start + SCAN_BLOCK_ROWS, last)
+                scores = vectors[block_start:block_end].astype(np.float32) @ query
+                if scales is not None:
+                    scores *= scales[block_start:block_end]
+                # Keep only this block's top k
+                if len(scores) > k:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                    scores = scores[top]
+                    rows = top + block_start
+                else:
+                    rows = np.arange(block_start, block_end)
+                best_scores.append(scores)
+                best_rows.append(rows)
+
+        if not best_scores:
+            return []
+        scores = np.concatenate(best_scores)
+        rows = np.concatenate(best_rows)
+        order = np.argsort(-scores)[:k]
+
+        # int8 rounding can push a near-duplicate just past 1
+        results = [{"similarity": round(min(float(scores[i]), 1.0), 4), **self._item(state, rows[i])} for i in order]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.searches += 1
+            self.total_search_ms += elapsed_ms
+        return results
+
+    @staticmethod
+    def _item(state, row) -> dict:
+        offsets = state["item_offsets"]
+        return json.loads(bytes(state["items"][offsets[row]:offsets[row + 1]]))
+
+    def stats(self) -> dict:
+        meta = self.meta
+        return {
+            "path": self.path,
+            "references": meta["count"],
+            "unsorted_references": meta["count"] - meta["sorted_count"] if meta["nlist"] else 0,
+            "dim": meta["dim"],
+            "dtype": meta["dtype"],
+            "nlist": meta["nlist"],
+            "nprobe": self.nprobe,
+            "model_version": self.model_version,
+            "updated_at": meta.get("updated_at"),
+            "searches": self.searches,
+            "avg_search_ms": round(self.total_search_ms / self.searches, 3) if self.searches else 0.0,
+        }
+
+
+# ==================== WRITING (offline) ====================
+def _write_meta(path, meta):
+    """index.json is written last and atomically, so readers never see a partial update."""
+    meta["updated_at"] = time.time()
+    tmp_path = os.path.join(path, "index.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, "index.json"))
+
+
+def read_meta(path) -> dict:
+    with open(os.path.join(path, "index.json")) as f:
+        return json.load(f)
+
+
+def write_index(path, embeddings: np.ndarray, items: list, dtype="float16", nlist=None, model_version=None,
+                centroids=None):
+    """
+    Write a complete index (replacing any index at path).
+
+    - embeddings: (N, dim) raw embeddings, normalized here
+    - items: N JSON-serializable dicts stored alongside the rows
+    - nlist: IVF lists (None = about sqrt(N), 0 = flat)
+    - centroids: reuse these instead of training new ones
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+    if len(embeddings) != len(items):
+        raise ValueError("embeddings and items must have the same length")
+
+    os.makedirs(path, exist_ok=True)
+    vectors = normalize(embeddings)
+    count, dim = vectors.shape
+    nlist = default_nlist(count) if nlist is None else int(nlist)
+
+    offsets = None
+    if nlist and count:
+        if centroids is None:
+            centroids = train_centroids(vectors, nlist)
+        nlist = len(centroids)
+        assign = assign_lists(vectors, centroids)
+        # Store rows grouped by list, so each list is one contiguous slice
+        order = np.argsort(assign, kind="stable")
+        vectors = vectors[order]
+        items = [items[i] for i in order]
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist)))).astype(np.int64)
+    else:
+        nlist = 0
+
+    rows, scales = quantize(vectors, dtype)
+    # New files are written under temp names and swapped in before index.json
+    _replace(path, "vectors.bin", rows.tobytes())
+    if scales is not None:
+        _replace(path, "scales.bin", scales.tobytes())
+    _replace(path, "items.jsonl", "".join(json.dumps(item) + "\n" for item in items).encode("utf-8"))
+    if nlist:
+        _save_npy(path, "centroids.npy", centroids.astype(np.float32))
+        _save_npy(path, "offsets.npy", offsets)
+
+    meta = {
+        "dim": int(dim),
+        "dtype": dtype,
+        "metric": "cosine",
+        "nlist": nlist,
+        "count": int(count),
+        "sorted_count": int(count),
+        "model_version": model_version,
+    }
+    _write_meta(path, meta)
+    return meta
+
+
+def _replace(path, name, data: bytes):
+    tmp_path = os.path.join(path, name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, os.path.join(path, name))
+
+
+def _save_npy(path, name, array):
+    tmp_path = os.path.join(path, name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, os.path.join(path, name))
+
+
+def append_to_index(path, embeddings: np.ndarray, items: list, model_version=None):
+    """
+    Append references to an existing index without re-sorting it.
+
+    New rows go to the unsorted tail, which every query scans in full;
+    compact_index folds them into the IVF lists.
+    """
+    meta = read_meta(path)
+    if model_version and meta.get("model_version") and model_version != meta["model_version"]:
+        raise ValueError(
+            f"Index was built with model {meta['model_version']}, these embeddings come from {model_version}"
+        )
+    if len(embeddings) != len(items):
+        raise ValueError("embeddings and items must have the same length")
+    if not len(items):
+        return meta
+
+    vectors = normalize(embeddings)
+    if vectors.shape[1] != meta["dim"]:
+        raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, the index has {meta['dim']}")
+    rows, scales = quantize(vectors, meta["dtype"])
+
+    # Drop anything past "count" left by an interrupted append, then extend
+    count = meta["count"]
+    _append(path, "vectors.bin", count * meta["dim"] * rows.itemsize, rows.tobytes())
+    if scales is not None:
+        _append(path, "scales.bin", count * 4, scales.tobytes())
+    items_path = os.path.join(path, "items.jsonl")
+    with open(items_path, "rb") as f:
+        items_size = sum(len(line) for _, line in zip(range(count), f))
+    _append(path, "items.jsonl", items_size, "".join(json.dumps(item) + "\n" for item in items).encode("utf-8"))
+
+    meta["count"] = count + len(items)
+    _write_meta(path, meta)
+    return meta
+
+
+def _append(path, name, valid_bytes, data: bytes):
+    file_path = os.path.join(path, name)
+    with open(file_path, "r+b" if os.path.exists(file_path) else "wb") as f:
+        f.truncate(valid_bytes)
+        f.seek(valid_bytes)
+        f.write(data)
+
+
+def load_all(path):
+    """(normalized float32 embeddings, items) of every row, for compaction."""
+    meta = read_meta(path)
+    count, dim = meta["count"], meta["dim"]
+    if not count:
+        return np.empty((0, dim), dtype=np.float32), []
+    vectors = np.fromfile(os.path.join(path, "vectors.bin"), dtype=DTYPES[meta["dtype"]], count=count * dim)
+    vectors = vectors.reshape(count, dim).astype(np.float32)
+    if meta["dtype"] == "int8":
+        vectors *= np.fromfile(os.path.join(path, "scales.bin"), dtype=np.float32, count=count)[:, None]
+    return vectors, read_items(path)
+
+
+def read_items(path) -> list:
+    """The item dicts of every row, in row order."""
+    count = read_meta(path)["count"]
+    if not count:
+        return []
+    with open(os.path.join(path, "items.jsonl")) as f:
+        return [json.loads(line) for _, line in zip(range(count), f)]
+
+
+def compact_index(path, nlist=None, retrain=False):
+    """
+    Rewrite the index with every row in its IVF list (no unsorted tail).
+
+    nlist defaults to the current list count (about sqrt(N) for a flat
+    index). Keeps the existing centroids unless retrain is set or the
+    list count changes.
+    """
+    meta = read_meta(path)
+    vectors, items = load_all(path)
+    if nlist is None:
+        nlist = meta["nlist"] or default_nlist(len(items))
+    centroids = None
+    if meta["nlist"] and nlist == meta["nlist"] and not retrain:
+        centroids = np.load(os.path.join(path, "centroids.npy"))
+    return write_index(path, vectors, items, meta["dtype"], nlist, meta.get("model_version"), centroids)
@@ -0,0 +1,355 @@
+"""
+Offline model slimming for DermaVision: distillation into a compact student
+CNN, structured pruning, and export in the formats the API serves.
+
+The shipped H5 is ~500MB, mostly one huge dense layer after the conv stack.
+Rather than prune that network in place (filter surgery on an arbitrary
+Keras graph), this trains a small depthwise-separable student to mimic it:
+
+1. The teacher labels a local image folder once (soft targets).
+2. The student is distilled from them: KL divergence at --temperature plus
+   cross-entropy on hard labels (from Benign/Malignant sub-folders when
+   present, else the teacher's decision), with an L1 penalty on the
+   BatchNorm scales so unneeded channels fade out.
+3. Structured pruning: in every block, the channels with the smallest
+   BatchNorm scale are removed (--keep of them stay, in multiples of 8)
+   and the narrower student is rebuilt with the surviving weights.
+4. The pruned student is fine-tuned by distillation again.
+5. It is exported as .h5, .tflite (--tflite-variant) and optionally .onnx,
+   and every file is compared with the teacher on held-out images: size,
+   load time, RSS of a fresh process, latency and agreement.
+
+--install moves the current serving files to models/teacher/ and installs
+the student under the serving names, so the next reload serves it.
+
+Usage:
+    python slim_model.py --images path/to/images --report slim.json
+    python slim_model.py --images path/to/images --keep 0.5 --onnx --install
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+import tensorflow as tf
+
+from convert_model import VARIANTS, convert, convert_onnx, run_keras, run_onnx, run_tflite, summarize
+from keras_compat import load_h5_model
+from main import (
+    CLASS_NAMES, H5_MODEL_PATH, INPUT_SIZE, MODELS_DIR, ONNX_MODEL_PATH, TFLITE_MODEL_PATH,
+    malignant_probability, preprocess_image,
+)
+from preprocessing import list_image_files
+from startup_report import run_scenario
+
+keras = tf.keras
+layers = tf.keras.layers
+
+# Student layout: stem width, then one (width, stride) per depthwise-separable block
+DEFAULT_WIDTHS = "32,64,128,128,256,256,512,512"
+BLOCK_STRIDES = (1, 2, 1, 2, 1, 2, 1)
+
+# Pruned widths are rounded to this (SIMD-friendly channel counts)
+CHANNEL_MULTIPLE = 8
+
+EPSILON = 1e-6
+
+
+# ==================== DATA ====================
+def load_dataset(folder, limit=None):
+    """Preprocessed images (uint8, to keep the training set small) and hard labels (-1 = unknown)."""
+    class_ids = {name.lower(): index for index, name in CLASS_NAMES.items()}
+    images, labels = [], []
+    for path in list_image_files(folder, limit):
+        with open(path, "rb") as f:
+            try:
+                image = preprocess_image(f.read())[0]
+            except ValueError as e:
+                print(f"[WARN] Skipping {path}: {e}")
+                continue
+        images.append(np.round(image * 255).astype(np.uint8))
+        top = os.path.relpath(path, folder).replace(os.sep, "/").split("/", 1)[0]
+        labels.append(class_ids.get(top.lower(), -1))
+
+    if not images:
+        raise SystemExit(f"[ERROR] No usable images found in {folder}")
+    return np.stack(images), np.array(labels, dtype=np.int32)
+
+
+def split(count, eval_fraction):
+    """Deterministic train / held-out index split."""
+    order = np.random.default_rng(0).permutation(count)
+    n_eval = max(1, int(round(count * eval_fraction)))
+    return order[n_eval:], order[:n_eval]
+
+
+def as_float(images_u8):
+    return images_u8.astype(np.float32) / 255.0
+
+
+def predict_in_batches(model, images_u8, batch_size=32):
+    return np.concatenate([
+        model.predict(as_float(images_u8[i:i + batch_size]), verbose=0)
+        for i in range(0, len(images_u8), batch_size)
+    ])
+
+
+def teacher_logits(probs):
+    """Two-class log-probabilities from sigmoid or softmax teacher output (softmax of them = the teacher)."""
+    p_malignant = np.clip(malignant_probability(probs), EPSILON, 1 - EPSILON)
+    return np.log(np.stack([1 - p_malignant, p_malignant], axis=1)).astype(np.float32)
+
+
+# ==================== STUDENT ====================
+def build_student(widths, dropout=0.2):
+    """Depthwise-separable CNN returning two logits; layer names are what prune_student maps weights by."""
+    inputs = keras.Input((INPUT_SIZE, INPUT_SIZE, 3))
+    x = layers.Conv2D(widths[0], 3, strides=2, padding="same", use_bias=False, name="stem_conv")(inputs)
+    x = layers.BatchNormalization(name="stem_bn")(x)
+    x = layers.ReLU(6.0)(x)
+    for block, (width, stride) in enumerate(zip(widths[1:], BLOCK_STRIDES)):
+        x = layers.DepthwiseConv2D(3, strides=stride, padding="same", use_bias=False, name=f"block{block}_dw")(x)
+        x = layers.BatchNormalization(name=f"block{block}_dw_bn")(x)
+        x = layers.ReLU(6.0)(x)
+        x = layers.Conv2D(width, 1, use_bias=False, name=f"block{block}_pw")(x)
+        x = layers.BatchNormalization(name=f"block{block}_pw_bn")(x)
+        x = layers.ReLU(6.0)(x)
+    x = layers.GlobalAveragePooling2D(name="pool")(x)
+    x = layers.Dropout(dropout)(x)
+    logits = layers.Dense(2, name="logits")(x)
+    return keras.Model(inputs, logits, name="dermavision_student")
+
+
+def export_model(student):
+    """The student with a softmax head, i.e. the [P(benign), P(malignant)] output the API expects."""
+    probs = layers.Softmax(name="probabilities")(student.output)
+    return keras.Model(student.input, probs, name="dermavision_student")
+
+
+def block_widths(student):
+    return [student.get_layer("stem_conv").filters] + [
+        student.get_layer(f"block{block}_pw").filters for block in range(len(BLOCK_STRIDES))
+    ]
+
+
+# ==================== PRUNING ====================
+def kept_channels(bn_layer, keep):
+    """Indices of the channels with the largest |gamma|, sorted, rounded up to CHANNEL_MULTIPLE."""
+    gamma = np.abs(bn_layer.get_weights()[0])
+    count = max(CHANNEL_MULTIPLE, math.ceil(len(gamma) * keep / CHANNEL_MULTIPLE) * CHANNEL_MULTIPLE)
+    return np.sort(np.argsort(gamma)[::-1][:min(count, len(gamma))])
+
+
+def take_bn(bn_layer, channels):
+    return [weights[channels] for weights in bn_layer.get_weights()]
+
+
+def prune_student(student, keep):
+    """
+    Structured (channel) pruning: drop the smallest-gamma channels of the stem
+    and every pointwise conv, then rebuild a narrower student with the
+    surviving weights. Depthwise layers follow their input channels.
+    """
+    stem = kept_channels(student.get_layer("stem_bn"), keep)
+    kept = [stem] + [
+        kept_channels(student.get_layer(f"block{block}_pw_bn"), keep) for block in range(len(BLOCK_STRIDES))
+    ]
+    pruned = build_student([len(channels) for channels in kept])
+
+    pruned.get_layer("stem_conv").set_weights([student.get_layer("stem_conv").get_weights()[0][..., stem]])
+    pruned.get_layer("stem_bn").set_weights(take_bn(student.get_layer("stem_bn"), stem))
+    for block in range(len(BLOCK_STRIDES)):
+        channels_in, channels_out = kept[block], kept[block + 1]
+        depthwise = student.get_layer(f"block{block}_dw").get_weights()[0]
+        pruned.get_layer(f"block{block}_dw").set_weights([depthwise[:, :, channels_in, :]])
+        pruned.get_layer(f"block{block}_dw_bn").set_weights(take_bn(student.get_layer(f"block{block}_dw_bn"), channels_in))
+        pointwise = student.get_layer(f"block{block}_pw").get_weights()[0]
+        pruned.get_layer(f"block{block}_pw").set_weights([pointwise[:, :, channels_in, :][..., channels_out]])
+        pruned.get_layer(f"block{block}_pw_bn").set_weights(take_bn(student.get_layer(f"block{block}_pw_bn"), channels_out))
+    kernel, bias = student.get_layer("logits").get_weights()
+    pruned.get_layer("logits").set_weights([kernel[kept[-1]], bias])
+    return pruned
+
+
+# ==================== DISTILLATION ====================
+def augment(image, soft_logits, label):
+    """Flips, 90-degree rotations and slight brightness changes; lesions have no canonical orientation."""
+    image = tf.cast(image, tf.float32) / 255.0
+    image = tf.image.random_flip_left_right(image)
+    image = tf.image.random_flip_up_down(image)
+    image = tf.image.rot90(image, tf.random.uniform([], 0, 4, dtype=tf.int32))
+    image = tf.clip_by_value(tf.image.random_brightness(image, 0.1), 0.0, 1.0)
+    return image, soft_logits, label
+
+
+def distill(student, images_u8, soft_logits, labels, eval_images_u8, eval_probs, args, epochs, gamma_l1=0.0):
+    """Train the student on teacher targets; prints loss and held-out agreement per epoch."""
+    if epochs <= 0:
+        return
+    dataset = (
+        tf.data.Dataset.from_tensor_slices((images_u8, soft_logits, labels))
+        .shuffle(len(images_u8), seed=0, reshuffle_each_iteration=True)
+        .map(augment, num_parallel_calls=tf.data.AUTOTUNE)
+        .batch(args.batch_size)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    steps = epochs * math.ceil(len(images_u8) / args.batch_size)
+    optimizer = keras.optimizers.Adam(keras.optimizers.schedules.CosineDecay(args.lr, steps))
+    gammas = [layer.gamma for layer in student.layers if isinstance(layer, layers.BatchNormalization)]
+    temperature, alpha = args.temperature, args.alpha
+
+    @tf.function
+    def train_step(x, teacher, hard):
+        with tf.GradientTape() as tape:
+            logits = student(x, training=True)
+            soft_loss = tf.reduce_mean(keras.losses.kl_divergence(
+                tf.nn.softmax(teacher / temperature), tf.nn.softmax(logits / temperature)
+            )) * temperature ** 2
+            # Unlabelled images fall back to the teacher's decision
+            hard = tf.where(hard >= 0, hard, tf.argmax(teacher, axis=-1, output_type=tf.int32))
+            hard_loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(hard, logits))
+            loss = alpha * soft_loss + (1 - alpha) * hard_loss
+            if gamma_l1:
+                loss += gamma_l1 * tf.add_n([tf.reduce_sum(tf.abs(gamma)) for gamma in gammas])
+        grads = tape.gradient(loss, student.trainable_variables)
+        optimizer.apply_gradients(zip(grads, student.trainable_variables))
+        return loss
+
+    reference = malignant_probability(eval_probs)
+    for epoch in range(1, epochs + 1):
+        losses = [float(train_step(x, teacher, hard)) for x, teacher, hard in dataset]
+        probs = malignant_probability(predict_in_batches(export_model(student), eval_images_u8))
+        agreement = np.mean((probs >= 0.5) == (reference >= 0.5))
+        print(f"[INFO] Epoch {epoch}/{epochs}: loss {np.mean(losses):.4f}, "
+              f"held-out agreement {agreement:.2%}, max delta {np.max(np.abs(probs - reference)):.3f}")
+
+
+# ==================== REPORT ====================
+def process_profile(path):
+    """Load time and RSS of a fresh process that imports main and loads + warms the file."""
+    body = f"import main\nloaded = main.load_model_file({path!r})\nmain.warm_up_model(loaded)"
+    return run_scenario(body, "None")
+
+
+def compare(name, path, run, images, reference, labels, repeats):
+    """One report row for an exported file (see convert_model.summarize), plus RSS and accuracy."""
+    load_ms, outputs, latencies = run(path, images, repeats)[-3:]
+    probs = malignant_probability(outputs)
+    row = summarize(name, path, load_ms, latencies, probs, reference)
+    profile = process_profile(path)
+    row["process_load_seconds"] = profile.get("seconds")
+    row["process_rss_mb"] = profile.get("rss_mb")
+    known = labels >= 0
+    if known.any():
+        row["accuracy"] = round(float(np.mean((probs[known] >= 0.5) == (labels[known] == 1))), 4)
+    print(f"[OK] {name}: {row['size_mb']}MB, {row['latency_ms_p50']}ms p50, "
+          f"agreement {row['agreement']:.2%}, RSS {row['process_rss_mb']}MB")
+    return row
+
+
+def install(written):
+    """Move the serving files to models/teacher/ and put the student in their place."""
+    backup_dir = os.path.join(MODELS_DIR, "teacher")
+    os.makedirs(backup_dir, exist_ok=True)
+    for target in (TFLITE_MODEL_PATH, ONNX_MODEL_PATH, H5_MODEL_PATH):
+        if os.path.exists(target):
+            shutil.move(target, os.path.join(backup_dir, os.path.basename(target)))
+            print(f"[INFO] Moved {os.path.basename(target)} to {backup_dir}")
+    for source, target in written:
+        shutil.copyfile(source, target)
+        print(f"[OK] Installed {source} as {target}")
+
+
+# ==================== CLI ====================
+def main():
+    parser = argparse.ArgumentParser(description="Distill and prune the DermaVision model into a compact student.")
+    parser.add_argument("--teacher", default=H5_MODEL_PATH, help="Teacher Keras H5 model")
+    parser.add_argument("--images", required=True, help="Training images (Benign/ and Malignant/ sub-folders add hard labels)")
+    parser.add_argument("--limit", type=int, help="Only the first N images")
+    parser.add_argument("--eval-fraction", type=float, default=0.1, help="Held out for agreement checks")
+    parser.add_argument("--widths", default=DEFAULT_WIDTHS, help="Stem width then one width per block, before pruning")
+    parser.add_argument("--keep", type=float, default=0.5, help="Fraction of channels kept per layer (1 = no pruning)")
+    parser.add_argument("--epochs", type=int, default=30, help="Distillation epochs before pruning")
+    parser.add_argument("--finetune-epochs", type=int, default=10, help="Distillation epochs after pruning")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="Weight of the soft (teacher) loss")
+    parser.add_argument("--gamma-l1", type=float, default=1e-4, help="BatchNorm scale sparsity before pruning")
+    parser.add_argument("--tflite-variant", default="float16", choices=[v for v in VARIANTS if v != "int8"])
+    parser.add_argument("--onnx", action="store_true", help="Also export the student for ONNX Runtime")
+    parser.add_argument("--out-dir", default=os.path.join(MODELS_DIR, "student"))
+    parser.add_argument("--repeats", type=int, default=1, help="Timing passes over the held-out set")
+    parser.add_argument("--install", action="store_true", help="Serve the student (teacher files move to models/teacher/)")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    widths = [int(w) for w in args.widths.split(",")]
+    if len(widths) != len(BLOCK_STRIDES) + 1:
+        parser.error(f"--widths needs {len(BLOCK_STRIDES) + 1} values")
+    if not 0 < args.keep <= 1:
+        parser.error("--keep must be in (0, 1]")
+
+    images, labels = load_dataset(args.images, args.limit)
+    train, held_out = split(len(images), args.eval_fraction)
+    print(f"[INFO] {len(train)} training / {len(held_out)} held-out images, "
+          f"{int(np.sum(labels >= 0))} with folder labels")
+
+    print("[INFO] Labelling images with the teacher...")
+    teacher = load_h5_model(args.teacher)
+    teacher_probs = predict_in_batches(teacher, images, args.batch_size)
+    del teacher
+    soft_logits = teacher_logits(teacher_probs)
+
+    fit = (images[train], soft_logits[train], labels[train], images[held_out], teacher_probs[held_out], args)
+    student = build_student(widths)
+    print(f"[INFO] Distilling into a {student.count_params():,}-parameter student...")
+    distill(student, *fit, epochs=args.epochs, gamma_l1=args.gamma_l1)
+
+    if args.keep < 1:
+        student = prune_student(student, args.keep)
+        print(f"[INFO] Pruned to widths {block_widths(student)} ({student.count_params():,} parameters), fine-tuning...")
+        distill(student, *fit, epochs=args.finetune_epochs)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    final = export_model(student)
+    h5_path = os.path.join(args.out_dir, "skin_cancer_cnn_student.h5")
+    final.save(h5_path, save_format="h5")
+    tflite_path = os.path.join(args.out_dir, f"skin_cancer_cnn_student_{args.tflite_variant}.tflite")
+    with open(tflite_path, "wb") as f:
+        f.write(convert(final, args.tflite_variant))
+    written = [(h5_path, H5_MODEL_PATH), (tflite_path, TFLITE_MODEL_PATH)]
+    if args.onnx:
+        onnx_path = os.path.join(args.out_dir, "skin_cancer_cnn_student.onnx")
+        convert_onnx(final, onnx_path)
+        written.append((onnx_path, ONNX_MODEL_PATH))
+
+    # Held-out comparison against the teacher, file by file
+    eval_images = as_float(images[held_out])
+    eval_labels = labels[held_out]
+    reference = malignant_probability(teacher_probs[held_out])
+    runners = {H5_MODEL_PATH: run_keras, TFLITE_MODEL_PATH: run_tflite, ONNX_MODEL_PATH: run_onnx}
+    rows = [compare("teacher", args.teacher, run_keras, eval_images, reference, eval_labels, args.repeats)]
+    for source, target in written:
+        name = "student_" + os.path.splitext(source)[1].lstrip(".")
+        rows.append(compare(name, source, runners[target], eval_images, reference, eval_labels, args.repeats))
+
+    report = {
+        "images": {"train": len(train), "held_out": len(held_out)},
+        "widths": {"initial": widths, "pruned": block_widths(student)},
+        "parameters": student.count_params(),
+        "models": rows,
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.install:
+        install(written)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,32 +3,19 @@ set -e
 
 echo "🚀 Starting DermaVision Backend..."
 
-# Check if model file is a Git LFS pointer
-if [ -f "models/skin_cancer_cnn.h5" ]; then
-    FILE_SIZE=$(stat -f%z "models/skin_cancer_cnn.h5" 2>/dev/null || stat -c%s "models/skin_cancer_cnn.h5" 2>/dev/null || echo "0")
-    echo "📊 Model file size: $FILE_SIZE bytes"
-    
-    # If file is too small, it's likely a Git LFS pointer
-    if [ "$FILE_SIZE" -lt 1000000 ]; then
-        echo "⚠️ Model file appears to be a Git LFS pointer (too small)"
-        echo "🔧 Attempting to pull Git LFS files..."
-        
-        # Try to install and pull Git LFS
-        git lfs install 2>/dev/null || echo "Git LFS install failed"
-        git lfs pull 2>/dev/null || echo "Git LFS pull failed"
-        
-        # Check size again
-        FILE_SIZE=$(stat -f%z "models/skin_cancer_cnn.h5" 2>/dev/null || stat -c%s "models/skin_cancer_cnn.h5" 2>/dev/null || echo "0")
-        echo "📊 Model file size after LFS pull: $FILE_SIZE bytes"
-    fi
-    
-    if [ "$FILE_SIZE" -gt 100000000 ]; then
-        echo "✅ Model file looks good (>100MB)"
-    else
-        echo "❌ Model file still too small - will run in DEMO mode"
-    fi
+# Fetch the model (resumable, SHA-256 verified against models/manifest.json)
+if [ -f "models/skin_cancer_cnn.tflite" ]; then
+    echo "✅ TFLite model present - skipping H5 download"
+elif python downloader.py --only skin_cancer_cnn.h5; then
+    echo "✅ Model file verified"
 else
-    echo "❌ Model file not found - will run in DEMO mode"
+    echo "❌ Model download failed - the API will retry in the background (see /ready)"
+fi
+
+# SERVING_MODE=multiprocess: gunicorn pre-fork workers sharing one mmap'd TFLite model
+if [ "$SERVING_MODE" = "multiprocess" ]; then
+    echo "🌐 Starting Gunicorn (multi-process)..."
+    exec gunicorn main:app -c gunicorn.conf.py
 fi
 
 echo "🌐 Starting Uvicorn server..."
@@ -0,0 +1,74 @@
+"""
+Startup-time and memory report for the lazy runtime.
+
+Each scenario runs in a fresh Python process and reports wall time, RSS and
+whether TensorFlow ended up imported:
+
+- import_main: "import main" (no ML framework should be imported)
+- load_model: import main + load and warm the model on disk
+- import_tensorflow: what every start used to pay before lazy imports
+
+Usage:
+    python startup_report.py --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{body}
+elapsed = (time.perf_counter() - start) * 1000
+from metrics import process_rss_bytes
+rss = process_rss_bytes()
+print(json.dumps({{
+    "seconds": round(elapsed / 1000, 3),
+    "rss_mb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+    "tensorflow_imported": "tensorflow" in sys.modules,
+    "extra": {extra},
+}}))
+"""
+
+SCENARIOS = {
+    "import_main": ("import main", "None"),
+    "load_model": (
+        "import main\nmain.MODEL_LOAD_RETRIES = 1\nmain.load_model_lazy()",
+        "{'model_status': main.model_status, 'runtime': main.runtime.active_runtime}",
+    ),
+    "import_tensorflow": ("import tensorflow", "None"),
+}
+
+
+def run_scenario(body, extra):
+    # No download retries: the report measures loading what is already on disk
+    env = dict(os.environ, MODEL_LOAD_MODE="lazy", DOWNLOAD_RETRIES="0")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(body=body, extra=extra)],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        return {"error": (result.stderr.strip().splitlines() or ["failed"])[-1]}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure DermaVision startup time and memory.")
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    report = {name: run_scenario(body, extra) for name, (body, extra) in SCENARIOS.items()}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
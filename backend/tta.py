@@ -0,0 +1,80 @@
+"""
+Test-time augmentation for DermaVision.
+
+Builds K views of one preprocessed (224, 224, 3) image entirely in NumPy:
+flips and 90-degree rotations are strided views of the same array, and
+small crops are an index gather back to full size. Nothing is decoded
+again, and all views go through the model as one batch.
+
+Skin lesion photos have no canonical orientation, so flips and rotations
+keep the label. Spread of P(malignant) across views is reported as an
+uncertainty estimate.
+"""
+import numpy as np
+
+# Crops keep this share of each side, resized back with nearest-neighbour indexing
+CROP_SCALE = 0.9
+
+
+def _crop(img, top, left, crop):
+    size = img.shape[0]
+    idx = np.linspace(0, crop - 1, size).round().astype(np.intp)
+    return img[top + idx[:, None], left + idx[None, :]]
+
+
+def _view_fns(size):
+    crop = int(round(size * CROP_SCALE))
+    margin = size - crop
+    center = margin // 2
+    return (
+        lambda x: x,
+        lambda x: x[:, ::-1],
+        lambda x: x[::-1],
+        lambda x: np.rot90(x, 1),
+        lambda x: np.rot90(x, 2),
+        lambda x: np.rot90(x, 3),
+        lambda x: x.transpose(1, 0, 2),
+        lambda x: _crop(x, center, center, crop),
+        lambda x: _crop(x, 0, 0, crop),
+        lambda x: _crop(x, margin, margin, crop),
+        lambda x: _crop(x, 0, margin, crop),
+        lambda x: _crop(x, margin, 0, crop),
+    )
+
+
+# identity, h/v flip, 3 rotations, transpose, center crop, 4 corner crops
+MAX_VIEWS = 12
+
+
+def augment_views(img_array: np.ndarray, k: int) -> np.ndarray:
+    """
+    Stack the first k views of one image into a (k, H, W, C) float32 batch.
+
+    Accepts (1, H, W, C) or (H, W, C); view 0 is always the original.
+    """
+    img = img_array[0] if img_array.ndim == 4 else img_array
+    k = max(1, min(int(k), MAX_VIEWS))
+
+    views = np.empty((k,) + img.shape, dtype=np.float32)
+    for i, view in enumerate(_view_fns(img.shape[0])[:k]):
+        views[i] = view(img)
+    return views
+
+
+def summarize_views(outputs: np.ndarray, malignant_probs: np.ndarray):
+    """
+    Average the per-view model outputs.
+
+    Returns (mean output row, uncertainty dict). The mean row has the
+    model's own output shape, so sigmoid and softmax models both work.
+    """
+    outputs = np.asarray(outputs, dtype=np.float32)
+    malignant_probs = np.asarray(malignant_probs, dtype=np.float64)
+    uncertainty = {
+        "views": len(outputs),
+        "variance": round(float(malignant_probs.var()), 6),
+        "std": round(float(malignant_probs.std()), 4),
+        "malignant_min": round(float(malignant_probs.min()), 4),
+        "malignant_max": round(float(malignant_probs.max()), 4),
+    }
+    return outputs.mean(axis=0), uncertainty
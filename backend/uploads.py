@@ -0,0 +1,104 @@
+"""
+Upload size limits and zero-copy upload access for DermaVision.
+
+Starlette's multipart parser streams each uploaded file into a
+SpooledTemporaryFile: kept in memory up to 1MB, written to a temp file
+beyond that. Rather than read() a large upload back into one bytes object,
+read_upload maps the temp file read-only, and hashing and PIL decoding work
+straight from the page cache.
+
+Request bodies are capped per path while they are being received, so an
+oversized upload is rejected before it is spooled in full.
+"""
+import mmap
+import os
+
+from fastapi import HTTPException
+
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware capping the request body size per path.
+
+    - limits: {path: max_bytes}; paths not listed are not limited
+    - A Content-Length over the limit is rejected on the first read, before
+      any of the body is received; chunked bodies are counted as they arrive
+
+    The 413 is raised from inside the app (on receive), so it goes through
+    the normal exception handling and CORS middleware.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = dict(limits)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = None
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    pass
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            if declared is not None and declared > limit:
+                raise _too_large(limit)
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large(limit):
+    return HTTPException(status_code=413, detail=f"Upload too large (max {limit / (1024 * 1024):.0f}MB)")
+
+
+async def read_upload(upload, max_bytes=None):
+    """
+    Contents of an UploadFile, without copying large uploads into memory.
+
+    Returns bytes for uploads still held in memory, or a read-only mmap of
+    the spooled temp file. Either works with hash_bytes and PIL; pass the
+    result to release_upload when done. Raises 413 over max_bytes.
+    """
+    spooled = upload.file
+    size = upload.size
+    if size is None:
+        spooled.seek(0, os.SEEK_END)
+        size = spooled.tell()
+    if max_bytes and size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{upload.filename or 'Upload'} is too large (max {max_bytes / (1024 * 1024):.0f}MB)"
+        )
+
+    # Rolled over to disk: map the temp file instead of reading it back
+    if size and getattr(spooled, "_rolled", False):
+        return mmap.mmap(spooled.fileno(), 0, access=mmap.ACCESS_READ)
+
+    await upload.seek(0)
+    return await upload.read()
+
+
+def release_upload(contents):
+    """Unmap contents returned by read_upload (no-op for bytes)."""
+    if isinstance(contents, mmap.mmap):
+        try:
+            contents.close()
+        except BufferError:
+            # A cancelled worker thread is still hashing it; unmapped when collected
+            pass
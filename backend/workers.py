@@ -0,0 +1,77 @@
+"""
+Bounded worker pools for DermaVision.
+
+Keeps image decoding and model inference off the asyncio event loop so that
+health checks stay responsive while the model is busy, and caps how many
+requests may be in flight at once.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def default_preprocess_workers() -> int:
+    """Decode/resize is CPU bound and releases the GIL inside PIL."""
+    return min(4, os.cpu_count() or 1)
+
+
+class WorkerPools:
+    """
+    Thread pools plus an in-flight limit for backpressure.
+
+    - preprocess_pool: PIL decode / resize / normalize
+    - inference_pool: model loading and forward passes (TF releases the GIL)
+    - max_in_flight: requests admitted at once; extra requests get a fast 503
+    """
+
+    def __init__(self, preprocess_workers=None, inference_workers=1, max_in_flight=32, retry_after=2):
+        self.preprocess_workers = preprocess_workers or default_preprocess_workers()
+        self.inference_workers = max(1, int(inference_workers))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.retry_after = int(retry_after)
+
+        self.preprocess_pool = ThreadPoolExecutor(
+            max_workers=self.preprocess_workers, thread_name_prefix="preprocess"
+        )
+        self.inference_pool = ThreadPoolExecutor(
+            max_workers=self.inference_workers, thread_name_prefix="inference"
+        )
+
+        self.in_flight = 0
+        self.rejected = 0
+
+    # ---------- Backpressure ----------
+    def try_acquire(self) -> bool:
+        """
+        Admit one request if there is room.
+
+        Only called from the event loop thread, so a plain counter is enough.
+        """
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+
+    # ---------- Execution ----------
+    async def run_preprocess(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.preprocess_pool, fn, *args)
+
+    async def run_inference(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.inference_pool, fn, *args)
+
+    def shutdown(self):
+        self.preprocess_pool.shutdown(wait=False, cancel_futures=True)
+        self.inference_pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "preprocess_workers": self.preprocess_workers,
+            "inference_workers": self.inference_workers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }